@@ -0,0 +1,182 @@
+# app/core/admission.py
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Tuple
+
+from app.core import deadline, metrics, tracing
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Классы приоритета: меньше — важнее. Заголовок `X-Priority`, по умолчанию interactive
+PRIORITIES = {"interactive": 0, "bulk": 1, "prefetch": 2}
+
+# Вес нового замера во времени обслуживания (экспоненциальное сглаживание)
+SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен: очередь полна или ожидание дольше допустимого. `retry_after` — секунды."""
+
+    def __init__(self, reason: str, priority: str, retry_after: int):
+        super().__init__(f"Admission rejected ({reason})")
+        self.reason = reason
+        self.priority = priority
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        # Интерактивным — «сервис перегружен», фоновым клиентам — «сбавьте темп»
+        return 503 if self.priority == "interactive" else 429
+
+
+class _Waiter:
+    __slots__ = ("priority", "name", "future", "bounded")
+
+    def __init__(self, priority: int, name: str, bounded: bool):
+        self.priority = priority
+        self.name = name
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.bounded = bounded
+
+
+class AdmissionController:
+    """
+    Допуск тяжелых извлечений в воркере.
+
+    Одновременно выполняется не больше `max_concurrent` извлечений; `reserved` из них доступны только
+    интерактивным запросам. Остальные ждут в очереди по приоритету (внутри класса — по порядку прихода).
+    Из HTTP в очереди не больше `max_queue` запросов: при переполнении новый запрос вытесняет ожидающий
+    запрос более низкого приоритета либо сразу получает отказ. Отказ следует и тогда, когда оценка
+    ожидания — позиция в очереди, деленная на число слотов, умноженная на сглаженное время извлечения, —
+    превышает `max_wait` или остаток бюджета запроса. `Retry-After` — та же оценка.
+    Внутренние задачи (префетч) ждут без ограничения и не занимают место в очереди.
+    """
+
+    def __init__(self, max_concurrent: int, reserved: int, max_queue: int, max_wait: float, service_time: float,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.max_concurrent = max(1, max_concurrent)
+        self.reserved = max(0, min(reserved, self.max_concurrent - 1))
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.service_time = service_time
+        self._active = 0
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+
+    def _limit(self, priority: int) -> int:
+        return self.max_concurrent if priority == 0 else self.max_concurrent - self.reserved
+
+    def _queued(self, bounded_only: bool = False) -> List[_Waiter]:
+        return [w for _, _, w in self._heap if not w.future.done() and (w.bounded or not bounded_only)]
+
+    def _ahead(self, priority: int) -> int:
+        return sum(1 for w in self._queued() if w.priority <= priority)
+
+    def estimate_wait(self, ahead: int) -> float:
+        """Оценка ожидания позиции `ahead` в очереди по сглаженному времени извлечения."""
+        return (ahead + 1) / self.max_concurrent * self.service_time
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.estimate_wait(len(self._queued()))))
+
+    def _reject(self, reason: str, name: str) -> AdmissionRejected:
+        metrics.ADMISSION_REQUESTS_TOTAL.inc(priority=name, result=reason)
+        return AdmissionRejected(reason, name, self._retry_after())
+
+    def _wake(self) -> None:
+        while self._heap:
+            priority, _, waiter = self._heap[0]
+            if waiter.future.done():
+                heapq.heappop(self._heap)
+                continue
+            if self._active >= self._limit(priority):
+                return
+            heapq.heappop(self._heap)
+            self._active += 1
+            waiter.future.set_result(None)
+
+    async def _acquire(self, name: str, bounded: bool) -> None:
+        priority = PRIORITIES[name]
+        if not self._ahead(priority) and self._active < self._limit(priority):
+            self._active += 1
+            return
+
+        if bounded:
+            left = deadline.remaining()
+            allowed = self.max_wait if left is None else min(self.max_wait, left)
+            if self.estimate_wait(self._ahead(priority)) > allowed:
+                raise self._reject("rejected_estimate", name)
+            queued = self._queued(bounded_only=True)
+            if len(queued) >= self.max_queue:
+                # Вытесняем самого позднего из ожидающих самого низкого приоритета, если он ниже нашего
+                victim = max((entry for entry in self._heap if entry[2] in queued), default=None)
+                if victim is None or victim[2].priority <= priority:
+                    raise self._reject("rejected_full", name)
+                victim[2].future.set_exception(self._reject("evicted", victim[2].name))
+        else:
+            allowed = None
+
+        waiter = _Waiter(priority, name, bounded)
+        heapq.heappush(self._heap, (priority, next(self._sequence), waiter))
+        self._wake()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), allowed)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.exception():
+                return  # слот выдан в момент таймаута
+            waiter.future.cancel()
+            raise self._reject("rejected_timeout", name)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and not waiter.future.exception():
+                self._release()  # слот выдан, но ждавший уже отменен
+            else:
+                waiter.future.cancel()
+            raise
+        finally:
+            metrics.ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, priority=name)
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, name: str = "interactive", bounded: bool = True) -> AsyncIterator[None]:
+        """Слот извлечения на время блока; `AdmissionRejected`, если запрос не допущен."""
+        if not self.enabled:
+            yield
+            return
+        with tracing.span("admission", priority=name):
+            await self._acquire(name, bounded)
+        metrics.ADMISSION_REQUESTS_TOTAL.inc(priority=name, result="admitted")
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+            self._release()
+
+    def stats(self) -> dict:
+        queued = self._queued()
+        return {
+            "enabled": self.enabled,
+            "active": self._active,
+            "max_concurrent": self.max_concurrent,
+            "queued": {name: sum(1 for w in queued if w.name == name) for name in PRIORITIES},
+            "service_time": round(self.service_time, 3),
+            "estimated_wait": round(self.estimate_wait(len(queued)), 3),
+        }
+
+
+admission = AdmissionController(
+    settings.ADMISSION_MAX_CONCURRENT, settings.ADMISSION_RESERVED_INTERACTIVE, settings.ADMISSION_MAX_QUEUE,
+    settings.ADMISSION_MAX_WAIT, settings.ADMISSION_INITIAL_SERVICE_TIME, settings.ADMISSION_ENABLED,
+)
@@ -0,0 +1,287 @@
+# app/core/cache.py
+
+import asyncio
+import hashlib
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Set, Tuple, TypeVar
+
+from app.core import deadline, metrics
+from app.core.cache_backends import ResilientBackend, cache_backend
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+# Не раньше какого момента (time.monotonic) должны истекать записи, прочитанные или загруженные в контексте
+_hold_var: ContextVar[Optional[float]] = ContextVar("cache_hold", default=None)
+
+
+@contextmanager
+def hold_until(moment: float):
+    """Записи кэшей, полученные внутри блока, живут не меньше чем до `moment` (time.time), даже дольше TTL."""
+    token = _hold_var.set(time.monotonic() + (moment - time.time()))
+    try:
+        yield
+    finally:
+        _hold_var.reset(token)
+
+
+class TTLCache(Generic[T]):
+    """LRU-кэш в памяти воркера с временем жизни записей."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def peek(self, key: Hashable) -> Optional[T]:
+        """Значение без обновления порядка LRU (для отчетов)."""
+        item = self._data.get(key)
+        return item[1] if item is not None and item[0] >= time.monotonic() else None
+
+    def hold(self, key: Hashable, expires_at: float) -> None:
+        """Продлевает запись до `expires_at` (time.monotonic), если она истекает раньше."""
+        item = self._data.get(key)
+        if item is not None and item[0] < expires_at:
+            self._data[key] = (expires_at, item[1])
+
+    def set(self, key: Hashable, value: T) -> None:
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Flight:
+    __slots__ = ("task", "deadline", "waiters", "orphan_timer")
+
+    def __init__(self, task: asyncio.Task, shared_deadline: deadline.SharedDeadline):
+        self.task = task
+        self.deadline = shared_deadline
+        self.waiters = 0
+        self.orphan_timer: Optional[asyncio.TimerHandle] = None
+
+
+class CachedLoader(Generic[T]):
+    """
+    Кэш с объединением одновременных загрузок одного ключа (single flight).
+
+    Загрузка выполняется в отдельной задаче, которую ожидающие получают через `asyncio.shield`:
+    отмена одного запроса (дедлайн, отключение клиента) не прерывает загрузку для остальных.
+    Если ожидающих не осталось, загрузка становится «сиротой» и получает `orphan_grace` секунд,
+    чтобы завершиться и заполнить кэш для повторного запроса; затем она отменяется.
+    Бюджет времени загрузки — самый поздний дедлайн ожидающих плюс `orphan_grace`: таймауты и повторы
+    запросов к EVMIAS внутри нее не выходят за него.
+
+    С общим бэкендом (`CACHE_BACKEND` sqlite/redis) промах кэша воркера сначала ищется в бэкенде, а загруженное
+    значение записывается туда в фоне; `restore` восстанавливает значение после JSON (например, общий `Body`).
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, orphan_grace: float,
+                 backend: Optional[ResilientBackend] = None, restore: Optional[Callable[[Any], T]] = None):
+        self.name = name
+        self.cache: TTLCache[T] = TTLCache(maxsize, ttl)
+        self.orphan_grace = orphan_grace
+        self.backend = backend if backend is not None and backend.shared and maxsize > 0 else None
+        self.restore = restore
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._writes: Set[asyncio.Task] = set()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+        value = self.cache.get(key)
+        if value is not None:
+            metrics.CACHE_REQUESTS_TOTAL.inc(cache=self.name, result="hit")
+            self._hold(key)
+            return value
+
+        waiter_deadline = deadline.current()
+        if waiter_deadline is not None:
+            waiter_deadline += self.orphan_grace
+        flight = self._flights.get(key)
+        if flight is None:
+            metrics.CACHE_REQUESTS_TOTAL.inc(cache=self.name, result="miss")
+            shared_deadline = deadline.SharedDeadline(waiter_deadline)
+            task = asyncio.create_task(self._load(key, loader, shared_deadline))
+            flight = self._flights[key] = _Flight(task, shared_deadline)
+        else:
+            metrics.CACHE_REQUESTS_TOTAL.inc(cache=self.name, result="shared")
+            flight.deadline.extend(waiter_deadline)
+            if flight.orphan_timer is not None:
+                # Сироту подхватил новый запрос
+                flight.orphan_timer.cancel()
+                flight.orphan_timer = None
+
+        flight.waiters += 1
+        try:
+            value = await asyncio.shield(flight.task)
+            self._hold(key)
+            return value
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                self._orphan(key, flight)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def _load(
+            self, key: Hashable, loader: Callable[[], Awaitable[Optional[T]]], shared_deadline: deadline.SharedDeadline,
+    ) -> Optional[T]:
+        # Загрузка общая для нескольких запросов: ее ограничивает самый поздний дедлайн ожидающих
+        # (плюс `orphan_grace`), а не дедлайн запроса, который ее начал (задача работает в своей копии контекста)
+        deadline.set_shared_deadline(shared_deadline)
+        try:
+            if self.backend is not None:
+                stored = await self.backend.get(self.name, key)
+                if stored is not None:
+                    metrics.CACHE_REQUESTS_TOTAL.inc(cache=self.name, result="backend_hit")
+                    value = self.restore(stored) if self.restore else stored
+                    self.cache.set(key, value)
+                    return value
+            value = await loader()
+            if value is not None:
+                self.put(key, value)
+            return value
+        finally:
+            flight = self._flights.pop(key, None)
+            if flight is not None and flight.orphan_timer is not None:
+                flight.orphan_timer.cancel()
+                metrics.ORPHAN_TASKS_TOTAL.inc(cache=self.name, result="completed")
+
+    def put(self, key: Hashable, value: T) -> None:
+        """Кладет значение в кэш воркера и (в фоне) в общий бэкенд."""
+        self.cache.set(key, value)
+        if self.backend is None:
+            return
+        # Записи, удерживаемые префетчем, живут в бэкенде до того же момента
+        ttl = self.cache.ttl
+        hold = _hold_var.get()
+        if hold is not None:
+            ttl = max(ttl, hold - time.monotonic())
+        task = asyncio.ensure_future(self.backend.set(self.name, key, value, ttl))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _hold(self, key: Hashable) -> None:
+        expires_at = _hold_var.get()
+        if expires_at is not None:
+            self.cache.hold(key, expires_at)
+
+    def _orphan(self, key: Hashable, flight: _Flight) -> None:
+        def cancel() -> None:
+            flight.orphan_timer = None
+            if not flight.task.done():
+                flight.task.cancel()
+                metrics.ORPHAN_TASKS_TOTAL.inc(cache=self.name, result="cancelled")
+                logger.debug(f"[Cache] {self.name}: orphaned load of {key} cancelled after {self.orphan_grace}s")
+
+        flight.orphan_timer = asyncio.get_running_loop().call_later(max(0.0, self.orphan_grace), cancel)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self.cache), "in_flight": len(self._flights), "backend_writes": len(self._writes)}
+
+
+def content_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Body(str):
+    """Санитизированный протокол, общий для всех документов с тем же содержимым; `digest` — sha256."""
+
+    digest: str
+
+
+class ContentStore:
+    """
+    Хранилище санитизированных протоколов по хэшу содержимого.
+
+    - Одинаковые тела (общие шаблоны, повторные документы за разные даты) хранятся в памяти
+      одним объектом `Body`: хранилище держит слабые ссылки, тело живет, пока на него ссылается кэш.
+    - Результат санитизации запоминается по хэшу исходного HTML, поэтому одинаковый исходник
+      санитизируется один раз.
+    """
+
+    def __init__(self, memo_size: int, ttl: float):
+        self._bodies: "weakref.WeakValueDictionary[str, Body]" = weakref.WeakValueDictionary()
+        self._sanitized: TTLCache[Body] = TTLCache(memo_size, ttl)
+
+    def intern(self, text: str) -> Body:
+        digest = content_digest(text)
+        body = self._bodies.get(digest)
+        if body is None:
+            body = Body(text)
+            body.digest = digest
+            self._bodies[digest] = body
+        return body
+
+    def get(self, digest: str) -> Optional[Body]:
+        return self._bodies.get(digest)
+
+    async def sanitize(self, raw: str, sanitizer: Callable[[str], Awaitable[str]]) -> Optional[Body]:
+        """Санитизирует `raw` через `sanitizer` или возвращает уже готовый результат для того же исходника."""
+        # Санитайзеры модальностей сейчас одинаковы, но ключ учитывает модуль на случай расхождения
+        memo_key = (sanitizer.__module__, content_digest(raw))
+        body = self._sanitized.get(memo_key)
+        if body is not None:
+            metrics.CACHE_REQUESTS_TOTAL.inc(cache="sanitized", result="hit")
+            return body
+        metrics.CACHE_REQUESTS_TOTAL.inc(cache="sanitized", result="miss")
+        html = await sanitizer(raw)
+        if not html:
+            return None
+        body = self.intern(html)
+        self._sanitized.set(memo_key, body)
+        return body
+
+    def clear(self) -> None:
+        """Забывает результаты санитизации и тела (бенчмарки холодного прохода)."""
+        self._sanitized.clear()
+        self._bodies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        bodies = list(self._bodies.values())
+        return {"bodies": len(bodies), "bytes": sum(len(b) for b in bodies), "sanitized_memo": len(self._sanitized)}
+
+
+# При записи обменов (RECORD_DIR) кэши выключены: ФИО из протокола вычищаются только после поиска пациента
+_document_cache_size = 0 if settings.RECORD_DIR else settings.DOCUMENT_CACHE_SIZE
+_patient_cache_size = 0 if settings.RECORD_DIR else settings.PATIENT_CACHE_SIZE
+
+document_bodies = ContentStore(settings.DOCUMENT_CACHE_SIZE, settings.DOCUMENT_CACHE_TTL)
+
+# Санитизированные протоколы по EvnXml_id (общие для всех модальностей); значения — общие `Body`
+document_cache: CachedLoader[Body] = CachedLoader(
+    "documents", _document_cache_size, settings.DOCUMENT_CACHE_TTL, settings.DOCUMENT_CACHE_ORPHAN_GRACE,
+    backend=cache_backend, restore=document_bodies.intern,
+)
+
+# Результаты поиска исследований пациента по модальностям (ответ Search.searchData).
+# TTL короткий: новые исследования должны появляться быстро; префетч продлевает записи до приема
+patient_cache: CachedLoader[dict] = CachedLoader(
+    "patients", _patient_cache_size, settings.PATIENT_CACHE_TTL, settings.DOCUMENT_CACHE_ORPHAN_GRACE,
+    backend=cache_backend,
+)
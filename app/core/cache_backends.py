@@ -0,0 +1,395 @@
+# app/core/cache_backends.py
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.logger import logger
+
+try:
+    import orjson
+except ImportError:  # orjson указан в requirements; без него — стандартный json
+    orjson = None
+
+settings = get_settings()
+
+# Формат значения: первый байт — признак сжатия, дальше JSON
+_PLAIN, _ZLIB = b"j", b"z"
+
+
+def encode(value: Any) -> bytes:
+    """JSON-значение в байты для бэкенда; большие значения (HTML протоколов) сжимаются zlib."""
+    data = orjson.dumps(value) if orjson is not None else json.dumps(value, ensure_ascii=False).encode("utf-8")
+    if len(data) >= settings.CACHE_COMPRESS_MIN_BYTES:
+        return _ZLIB + zlib.compress(data, 6)
+    return _PLAIN + data
+
+
+def decode(data: bytes) -> Any:
+    payload = zlib.decompress(data[1:]) if data[:1] == _ZLIB else data[1:]
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+
+def backend_key(namespace: str, key: Hashable) -> str:
+    """
+    Ключ в бэкенде. Составные ключи (ФИО и дата рождения пациента) хэшируются:
+    персональные данные не попадают в имена ключей общего хранилища.
+    """
+    if not isinstance(key, str):
+        key = hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{settings.CACHE_KEY_PREFIX}{namespace}:{key}"
+
+
+class BackendUnavailable(Exception):
+    """Бэкенд кэша недоступен (сеть, файл, таймаут)."""
+
+
+class CacheBackend:
+    """
+    Хранилище кэша уровня хоста или кластера: байты по ключу со временем жизни.
+
+    `shared=False` — хранилище только этого процесса: загрузчики кэшей (`CachedLoader`) его не используют,
+    им хватает собственного кэша в памяти воркера.
+    """
+
+    name = "base"
+    shared = True
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def describe(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """LRU со временем жизни в памяти процесса (по умолчанию: кэши не разделяются между воркерами)."""
+
+    name = "memory"
+    shared = False
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item[1]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"keys": len(self._data), "bytes": sum(len(v) for _, v in self._data.values())}
+
+
+class SqliteBackend(CacheBackend):
+    """
+    Кэш на локальном диске (SQLite, WAL): общий для воркеров хоста и переживает перезапуск.
+    Запросы выполняются в пуле потоков; время жизни — по часам хоста (time.time).
+    """
+
+    name = "sqlite"
+
+    # Раз в столько записей удаляются истекшие строки
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=settings.CACHE_BACKEND_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, time.time() + ttl),
+                )
+                self._writes += 1
+                if self._writes % self.PURGE_EVERY == 0:
+                    conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {"path": self.path}
+
+
+class RedisError(Exception):
+    """Ответ Redis с ошибкой (`-ERR ...`)."""
+
+
+class RedisBackend(CacheBackend):
+    """
+    Сетевое хранилище по протоколу Redis (RESP): общий кэш для всех хостов за балансировщиком.
+    Минимальный клиент на asyncio streams — GET, SET с PX, DEL, AUTH, SELECT — с небольшим пулом соединений.
+    URL: `redis://[:password@]host:port/db`.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, pool_size: int):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.pool_size = pool_size
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @staticmethod
+    def _pack(*args: Any) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _read(self, reader: asyncio.StreamReader) -> Any:
+        line = await reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by Redis")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            return (await reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [await self._read(reader) for _ in range(size)]
+        raise ConnectionError(f"Unexpected Redis reply: {line[:40]!r}")
+
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        commands = []
+        if self.password:
+            commands.append(("AUTH", self.password))
+        if self.db:
+            commands.append(("SELECT", self.db))
+        try:
+            for command in commands:
+                writer.write(self._pack(*command))
+                await writer.drain()
+                await self._read(reader)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _execute(self, *args: Any) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._slots:
+            reader, writer = self._idle.pop() if self._idle else await self._open()
+            try:
+                writer.write(self._pack(*args))
+                await writer.drain()
+                reply = await self._read(reader)
+            except RedisError:
+                self._idle.append((reader, writer))
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                # Сервер перезапущен или недоступен: остальные простаивающие соединения, скорее всего, тоже мертвы
+                writer.close()
+                await self.close()
+                raise
+            except BaseException:
+                # Соединение в неизвестном состоянии (обрыв, таймаут, отмена) — не возвращаем в пул
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+            return reply
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._execute("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._execute("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self._execute("DEL", key)
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    def describe(self) -> Dict[str, Any]:
+        return {"host": self.host, "port": self.port, "db": self.db, "idle_connections": len(self._idle)}
+
+
+class ResilientBackend:
+    """
+    Обертка бэкенда для кэшей: сериализация, таймаут операций и отказоустойчивость.
+    Ошибка или таймаут бэкенда не ломают запрос: чтение считается промахом, запись пропускается,
+    а бэкенд на `CACHE_BACKEND_RETRY` секунд выводится из работы (кэши воркера продолжают работать).
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def shared(self) -> bool:
+        return self.backend.shared
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    async def _call(self, op: str, coro) -> Any:
+        if not self.available:
+            coro.close()
+            raise BackendUnavailable(self.last_error)
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(coro, settings.CACHE_BACKEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.CACHE_BACKEND_ERRORS_TOTAL.inc(backend=self.backend.name, op=op)
+            self.last_error = f"{type(e).__name__}: {e}"
+            if self.available:
+                # Одновременные операции падают вместе — пишем в лог только первую
+                logger.warning(
+                    f"[CacheBackend] {self.backend.name} {op} failed ({self.last_error}); "
+                    f"falling back to worker caches for {settings.CACHE_BACKEND_RETRY:.0f}s"
+                )
+            self.down_until = time.monotonic() + settings.CACHE_BACKEND_RETRY
+            raise BackendUnavailable(self.last_error) from e
+        finally:
+            metrics.CACHE_BACKEND_SECONDS.observe(time.perf_counter() - start, backend=self.backend.name, op=op)
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        """Значение из бэкенда или None (нет ключа, бэкенд недоступен, запись повреждена)."""
+        try:
+            data = await self._call("get", self.backend.get(backend_key(namespace, key)))
+        except BackendUnavailable:
+            return None
+        if data is None:
+            return None
+        try:
+            return decode(data)
+        except (ValueError, zlib.error) as e:
+            logger.warning(f"[CacheBackend] Corrupted entry {namespace}:{key}: {e}")
+            return None
+
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> bool:
+        if ttl <= 0:
+            return False
+        try:
+            await self._call("set", self.backend.set(backend_key(namespace, key), encode(value), ttl))
+            return True
+        except BackendUnavailable:
+            return False
+
+    async def delete(self, namespace: str, key: Hashable) -> None:
+        try:
+            await self._call("delete", self.backend.delete(backend_key(namespace, key)))
+        except BackendUnavailable:
+            pass
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "shared": self.backend.shared,
+            "available": self.available,
+            "last_error": self.last_error,
+            **self.backend.describe(),
+        }
+
+
+def create_backend(kind: str) -> CacheBackend:
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SqliteBackend(settings.CACHE_SQLITE_PATH)
+    if kind == "redis":
+        return RedisBackend(settings.CACHE_REDIS_URL, settings.CACHE_REDIS_POOL_SIZE)
+    raise ValueError(f"Unknown CACHE_BACKEND: {kind!r} (expected memory, sqlite or redis)")
+
+
+# При записи обменов (RECORD_DIR) общий бэкенд выключен: см. `app.core.recorder.Recorder`
+cache_backend = ResilientBackend(create_backend("memory" if settings.RECORD_DIR else settings.CACHE_BACKEND))
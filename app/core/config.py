@@ -1,5 +1,7 @@
+from pydantic import ValidationInfo, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -28,6 +30,170 @@ class Settings(BaseSettings):
     EVMIAS_PERMUTATION: str
     COOKIES_FILE: str
 
+    # Дополнительные учетные записи EVMIAS для пула сессий (JSON: {"login": "password"}). Серверные лимиты
+    # действуют на сессию, поэтому запросы распределяются по сессиям всех учетных записей по нагрузке.
+    # Куки дополнительной записи хранятся рядом с COOKIES_FILE: cookies.<login>.json
+    EVMIAS_ACCOUNTS: Dict[str, str] = {}
+    # Проверять сессию перед использованием не чаще раза в столько секунд (0 — перед каждым использованием);
+    # простаивающие сессии проверяются фоном раз в EVMIAS_SESSION_KEEPALIVE секунд (0 — не проверять)
+    EVMIAS_SESSION_CHECK_INTERVAL: float = 0.0
+    EVMIAS_SESSION_KEEPALIVE: float = 300.0
+    # Сессия, получившая 429, уступает другим EVMIAS_SESSION_COOLDOWN секунд; после EVMIAS_SESSION_MAX_ERRORS
+    # ошибок подряд (или страницы входа вместо ответа) сессия выводится из ротации и переавторизуется
+    EVMIAS_SESSION_COOLDOWN: float = 5.0
+    EVMIAS_SESSION_MAX_ERRORS: int = 3
+
+    # Метрики: каталог для снимков воркеров (пустая строка — только текущий процесс)
+    METRICS_DIR: str = "/tmp/medextractor-metrics"
+    METRICS_FLUSH_INTERVAL: float = 5.0
+
+    # Трейсинг: трейсы сохраняются по заголовку `X-Debug-Trace: 1` или если запрос медленнее порога (0 — выключено)
+    TRACE_DIR: str = "logs/traces"
+    TRACE_SLOW_THRESHOLD: float = 0.0
+
+    # Скользящая статистика дашборда: окно = STATS_BUCKETS корзин по STATS_BUCKET_SECONDS секунд
+    STATS_BUCKET_SECONDS: int = 5
+    STATS_BUCKETS: int = 60
+
+    # Монитор event loop: период пульса и порог, после которого снимается стек блокирующего кода
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.05
+    LOOP_BLOCK_THRESHOLD: float = 0.1
+
+    # Бюджет времени /api/complex/person, секунды; клиент может задать свой заголовком `X-Time-Budget`
+    # (не больше COMPLEX_TIME_BUDGET_MAX). По истечении возвращается то, что успело загрузиться
+    COMPLEX_TIME_BUDGET: float = 25.0
+    COMPLEX_TIME_BUDGET_MAX: float = 60.0
+
+    # Лимит запросов к EVMIAS на хост (общий для всех воркеров, состояние в RATE_LIMIT_FILE):
+    # запросов в секунду и запас на всплеск по корзинам search / document / auth (только вход) / session
+    # (проверка сессии и прочие служебные вызовы); 0 — без лимита. Не заданные в переопределении корзины
+    # берутся по умолчанию. Без токена запрос ждет до RATE_LIMIT_MAX_WAIT секунд, затем отклоняется
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_FILE: str = "/tmp/medextractor-ratelimit.bin"
+    RATE_LIMIT_RPS: Dict[str, float] = {"search": 20.0, "document": 100.0, "auth": 2.0, "session": 20.0}
+    RATE_LIMIT_BURST: Dict[str, float] = {"search": 40.0, "document": 200.0, "auth": 5.0, "session": 40.0}
+    RATE_LIMIT_MAX_WAIT: float = 2.0
+
+    # Хеджирование загрузки протоколов: дубликат запроса, если ответа нет дольше перцентиля HEDGE_PERCENTILE
+    # последних HEDGE_WINDOW латентностей; дубликатов — не больше HEDGE_BUDGET_RATIO от числа запросов
+    HEDGE_ENABLED: bool = True
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_BUDGET_RATIO: float = 0.05
+    HEDGE_BUDGET_BURST: float = 10.0
+    HEDGE_MIN_SAMPLES: int = 50
+    HEDGE_MIN_DELAY: float = 0.05
+    HEDGE_WINDOW: int = 500
+
+    # Общее хранилище кэшей протоколов, поисков и сессий EVMIAS поверх кэшей воркера:
+    # memory — только воркер, sqlite — диск хоста (CACHE_SQLITE_PATH), redis — сеть (CACHE_REDIS_URL).
+    # Значения от CACHE_COMPRESS_MIN_BYTES байт сжимаются; операция дольше CACHE_BACKEND_TIMEOUT или ошибка
+    # выключает хранилище на CACHE_BACKEND_RETRY секунд — запросы обслуживаются кэшами воркера и EVMIAS
+    CACHE_BACKEND: str = "memory"
+    CACHE_SQLITE_PATH: str = "/tmp/medextractor-cache.sqlite3"
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_REDIS_POOL_SIZE: int = 8
+    CACHE_KEY_PREFIX: str = "medextractor:v1:"
+    CACHE_COMPRESS_MIN_BYTES: int = 1024
+    CACHE_BACKEND_TIMEOUT: float = 1.0
+    CACHE_BACKEND_RETRY: float = 30.0
+    CACHE_SESSION_TTL: float = 43200.0
+
+    # Кэш санитизированных протоколов по EvnXml_id (DOCUMENT_CACHE_SIZE=0 — выключен).
+    # Загрузка, которую больше никто не ждет, получает DOCUMENT_CACHE_ORPHAN_GRACE секунд, чтобы заполнить кэш
+    DOCUMENT_CACHE_SIZE: int = 2000
+    DOCUMENT_CACHE_TTL: float = 600.0
+    DOCUMENT_CACHE_ORPHAN_GRACE: float = 10.0
+
+    # Кэш результатов поиска исследований пациента (PATIENT_CACHE_SIZE=0 — выключен)
+    PATIENT_CACHE_SIZE: int = 2000
+    PATIENT_CACHE_TTL: float = 300.0
+
+    # Префетч карточек пациентов к приему: план (JSON или CSV, общий для всех воркеров), окна низкой нагрузки
+    # "ЧЧ:ММ-ЧЧ:ММ" по локальному времени (пусто — в любое время), за сколько часов до приема начинать
+    # и сколько держать записи в кэше после него. Фоновые запросы берут токены лимита EVMIAS, только
+    # пока в корзине остается PREFETCH_RESERVE ее емкости, — запросы врачей идут первыми
+    PREFETCH_ENABLED: bool = False
+    PREFETCH_PLAN_FILE: str = "logs/prefetch-plan.json"
+    PREFETCH_WINDOWS: List[str] = ["05:00-07:30"]
+    PREFETCH_LEAD_HOURS: float = 12.0
+    PREFETCH_HOLD_HOURS: float = 4.0
+    PREFETCH_CONCURRENCY: int = 2
+    PREFETCH_INTERVAL: float = 60.0
+    PREFETCH_MAX_ATTEMPTS: int = 3
+    PREFETCH_RESERVE: float = 0.5
+
+    # Наблюдение за новыми результатами пациентов: проверка поиском (без загрузки известных протоколов)
+    # с интервалом от WATCHLIST_MIN_INTERVAL до WATCHLIST_MAX_INTERVAL (растет в WATCHLIST_BACKOFF раз
+    # без изменений). Опрашивает один воркер хоста; события — в общем файле, для SSE в любом воркере
+    WATCHLIST_ENABLED: bool = True
+    WATCHLIST_FILE: str = "logs/watchlist.json"
+    WATCHLIST_EVENTS_FILE: str = "logs/watchlist-events.jsonl"
+    WATCHLIST_EVENTS_MAX_BYTES: int = 5_000_000
+    WATCHLIST_MIN_INTERVAL: float = 60.0
+    WATCHLIST_MAX_INTERVAL: float = 900.0
+    WATCHLIST_BACKOFF: float = 1.5
+    WATCHLIST_CONCURRENCY: int = 4
+    WATCHLIST_TICK: float = 5.0
+    WATCHLIST_DEFAULT_HOURS: float = 72.0
+    WATCHLIST_WEBHOOK_HOSTS: List[str] = ["127.0.0.1", "localhost"]
+
+    # Индекс лабораторных значений для трендов (/api/analytes): протоколы medtest, загруженные запросами,
+    # префетчем, выгрузкой или наблюдением, разбираются в фоне в SQLite-файл, общий для воркеров хоста.
+    # Пациенты в индексе — HMAC(ANALYTE_INDEX_SECRET) от ФИО и даты рождения; без секрета индекс не включается
+    ANALYTE_INDEX_ENABLED: bool = False
+    ANALYTE_INDEX_PATH: str = "logs/analytes.sqlite3"
+    ANALYTE_INDEX_SECRET: str = ""
+
+    # Допуск /api/complex/person в воркере: не больше ADMISSION_MAX_CONCURRENT извлечений (из них
+    # ADMISSION_RESERVED_INTERACTIVE — только для интерактивных), очередь до ADMISSION_MAX_QUEUE запросов
+    # и ожидание не дольше ADMISSION_MAX_WAIT секунд; иначе быстрый 503/429 с Retry-After
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 8
+    ADMISSION_RESERVED_INTERACTIVE: int = 2
+    ADMISSION_MAX_QUEUE: int = 16
+    ADMISSION_MAX_WAIT: float = 5.0
+    ADMISSION_INITIAL_SERVICE_TIME: float = 2.0
+
+    # Прогрев воркера после старта: сессия EVMIAS, WARMUP_CONNECTIONS соединений пула, санитайзер и
+    # (WARMUP_PRIME_CACHES) префетч по плану не дольше WARMUP_PRIME_TIMEOUT. До конца прогрева
+    # /api/health/ready отвечает 503; без сессии прогрев повторяется каждые WARMUP_RETRY_INTERVAL секунд
+    WARMUP_ENABLED: bool = True
+    WARMUP_CONNECTIONS: int = 4
+    WARMUP_PRIME_CACHES: bool = False
+    WARMUP_PRIME_TIMEOUT: float = 60.0
+    WARMUP_RETRY_INTERVAL: float = 10.0
+
+    # Период проверки отключения клиента во время долгих запросов, секунды
+    DISCONNECT_POLL_INTERVAL: float = 0.5
+
+    # Администрирование: токен для заголовка `X-Admin-Token` (не задан — админ-эндпоинты выключены)
+    ADMIN_TOKEN: Optional[str] = None
+
+    # Профилирование по запросу администратора
+    PROFILE_DIR: str = "logs/profiles"
+    PROFILE_SAMPLE_INTERVAL: float = 0.005
+    PROFILE_MAX_DURATION: float = 120.0
+
+    # Запись обменов с EVMIAS для воспроизведения (не задан — запись выключена).
+    # Поля из списка заменяются псевдонимами HMAC(RECORD_SALT); без соли запись не запускается
+    RECORD_DIR: Optional[str] = None
+    RECORD_REDACT_FIELDS: List[str] = [
+        "Person_Surname", "Person_Firname", "Person_Secname", "Person_Birthday", "Person_Fio",
+        "Person_Snils", "Person_Phone", "Person_Address", "Polis_Num", "login", "psw",
+    ]
+    RECORD_SALT: str = ""
+
+    # Воспроизведение записи вместо EVMIAS: каталог записи и множитель записанных задержек (0 — без задержек)
+    REPLAY_DIR: Optional[str] = None
+    REPLAY_TIMING_SCALE: float = 1.0
+
+    @field_validator("RATE_LIMIT_RPS", "RATE_LIMIT_BURST")
+    @classmethod
+    def _fill_rate_limit_buckets(cls, value: Dict[str, float], info: ValidationInfo) -> Dict[str, float]:
+        # Частичное переопределение (RATE_LIMIT_BURST='{"search": 10}') не оставляет корзины без лимита
+        return {**cls.model_fields[info.field_name].default, **value}
+
     model_config = SettingsConfigDict(
         env_file=".env",  # Автоматически загружает переменные из .env
         env_file_encoding="utf-8"  # Поддержка UTF-8
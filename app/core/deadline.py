@@ -0,0 +1,108 @@
+# app/core/deadline.py
+
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, List, Optional, Tuple, Union
+
+from app.core import metrics
+
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени запроса исчерпан до начала операции."""
+
+
+class SharedDeadline:
+    """
+    Дедлайн операции, которую ждут несколько запросов (общая загрузка кэша): самый поздний
+    из их дедлайнов. Запрос без дедлайна снимает ограничение совсем.
+    """
+
+    def __init__(self, moment: Optional[float]):
+        self.moment = moment
+
+    def extend(self, moment: Optional[float]) -> None:
+        if self.moment is not None:
+            self.moment = None if moment is None else max(self.moment, moment)
+
+
+# Момент (time.monotonic), к которому запрос должен быть завершен; None — без ограничения
+_deadline_var: ContextVar[Union[float, SharedDeadline, None]] = ContextVar("deadline", default=None)
+
+
+def set_deadline(budget: float) -> None:
+    """Задает бюджет времени текущему запросу; дочерние задачи наследуют его через contextvars."""
+    _deadline_var.set(time.monotonic() + budget)
+
+
+def set_shared_deadline(shared: SharedDeadline) -> None:
+    """Текущая задача работает до дедлайна `shared`, который ожидающие могут продлевать."""
+    _deadline_var.set(shared)
+
+
+def clear_deadline() -> None:
+    _deadline_var.set(None)
+
+
+def current() -> Optional[float]:
+    """Дедлайн текущего запроса (time.monotonic) или None без дедлайна."""
+    deadline = _deadline_var.get()
+    return deadline.moment if isinstance(deadline, SharedDeadline) else deadline
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна (может быть отрицательным) или None без дедлайна."""
+    deadline = current()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout_for(default: float) -> float:
+    """Таймаут операции: не больше `default` и не дольше оставшегося бюджета."""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Request time budget exhausted")
+    return min(default, left)
+
+
+async def gather_within_deadline(*aws: Awaitable, stage: str, grace: float = 0.0) -> Tuple[List[Any], bool]:
+    """
+    Как `asyncio.gather(..., return_exceptions=True)`, но не дольше дедлайна (+ `grace`).
+    Незавершенные к дедлайну задачи отменяются, вместо их результатов — None.
+    Возвращает результаты и признак неполноты. При отмене вызывающей задачи отменяет все дочерние.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return [], False
+    left = remaining()
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=None if left is None else max(0.0, left + grace))
+    except asyncio.CancelledError:
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            metrics.CANCELLED_TASKS_TOTAL.inc(len(unfinished), reason="cancelled", stage=stage)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    for task in pending:
+        task.cancel()
+    if pending:
+        metrics.CANCELLED_TASKS_TOTAL.inc(len(pending), reason="deadline", stage=stage)
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for task in tasks:
+        if task in pending or task.cancelled():
+            results.append(None)
+        else:
+            results.append(task.exception() or task.result())
+    return results, bool(pending)
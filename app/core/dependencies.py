@@ -1,18 +1,114 @@
-from typing import Dict, Any
-from fastapi import HTTPException, status
+import secrets
+from typing import AsyncIterator, Dict, Any, Optional
+from fastapi import Header, HTTPException, Response, status
 from app.services.cookies.manager import cookie_manager
+from app.core import deadline, tracing
+from app.core.admission import PRIORITIES, AdmissionRejected, admission
+from app.core.config import get_settings
 from app.core.logger import logger
+from app.core.profiling import RequestProfile
+from app.core.ratelimit import RateLimitExceeded
 
-async def get_valid_cookies_dependency() -> Dict[str, Any]:
+settings = get_settings()
+
+async def get_valid_cookies_dependency() -> AsyncIterator[Dict[str, Any]]:
     """
     Зависимость FastAPI для получения валидных cookies.
-    Автоматически обрабатывает ошибки и кэширование.
+    Автоматически обрабатывает ошибки и кэширование. Сессия из пула считается занятой до конца запроса.
     """
-    cookies = await cookie_manager.get_valid_cookies()
-    if not cookies:
+    try:
+        with tracing.span("cookies"):
+            session = await cookie_manager.acquire()
+    except RateLimitExceeded:
+        # Проверка сессии не получила токен лимита EVMIAS: куки не признаются невалидными, запрос — повторить позже
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="EVMIAS rate limit exceeded. Please try again later.",
+            headers={"Retry-After": "1"},
+        )
+    if session is None:
         logger.critical("Could not authenticate with the external service. No cookies available.")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Could not authenticate with the external service. Please try again later.",
         )
-    return cookies
\ No newline at end of file
+    try:
+        yield session.cookies
+    finally:
+        cookie_manager.release(session)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(settings.ADMIN_TOKEN) and token is not None and secrets.compare_digest(token, settings.ADMIN_TOKEN)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Зависимость FastAPI для административных эндпоинтов.
+    Без настроенного `ADMIN_TOKEN` административные эндпоинты недоступны.
+    """
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+
+
+async def profile_request_dependency(
+        response: Response,
+        x_profile: Optional[str] = Header(None),
+        x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Профилирует текущий запрос по заголовку `X-Profile: 1` (только для администратора).
+    Id профиля возвращается в заголовке `X-Profile-Id`, файл — через `/api/admin/profiles/{id}`.
+    """
+    if not x_profile:
+        yield
+        return
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required for profiling")
+
+    profile = RequestProfile()
+    response.headers["X-Profile-Id"] = profile.profile_id
+    profile.start()
+    try:
+        yield
+    finally:
+        profile.stop()
+
+
+async def time_budget_dependency(x_time_budget: Optional[float] = Header(None)):
+    """
+    Задает бюджет времени запроса: `COMPLEX_TIME_BUDGET` или заголовок `X-Time-Budget` (секунды,
+    не больше `COMPLEX_TIME_BUDGET_MAX`). Дедлайн действует на куки, пайплайны и все запросы к EVMIAS.
+    """
+    budget = settings.COMPLEX_TIME_BUDGET if x_time_budget is None else x_time_budget
+    if budget <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="X-Time-Budget must be positive")
+    deadline.set_deadline(min(budget, settings.COMPLEX_TIME_BUDGET_MAX))
+    try:
+        yield
+    finally:
+        deadline.clear_deadline()
+
+
+async def admission_dependency(x_priority: Optional[str] = Header(None)):
+    """
+    Допуск тяжелого запроса по классу `X-Priority` (interactive — по умолчанию, bulk, prefetch).
+    Если слота не дождаться в пределах `ADMISSION_MAX_WAIT` и бюджета запроса — сразу 503 (interactive)
+    или 429 (остальные) с `Retry-After`, вместо долгого ожидания в очереди.
+    """
+    priority = (x_priority or "interactive").lower()
+    if priority not in PRIORITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"X-Priority must be one of: {', '.join(PRIORITIES)}",
+        )
+    try:
+        async with admission.slot(priority):
+            yield
+    except AdmissionRejected as e:
+        logger.warning(f"[Admission] {priority} request rejected: {e.reason}, retry after {e.retry_after}s")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Server is busy ({e.reason}), retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
@@ -0,0 +1,52 @@
+# app/core/disconnect.py
+
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import Request
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+# Нестандартный статус nginx «клиент закрыл запрос»: ответ все равно никто не получит
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """Клиент отключился, не дождавшись ответа; работа запроса отменена."""
+
+
+async def _wait_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(settings.DISCONNECT_POLL_INTERVAL)
+
+
+async def cancel_on_disconnect(request: Request, aw: Awaitable[T]) -> T:
+    """
+    Выполняет `aw`, пока клиент подключен. При отключении отменяет задачу вместе со всеми
+    порожденными ею задачами (их отменяет `deadline.gather_within_deadline`) и выбрасывает
+    `ClientDisconnected`. Загрузки документов, которые уже идут, доживают в кэше (`app.core.cache`).
+    """
+    work = asyncio.ensure_future(aw)
+    watcher = asyncio.create_task(_wait_disconnect(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if not work.done():
+        work.cancel()
+        await asyncio.gather(work, return_exceptions=True)
+        path = request.url.path
+        metrics.CLIENT_DISCONNECTS_TOTAL.inc(path=path)
+        logger.info(f"Client disconnected from {path}, request work cancelled")
+        raise ClientDisconnected(path)
+    return work.result()
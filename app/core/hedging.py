@@ -0,0 +1,121 @@
+# app/core/hedging.py
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from app.core import metrics
+from app.core.config import get_settings
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+# Как часто пересчитывать порог (число новых наблюдений латентности)
+THRESHOLD_REFRESH_EVERY = 20
+
+
+class _Latencies:
+    __slots__ = ("values", "threshold", "since_refresh")
+
+    def __init__(self, size: int):
+        self.values: Deque[float] = deque(maxlen=size)
+        self.threshold: Optional[float] = None
+        self.since_refresh = 0
+
+
+class Hedger:
+    """
+    Хеджирование идемпотентных запросов к EVMIAS.
+
+    Если запрос не завершился за адаптивный порог — перцентиль `percentile` недавних
+    латентностей этого метода, — отправляется дубликат; побеждает ответ, пришедший первым,
+    проигравший запрос отменяется. Бюджет: каждый запрос добавляет `budget_ratio` токена,
+    каждый дубликат тратит один, так что дополнительная нагрузка на EVMIAS не превышает
+    `budget_ratio` от числа запросов (с запасом `budget_burst` на всплески).
+    """
+
+    def __init__(self, percentile: float, budget_ratio: float, budget_burst: float,
+                 min_samples: int, min_delay: float, window: int):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self._latencies: Dict[str, _Latencies] = {}
+        self._tokens = budget_burst
+
+    def observe(self, method: str, seconds: float) -> None:
+        """Латентность успешно завершившейся попытки — основа порога."""
+        latencies = self._latencies.get(method)
+        if latencies is None:
+            latencies = self._latencies[method] = _Latencies(self.window)
+        latencies.values.append(seconds)
+        latencies.since_refresh += 1
+        if latencies.threshold is None or latencies.since_refresh >= THRESHOLD_REFRESH_EVERY:
+            latencies.since_refresh = 0
+            if len(latencies.values) >= self.min_samples:
+                ordered = sorted(latencies.values)
+                index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+                latencies.threshold = max(self.min_delay, ordered[index])
+
+    def threshold(self, method: str) -> Optional[float]:
+        latencies = self._latencies.get(method)
+        return latencies.threshold if latencies is not None else None
+
+    def _try_spend(self) -> bool:
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def run(self, method: str, attempt: Callable[[bool], Awaitable[T]]) -> T:
+        """
+        Выполняет `attempt(is_hedge)` с хеджированием. Ошибка одного из запросов не прерывает
+        другой; исключение выбрасывается, только если не удались оба.
+        """
+        self._tokens = min(self.budget_burst, self._tokens + self.budget_ratio)
+        delay = self.threshold(method)
+        primary = asyncio.ensure_future(attempt(False))
+        hedge: Optional[asyncio.Future] = None
+        try:
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            if not self._try_spend():
+                metrics.HEDGED_REQUESTS_TOTAL.inc(method=method, result="over_budget")
+                return await primary
+
+            metrics.HEDGED_REQUESTS_TOTAL.inc(method=method, result="sent")
+            hedge = asyncio.ensure_future(attempt(True))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "hedge_won" if task is hedge else "primary_won"
+                        metrics.HEDGED_REQUESTS_TOTAL.inc(method=method, result=winner)
+                        return task.result()
+            metrics.HEDGED_REQUESTS_TOTAL.inc(method=method, result="both_failed")
+            return primary.result()
+        finally:
+            # Проигравший запрос (или оба при отмене вызывающего) отменяется
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "tokens": round(self._tokens, 2),
+            "thresholds": {method: l.threshold for method, l in sorted(self._latencies.items())},
+        }
+
+
+hedger = Hedger(
+    settings.HEDGE_PERCENTILE, settings.HEDGE_BUDGET_RATIO, settings.HEDGE_BUDGET_BURST,
+    settings.HEDGE_MIN_SAMPLES, settings.HEDGE_MIN_DELAY, settings.HEDGE_WINDOW,
+)
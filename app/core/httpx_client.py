@@ -1,22 +1,119 @@
 # app/core/httpx_client.py
 
+import asyncio
 import json
+import time
 import httpx
 from typing import Optional, Dict, Any
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import (
+    retry, retry_if_exception_type, retry_if_not_exception_type, stop_after_attempt, wait_exponential, RetryCallState,
+)
+from app.core import deadline, metrics, tracing
+from app.core.config import get_settings
+from app.core.hedging import hedger
 from app.core.logger import logger
+from app.core.ratelimit import RateLimitExceeded, bucket_for, is_background, rate_limiter
+from app.core.recorder import recorder
+
+try:
+    import orjson
+except ImportError:  # orjson указан в requirements; без него — стандартный json
+    orjson = None
+
+settings = get_settings()
+
+
+def loads(content: bytes) -> Any:
+    """Разбирает JSON прямо из байтов ответа, без промежуточной строки (orjson, если установлен)."""
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+def _parse_json(response: httpx.Response) -> Any:
+    """JSON из ответа EVMIAS (`application/json` или JSON с типом `text/html`); None — не JSON."""
+    content_type = response.headers.get("Content-Type", "")
+    if "application/json" not in content_type and "text/html" not in content_type:
+        return None
+    try:
+        return loads(response.content)
+    except ValueError:
+        pass
+    # Байты не в UTF-8: декодируем по кодировке из заголовка
+    if (response.charset_encoding or "utf-8").lower().replace("_", "-") in ("utf-8", "utf8"):
+        return None
+    try:
+        return json.loads(response.text)
+    except ValueError:
+        return None
+
+
+def upstream_method(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Возвращает имя метода EVMIAS для меток (например, `EvnXml.doLoadData`)."""
+    params = params or {}
+    if "c" in params and "m" in params:
+        name = f"{params['c']}.{params['m']}"
+        return f"{name}.{params['method']}" if "method" in params else name
+    return url.rstrip("/").rsplit("/", 1)[-1] or "root"
+
+
+def _before_sleep(retry_state: RetryCallState) -> None:
+    url = retry_state.kwargs.get("url", retry_state.args[1] if len(retry_state.args) > 1 else "")
+    metrics.UPSTREAM_RETRIES_TOTAL.inc(method=upstream_method(url, retry_state.kwargs.get("params")))
+    logger.warning(
+        f"[HTTPXClient] Retrying request {retry_state.attempt_number} for {url} ({retry_state.outcome.exception()})"
+    )
+
+
+def _stop_at_deadline(retry_state: RetryCallState) -> bool:
+    """Не повторять запрос, если пауза перед повтором не укладывается в бюджет времени запроса."""
+    left = deadline.remaining()
+    return left is not None and left <= (retry_state.upcoming_sleep or 0)
+
+
+# Методы, ответы которых говорят о состоянии сессии EVMIAS (JSON при живой сессии, страница входа — при истекшей)
+SESSION_METHODS = ("Search.", "EvnXml.", "Common.")
+
+
+def _session_result(status: str, response: Optional[httpx.Response]) -> str:
+    if status == "429":
+        return "throttled"
+    if status == "error" or status.startswith("5"):
+        return "error"
+    if response is not None and response.is_success and response.content[:256].lstrip().startswith(b"<"):
+        return "expired"
+    return "ok"
+
+
+# Повторы запросов к EVMIAS
+_with_retries = retry(
+    stop=stop_after_attempt(5) | _stop_at_deadline,
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    # Отмена (CancelledError), исчерпанный бюджет времени и лимит запросов не повторяются
+    retry=(
+        retry_if_exception_type(Exception)
+        & retry_if_not_exception_type((deadline.DeadlineExceeded, RateLimitExceeded))
+    ),
+    before_sleep=_before_sleep,
+)
+
+# Таймаут одной попытки запроса к EVMIAS, секунды (уменьшается до остатка бюджета запроса)
+REQUEST_TIMEOUT = 30.0
 
 
 class HTTPXClient:
     _instance: Optional[httpx.AsyncClient] = None
 
     @classmethod
-    async def initialize(cls):
+    async def initialize(cls, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Создает клиент. `transport` позволяет подменить сеть, например
+        заменителем EVMIAS в процессе (`app.fake_evmias.server.fake_evmias_transport`).
+        """
         if cls._instance is None:
             cls._instance = httpx.AsyncClient(
-                timeout=30.0,
+                timeout=REQUEST_TIMEOUT,
                 follow_redirects=True,
                 verify=False,
+                transport=transport,
             )
 
     @classmethod
@@ -32,13 +129,88 @@ class HTTPXClient:
         return cls._instance
 
     @classmethod
-    @retry(
-        stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        before_sleep=lambda retry_state: logger.warning(
-            f"[HTTPXClient] Retrying request {retry_state.attempt_number} for {retry_state.args[1]} ({retry_state.outcome.exception()})"
-        )
-    )
+    async def _request(
+            cls,
+            label: str,
+            method: str,
+            url: str,
+            headers: Optional[Dict[str, str]],
+            cookies: Optional[Dict[str, str]],
+            params: Optional[Dict[str, Any]],
+            data: Optional[Dict[str, Any]] | str,
+            is_hedge: bool = False,
+    ) -> httpx.Response:
+        """
+        Один HTTP-запрос к EVMIAS: лимит запросов хоста, таймаут по бюджету запроса, спан,
+        метрики и запись обмена.
+        """
+        start = time.perf_counter()
+        status = "error"
+        response = None
+        try:
+            client = cls.get_client()
+            waited = await rate_limiter.acquire(bucket_for(label)) if settings.RATE_LIMIT_ENABLED else 0.0
+            # Ожидание токена не входит в латентность EVMIAS (метрики и порог хеджирования)
+            start = time.perf_counter()
+            timeout = deadline.timeout_for(REQUEST_TIMEOUT)
+            recorder.observe(params, data)
+            with tracing.span("upstream", method=label, hedge=is_hedge, rate_limit_wait=round(waited, 4)) as span:
+                response = await client.request(
+                    method=method, url=url, params=params, data=data, headers=headers, cookies=cookies,
+                    timeout=timeout,
+                )
+                status = str(response.status_code)
+                if span is not None:
+                    span.attributes["http.status_code"] = response.status_code
+
+            elapsed = time.perf_counter() - start
+            if response.is_success:
+                hedger.observe(label, elapsed)
+            if recorder.enabled:
+                await recorder.record(method, url, params, data, response, elapsed)
+            return response
+
+        except deadline.DeadlineExceeded:
+            status = "deadline"
+            raise
+        except RateLimitExceeded:
+            status = "rate_limited"
+            raise
+        except asyncio.CancelledError:
+            # Проигравший хедж или отмененный запрос клиента
+            status = "cancelled"
+            raise
+        finally:
+            metrics.UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, method=label, status=status)
+            # Здоровье сессии учетной записи (куки с `login`) — для пула сессий
+            account = (cookies or {}).get("login")
+            if account and label.startswith(SESSION_METHODS) and status not in ("cancelled", "deadline", "rate_limited"):
+                metrics.EVMIAS_SESSION_RESPONSES_TOTAL.inc(account=account, result=_session_result(status, response))
+
+    @classmethod
+    async def _send(
+            cls,
+            method: str,
+            url: str,
+            headers: Optional[Dict[str, str]],
+            cookies: Optional[Dict[str, str]],
+            params: Optional[Dict[str, Any]],
+            data: Optional[Dict[str, Any]] | str,
+            hedge: bool,
+    ) -> httpx.Response:
+        """Одна попытка запроса (с хеджированием, если разрешено); ошибка для статусов 4xx/5xx."""
+        label = upstream_method(url, params)
+        if hedge and settings.HEDGE_ENABLED and not is_background():
+            response = await hedger.run(
+                label, lambda is_hedge: cls._request(label, method, url, headers, cookies, params, data, is_hedge)
+            )
+        else:
+            response = await cls._request(label, method, url, headers, cookies, params, data)
+        response.raise_for_status()
+        return response
+
+    @classmethod
+    @_with_retries
     async def fetch(
             cls,
             url: str,
@@ -47,33 +219,55 @@ class HTTPXClient:
             cookies: Optional[Dict[str, str]] = None,
             params: Optional[Dict[str, Any]] = None,
             data: Optional[Dict[str, Any]] | str = None,
+            hedge: bool = False,
     ) -> Dict[str, Any]:
-
+        """
+        Запрос к EVMIAS с повторами. `hedge=True` — только для идемпотентных запросов:
+        при медленном ответе отправляется дубликат (`app.core.hedging`). Фоновые запросы не хеджируются.
+        Возвращает полный ответ (статус, заголовки, куки, текст и JSON) — для авторизации;
+        пайплайнам достаточно `fetch_json`.
+        """
         try:
-            client = cls.get_client()
-            response = await client.request(
-                method=method, url=url, params=params, data=data, headers=headers, cookies=cookies
-            )
-
-            response.raise_for_status()
-
-            json_data = None
-            if "application/json" in response.headers.get("Content-Type", ""):
-                try:
-                    json_data = response.json()
-                except ValueError:
-                    json_data = None
-            elif "text/html" in response.headers.get("Content-Type", ""):
-                try:
-                    json_data = json.loads(response.text)
-                except ValueError:
-                    json_data = None
-
+            response = await cls._send(method, url, headers, cookies, params, data, hedge)
             return dict(
                 status_code=response.status_code, headers=dict(response.headers),
-                cookies=dict(response.cookies), text=response.text, json=json_data
+                cookies=dict(response.cookies), text=response.text, json=_parse_json(response)
             )
 
+        except (deadline.DeadlineExceeded, RateLimitExceeded):
+            raise
         except Exception as e:
             logger.error(f"Unhandled exception in HTTPXClient.fetch: {e}", exc_info=True)
-            raise e
\ No newline at end of file
+            raise e
+
+    @classmethod
+    @_with_retries
+    async def fetch_json(
+            cls,
+            url: str,
+            method: str = "POST",
+            cookies: Optional[Dict[str, str]] = None,
+            params: Optional[Dict[str, Any]] = None,
+            data: Optional[Dict[str, Any]] | str = None,
+            field: Optional[str] = None,
+            hedge: bool = False,
+    ) -> Any:
+        """
+        Экономный запрос к EVMIAS: возвращает только разобранный JSON (или его поле `field`), None — если
+        ответ не JSON. Повторы и хеджирование — как у `fetch`. JSON разбирается прямо из байтов, без
+        декодированного текста и копий заголовков и кук; тело ответа освобождается до возврата,
+        поэтому во время дальнейшей обработки (санитизации) в памяти остается только нужное значение.
+        """
+        try:
+            response = await cls._send(method, url, None, cookies, params, data, hedge)
+            parsed = _parse_json(response)
+            del response  # тело ответа больше не нужно
+            if field is None or parsed is None:
+                return parsed
+            return parsed.get(field) if isinstance(parsed, dict) else None
+
+        except (deadline.DeadlineExceeded, RateLimitExceeded):
+            raise
+        except Exception as e:
+            logger.error(f"Unhandled exception in HTTPXClient.fetch_json: {e}", exc_info=True)
+            raise e
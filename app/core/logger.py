@@ -12,16 +12,18 @@ for name in logging.root.manager.loggerDict:
 
 # Настраиваем `loguru` для логирования FastAPI
 logger.remove()
+# `request_id` заполняется в `app.core.tracing` для логов внутри запроса
+logger.configure(extra={"request_id": ""})
 logger.add(
     sys.stderr,
-    format="<green>{time:HH:mm:ss}</green> | <level>{level}</level> | <cyan>{message}</cyan>",
+    format="<green>{time:HH:mm:ss}</green> | <level>{level}</level> | <cyan>{extra[request_id]}{message}</cyan>",
     level="INFO",
     colorize=True,
 )
 
 logger.add(
     "logs/app.log",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
+    format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {extra[request_id]}{message}",
     level="INFO",
     rotation="10 MB",  # Разбивка логов на файлы по 10MB
     retention="14 days",  # Храним логи 14 дней
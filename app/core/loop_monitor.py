@@ -0,0 +1,163 @@
+# app/core/loop_monitor.py
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+# Сколько различных стеков-нарушителей храним одновременно
+MAX_OFFENDERS = 100
+# Глубина сохраняемого стека
+STACK_DEPTH = 25
+
+
+class _Offender:
+    __slots__ = ("stack", "task", "count", "total", "max", "last_seen")
+
+    def __init__(self, stack: List[str], task: Optional[str]):
+        self.stack = stack
+        self.task = task
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_seen = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "task": self.task,
+            "count": self.count,
+            "total_seconds": round(self.total, 4),
+            "max_seconds": round(self.max, 4),
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    """
+    Монитор задержек event loop.
+
+    - Задача-пульс в loop спит `interval` секунд и измеряет, насколько позже она проснулась (lag).
+    - Поток-сторож проверяет пульс; если loop не отвечает дольше `threshold`, он снимает стек
+      потока loop через `sys._current_frames()` — это стек кода, который сейчас блокирует loop.
+    - После разблокировки пульс записывает измеренную задержку на снятый стек.
+
+    Накладные расходы: одно пробуждение loop каждые `interval` секунд и одна проверка в потоке.
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._capture: Optional[Tuple[List[str], Optional[str]]] = None
+        self._offenders: Dict[Tuple[str, ...], _Offender] = {}
+        self._blocks = 0
+        self._max_lag = 0.0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._pulse())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+        logger.info(f"[LoopMonitor] Started (interval={self.interval}s, threshold={self.threshold}s)")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1.0)
+            self._thread = None
+
+    async def _pulse(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self._heartbeat = now
+            metrics.LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                self._record_block(lag)
+
+    def _record_block(self, lag: float) -> None:
+        metrics.LOOP_BLOCKS_TOTAL.inc()
+        with self._lock:
+            capture, self._capture = self._capture, None
+            self._blocks += 1
+            self._max_lag = max(self._max_lag, lag)
+            stack, task = capture if capture else (["<stack not captured>"], None)
+            key = tuple(stack)
+            offender = self._offenders.get(key)
+            if offender is None:
+                if len(self._offenders) >= MAX_OFFENDERS:
+                    weakest = min(self._offenders, key=lambda k: self._offenders[k].total)
+                    del self._offenders[weakest]
+                offender = self._offenders[key] = _Offender(stack, task)
+            offender.count += 1
+            offender.total += lag
+            offender.max = max(offender.max, lag)
+            offender.last_seen = time.time()
+        logger.warning(f"[LoopMonitor] Event loop blocked for {lag:.3f}s in {stack[-1]}")
+
+    def _watch(self) -> None:
+        captured_for = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or captured_for == heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = [
+                f"{entry.filename}:{entry.lineno} in {entry.name}"
+                for entry in traceback.extract_stack(frame, limit=STACK_DEPTH)
+            ]
+            task = asyncio.tasks._current_tasks.get(self._loop)  # noqa
+            task_name = None
+            if task is not None:
+                coro = task.get_coro()
+                task_name = f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+            with self._lock:
+                self._capture = (stack, task_name)
+            captured_for = heartbeat
+
+    def report(self, limit: int = 20) -> dict:
+        with self._lock:
+            offenders = sorted(self._offenders.values(), key=lambda o: o.total, reverse=True)[:limit]
+            return {
+                "enabled": self._task is not None,
+                "interval_seconds": self.interval,
+                "threshold_seconds": self.threshold,
+                "blocks_total": self._blocks,
+                "max_lag_seconds": round(self._max_lag, 4),
+                "offenders": [o.to_dict() for o in offenders],
+            }
+
+
+loop_monitor = LoopMonitor(settings.LOOP_MONITOR_INTERVAL, settings.LOOP_BLOCK_THRESHOLD)
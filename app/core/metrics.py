@@ -0,0 +1,368 @@
+# app/core/metrics.py
+
+import functools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+DEFAULT_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DOCUMENT_COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 200, 500)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Timer:
+    """Контекстный менеджер и декоратор для замера длительности в `Histogram`."""
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with _Timer(self._histogram, self._labels):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._listeners: List[Callable[[float, Dict[str, str]], None]] = []
+        REGISTRY.register(self)
+
+    def subscribe(self, listener: Callable[[float, Dict[str, str]], None]) -> None:
+        """Подписывает `listener(value, labels)` на каждое изменение метрики."""
+        self._listeners.append(listener)
+
+    def _notify(self, value: float, labels: Dict[str, str]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(value, labels)
+            except Exception as e:
+                logger.error(f"[Metrics] Listener of {self.name} failed: {e}")
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> dict:
+        return {
+            "type": self.type_name,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            # Копия за одну операцию: снимок делается в потоке, пока event loop добавляет метки
+            "samples": [[list(key), value] for key, value in list(self._values.items())],
+        }
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+        self._notify(amount, labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Tuple[str, ...] = (),
+            buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state["buckets"][i] += 1
+                break
+        state["sum"] += value
+        state["count"] += 1
+        self._notify(value, labels)
+
+    def time(self, **labels: str) -> _Timer:
+        return _Timer(self, labels)
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data["buckets"] = [_format_value(b) for b in self.buckets]
+        return data
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик текущего процесса.
+
+    Каждый воркер gunicorn периодически сбрасывает снимок своих метрик в `METRICS_DIR`,
+    а `/metrics` суммирует снимки всех воркеров текущего мастер-процесса.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    @staticmethod
+    def _directory() -> Optional[Path]:
+        return Path(settings.METRICS_DIR) if settings.METRICS_DIR else None
+
+    @staticmethod
+    def _file_prefix() -> str:
+        # Воркеры одного мастера gunicorn имеют общий ppid
+        return f"metrics_{os.getppid()}_"
+
+    def cleanup(self) -> None:
+        """Удаляет снимки, оставшиеся от предыдущих запусков (другой мастер-процесс)."""
+        directory = self._directory()
+        if directory is None or not directory.exists():
+            return
+        prefix = self._file_prefix()
+        for path in directory.glob("metrics_*.json"):
+            if not path.name.startswith(prefix):
+                path.unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        """Атомарно записывает снимок метрик текущего воркера на диск."""
+        directory = self._directory()
+        if directory is None:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / f"{self._file_prefix()}{os.getpid()}.json"
+        tmp = target.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.snapshot()), encoding="utf-8")
+        os.replace(tmp, target)
+
+    def collect(self) -> dict:
+        """Возвращает метрики, просуммированные по всем воркерам."""
+        directory = self._directory()
+        if directory is None:
+            return self.snapshot()
+
+        self.flush()
+        merged: dict = {}
+        for path in sorted(directory.glob(f"{self._file_prefix()}*.json")):
+            try:
+                snapshot = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"[Metrics] Skipping unreadable snapshot {path.name}: {e}")
+                continue
+            for name, data in snapshot.items():
+                target = merged.setdefault(name, {**data, "samples": {}})
+                for key, value in data["samples"]:
+                    key = tuple(key)
+                    current = target["samples"].get(key)
+                    if current is None:
+                        target["samples"][key] = value
+                    elif data["type"] == "histogram":
+                        current["buckets"] = [a + b for a, b in zip(current["buckets"], value["buckets"])]
+                        current["sum"] += value["sum"]
+                        current["count"] += value["count"]
+                    else:
+                        target["samples"][key] = current + value
+        for data in merged.values():
+            data["samples"] = [[list(key), value] for key, value in data["samples"].items()]
+        return merged
+
+    def render(self) -> str:
+        """Формирует ответ в текстовом формате экспозиции Prometheus."""
+        lines = []
+        for name, data in sorted(self.collect().items()):
+            labelnames = tuple(data["labelnames"])
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            for key, value in data["samples"]:
+                key = tuple(key)
+                if data["type"] == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(data["buckets"], value["buckets"]):
+                        cumulative += count
+                        labels = _format_labels(labelnames, key, f'le="{bound}"')
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(labelnames, key)
+                    lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{labels} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# --- HTTP API сервиса ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Duration of HTTP requests served by this service.", ("path", "status"),
+)
+
+# --- Event loop ---
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Delay of the event loop heartbeat beyond its scheduled time.",
+    buckets=LOOP_LAG_BUCKETS,
+)
+LOOP_BLOCKS_TOTAL = Counter(
+    "event_loop_blocks_total", "Event loop stalls longer than LOOP_BLOCK_THRESHOLD.",
+)
+
+# --- Вызовы EVMIAS ---
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "evmias_request_duration_seconds", "Latency of a single EVMIAS request attempt.", ("method", "status"),
+)
+EVMIAS_SESSION_RESPONSES_TOTAL = Counter(
+    "evmias_session_responses_total",
+    "EVMIAS responses by account session: ok, throttled, expired (login page), error.",
+    ("account", "result"),
+)
+UPSTREAM_RETRIES_TOTAL = Counter(
+    "evmias_request_retries_total", "Retried EVMIAS requests.", ("method",),
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "evmias_rate_limit_wait_seconds", "Time spent waiting for a host-wide rate limit token.", ("bucket",),
+)
+RATE_LIMIT_REJECTED_TOTAL = Counter(
+    "evmias_rate_limit_rejected_total", "EVMIAS requests rejected by the host-wide rate limiter.", ("bucket",),
+)
+HEDGED_REQUESTS_TOTAL = Counter(
+    "evmias_hedged_requests_total",
+    "Hedging decisions: sent, primary_won, hedge_won, both_failed, over_budget.", ("method", "result"),
+)
+
+# --- Cookies ---
+COOKIE_CHECKS_TOTAL = Counter(
+    "cookie_checks_total", "Proactive cookie checks by result.", ("result",),
+)
+COOKIE_REFRESHES_TOTAL = Counter(
+    "cookie_refreshes_total", "EVMIAS logins performed to obtain new cookies.", ("result",),
+)
+COOKIE_SECONDS = Histogram(
+    "cookie_get_valid_duration_seconds", "Time spent obtaining valid cookies.",
+)
+
+# --- Pipelines ---
+PIPELINE_SECONDS = Histogram(
+    "pipeline_duration_seconds", "Duration of pipeline stages per modality.", ("modality", "stage"),
+)
+PIPELINE_DOCUMENTS = Histogram(
+    "pipeline_documents", "Documents fetched by a pipeline per request.", ("modality",),
+    buckets=DOCUMENT_COUNT_BUCKETS,
+)
+
+# --- Complex endpoint ---
+COMPLEX_REQUEST_SECONDS = Histogram(
+    "complex_request_duration_seconds", "Duration of /api/complex/person requests.", ("outcome",),
+)
+COMPLEX_DOCUMENTS = Histogram(
+    "complex_documents", "Documents returned per /api/complex/person request.",
+    buckets=DOCUMENT_COUNT_BUCKETS,
+)
+ADMISSION_REQUESTS_TOTAL = Counter(
+    "admission_requests_total",
+    "Admission decisions for heavy extractions: admitted, rejected_full, rejected_estimate, rejected_timeout, evicted.",
+    ("priority", "result"),
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds", "Time spent in the admission queue before a decision.", ("priority",),
+)
+CANCELLED_TASKS_TOTAL = Counter(
+    "cancelled_tasks_total", "Pipeline and document tasks cancelled before completion.", ("reason", "stage"),
+)
+CLIENT_DISCONNECTS_TOTAL = Counter(
+    "client_disconnects_total", "Requests abandoned by the client while still being processed.", ("path",),
+)
+
+WARMUP_SECONDS = Histogram(
+    "warmup_seconds", "Duration of worker warm-up steps by final state.", ("component", "state"),
+)
+
+# --- Кэши ---
+CACHE_REQUESTS_TOTAL = Counter(
+    "cache_requests_total",
+    "Cache lookups: hit, miss (new load), shared (joined an in-flight load) or backend_hit (shared cache backend).",
+    ("cache", "result"),
+)
+CACHE_BACKEND_SECONDS = Histogram(
+    "cache_backend_duration_seconds", "Latency of shared cache backend operations.", ("backend", "op"),
+)
+CACHE_BACKEND_ERRORS_TOTAL = Counter(
+    "cache_backend_errors_total", "Failed or timed out cache backend operations (backend taken out for a while).",
+    ("backend", "op"),
+)
+ORPHAN_TASKS_TOTAL = Counter(
+    "cache_orphan_loads_total", "Loads left without waiters: completed into the cache or cancelled.",
+    ("cache", "result"),
+)
+PREFETCH_PATIENTS_TOTAL = Counter(
+    "prefetch_patients_total", "Background prefetch of planned patients: warm, partial or failed.", ("result",),
+)
+
+# --- Индекс лабораторных значений ---
+ANALYTE_INDEX_DOCUMENTS_TOTAL = Counter(
+    "analyte_index_documents_total",
+    "Lab reports added to the analyte index: indexed, empty (no result table) or failed.", ("result",),
+)
+
+# --- Наблюдение за пациентами ---
+WATCHLIST_CHECKS_TOTAL = Counter(
+    "watchlist_checks_total", "Incremental watchlist checks: unchanged, changed or failed.", ("result",),
+)
+WATCHLIST_DOCUMENTS_TOTAL = Counter(
+    "watchlist_new_documents_total", "New documents found and fetched by the watchlist poller.", ("modality",),
+)
+WATCHLIST_WEBHOOKS_TOTAL = Counter(
+    "watchlist_webhooks_total", "Watchlist webhook deliveries.", ("result",),
+)
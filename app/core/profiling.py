@@ -0,0 +1,219 @@
+# app/core/profiling.py
+
+import asyncio
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+_PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9-]{1,80}$")
+
+_request_profile_var: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+def _new_profile_id(kind: str) -> str:
+    return f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Путь к готовому файлу профиля по его id (или None)."""
+    if not _PROFILE_ID_RE.match(profile_id):
+        return None
+    directory = Path(settings.PROFILE_DIR)
+    for suffix in (".collapsed", ".pstats"):
+        path = directory / f"{profile_id}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def list_profiles() -> List[dict]:
+    directory = Path(settings.PROFILE_DIR)
+    if not directory.exists():
+        return []
+    return [
+        {"profile_id": path.stem, "format": path.suffix.lstrip("."), "size": path.stat().st_size}
+        for path in sorted(directory.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True)
+        if path.suffix in (".collapsed", ".pstats")
+    ]
+
+
+class StackSampler(threading.Thread):
+    """
+    Сэмплирующий профайлер потока event loop.
+    Раз в `interval` секунд снимает стек потока loop и копит свернутые стеки
+    (формат collapsed stacks для flamegraph.pl / speedscope).
+    `task_filter` ограничивает сэмплы задачами, которые сейчас выполняются в loop.
+    """
+
+    def __init__(self, interval: float, task_filter: Optional[Callable[[asyncio.Task], bool]] = None):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.task_filter = task_filter
+        self.samples: Counter = Counter()
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            if self.task_filter is not None:
+                task = asyncio.tasks._current_tasks.get(self._loop)  # noqa
+                if task is None or not self.task_filter(task):
+                    continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join(timeout=1.0)
+
+    def dump(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfile:
+    """Профиль одного запроса: сэмплы берутся только из задач, созданных этим запросом."""
+
+    def __init__(self):
+        self.profile_id = _new_profile_id("request")
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self.sampler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL, task_filter=self.tasks.__contains__)
+        self.deadline = time.monotonic() + settings.PROFILE_MAX_DURATION
+
+    def start(self) -> None:
+        current = asyncio.current_task()
+        if current is not None:
+            self.tasks.add(current)
+        _request_profile_var.set(self)
+        self.sampler.start()
+
+    def stop(self) -> Path:
+        self.sampler.stop()
+        _request_profile_var.set(None)
+        path = Path(settings.PROFILE_DIR) / f"{self.profile_id}.collapsed"
+        self.sampler.dump(path)
+        logger.info(f"[Profiling] Request profile saved to {path} ({sum(self.sampler.samples.values())} samples)")
+        return path
+
+
+def install_task_factory() -> None:
+    """
+    Ставит фабрику задач, которая добавляет задачи, порожденные профилируемым запросом,
+    в его профиль. Вне профилирования стоимость — одно чтение contextvar на задачу.
+    """
+    loop = asyncio.get_running_loop()
+    previous = loop.get_task_factory()
+
+    def factory(loop_, coro, context=None):
+        # Явный context в задачах появился в Python 3.11; на 3.10 он не передается (и в фабрику не приходит)
+        with_context = context is not None and sys.version_info >= (3, 11)
+        if previous is not None:
+            task = previous(loop_, coro, context=context) if with_context else previous(loop_, coro)
+        elif with_context:
+            task = asyncio.Task(coro, loop=loop_, context=context)
+        else:
+            task = asyncio.Task(coro, loop=loop_)
+        # Задача создается в контексте родителя (или в явно переданном context)
+        profile = context.get(_request_profile_var) if context is not None else _request_profile_var.get()
+        if profile is not None and time.monotonic() < profile.deadline:
+            profile.tasks.add(task)
+        return task
+
+    loop.set_task_factory(factory)
+
+
+class WorkerProfiler:
+    """Ограниченный по времени профиль всего воркера: сэмплирование (collapsed) или cProfile (pstats)."""
+
+    MODES = ("sampling", "cprofile")
+
+    def __init__(self):
+        self.profile_id: Optional[str] = None
+        self.mode: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self._sampler: Optional[StackSampler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def running(self) -> bool:
+        return self.profile_id is not None
+
+    def start(self, mode: str, duration: float) -> str:
+        if self.running:
+            raise RuntimeError(f"Worker profile {self.profile_id} is already running")
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+
+        duration = min(duration, settings.PROFILE_MAX_DURATION)
+        self.profile_id = _new_profile_id("worker")
+        self.mode = mode
+        self.started_at = time.time()
+        if mode == "sampling":
+            self._sampler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL)
+            self._sampler.start()
+        else:
+            # cProfile работает в потоке, где включен, — это поток event loop
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._timer = asyncio.get_running_loop().call_later(duration, self.stop)
+        logger.info(f"[Profiling] Worker profile {self.profile_id} started ({mode}, {duration}s)")
+        return self.profile_id
+
+    def stop(self) -> Optional[Path]:
+        if not self.running:
+            return None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        if self._sampler is not None:
+            self._sampler.stop()
+            path = directory / f"{self.profile_id}.collapsed"
+            self._sampler.dump(path)
+        else:
+            self._cprofile.disable()
+            path = directory / f"{self.profile_id}.pstats"
+            self._cprofile.dump_stats(str(path))
+
+        logger.info(f"[Profiling] Worker profile {self.profile_id} saved to {path}")
+        self.profile_id = self.mode = self.started_at = None
+        self._sampler = self._cprofile = None
+        return path
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "running": self.running,
+            "profile_id": self.profile_id,
+            "mode": self.mode,
+            "started_at": self.started_at,
+        }
+
+
+worker_profiler = WorkerProfiler()
@@ -0,0 +1,190 @@
+# app/core/ratelimit.py
+
+import asyncio
+import fcntl
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from app.core import deadline, metrics
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+# Новые корзины добавляются в конец: позиция корзины — ее место в файле состояния
+BUCKETS = ("search", "document", "auth", "session")
+
+# Методы входа в EVMIAS (страница Logon и GWT-авторизация) — единственное, что идет в корзину auth
+AUTH_METHODS = ("main.index.Logon", "dispatch.servlet")
+
+# Состояние корзины в файле: токены и время последнего пополнения (time.monotonic — общее для хоста)
+_SLOT = struct.Struct("dd")
+
+# Как часто фоновый запрос проверяет корзину, если резерв занят, секунды
+BACKGROUND_POLL = 0.1
+
+# Запросы фоновых задач (префетч) не резервируют будущие токены и уступают интерактивным
+_background_var: ContextVar[bool] = ContextVar("rate_limit_background", default=False)
+
+
+@contextmanager
+def background():
+    """Запросы к EVMIAS внутри блока (и в порожденных задачах) выполняются с низким приоритетом."""
+    token = _background_var.set(True)
+    try:
+        yield
+    finally:
+        _background_var.reset(token)
+
+
+def is_background() -> bool:
+    return _background_var.get()
+
+
+class RateLimitExceeded(Exception):
+    """Лимит запросов к EVMIAS исчерпан, а ожидание токена дольше допустимого. Не повторяется."""
+
+
+def bucket_for(label: str) -> str:
+    """
+    Корзина лимита по методу EVMIAS (`upstream_method`): поиск, протоколы, вход или остальное — проверка
+    сессии (`Common.getCurrentDateTime`) и служебные страницы, которые не должны тратить лимит входа.
+    """
+    if label.startswith("Search."):
+        return "search"
+    if label.startswith("EvnXml."):
+        return "document"
+    if label.startswith(AUTH_METHODS):
+        return "auth"
+    return "session"
+
+
+class HostRateLimiter:
+    """
+    Token bucket, общий для всех воркеров gunicorn на хосте.
+
+    Состояние корзин лежит в маленьком файле, отображенном в память (mmap); изменения
+    выполняются под `fcntl.flock`, поэтому лимит действует на сумму запросов всех процессов.
+    Если токена нет, запрос резервирует будущий токен (баланс уходит в минус) и ждет его
+    не дольше `max_wait` секунд (и не дольше бюджета запроса); иначе — `RateLimitExceeded`.
+    Фоновые запросы берут токен, только если после этого в корзине остается доля `background_reserve`
+    ее емкости, и ждут без ограничения — всплеск запросов врачей их просто приостанавливает.
+    """
+
+    def __init__(self, path: str, rates: Dict[str, float], bursts: Dict[str, float], max_wait: float,
+                 background_reserve: float = 0.0):
+        missing = [bucket for bucket in BUCKETS if bucket not in rates or bucket not in bursts]
+        if missing:
+            raise ValueError(f"Rate limit is not configured for buckets: {', '.join(missing)}")
+        self.path = path
+        self.rates = rates
+        self.bursts = bursts
+        self.max_wait = max_wait
+        self.background_reserve = background_reserve
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+
+    def _open(self) -> mmap.mmap:
+        if self._map is None or self._fd is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = _SLOT.size * len(BUCKETS)
+            if os.fstat(fd).st_size < size:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd, self._map = fd, mmap.mmap(fd, size)
+        return self._map
+
+    def _update(self, bucket: str, cost: float, max_wait: float, reserve: float = 0.0) -> Tuple[bool, float]:
+        """
+        Под блокировкой: пополняет корзину и резервирует `cost` токенов, оставляя в ней не меньше `reserve`.
+        Возвращает (успех, ожидание).
+        """
+        rate, burst = self.rates[bucket], self.bursts[bucket]
+        offset = BUCKETS.index(bucket) * _SLOT.size
+        state = self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            now = time.monotonic()
+            tokens, updated = _SLOT.unpack_from(state, offset)
+            # Нулевое время — корзина еще не использовалась (или хост перезагружен)
+            tokens = burst if updated == 0 or updated > now else min(burst, tokens + (now - updated) * rate)
+            wait = max(0.0, (cost + reserve - tokens) / rate)
+            granted = wait <= max_wait
+            if granted:
+                tokens -= cost
+            _SLOT.pack_into(state, offset, tokens, now)
+            return granted, wait
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _refund(self, bucket: str, cost: float) -> None:
+        offset = BUCKETS.index(bucket) * _SLOT.size
+        state = self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            tokens, updated = _SLOT.unpack_from(state, offset)
+            _SLOT.pack_into(state, offset, min(self.bursts[bucket], tokens + cost), updated)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    async def acquire(self, bucket: str, cost: float = 1.0) -> float:
+        """Ждет токен корзины; возвращает время ожидания в секундах."""
+        if self.rates.get(bucket, 0) <= 0:
+            return 0.0
+        if _background_var.get():
+            return await self._acquire_background(bucket, cost)
+        left = deadline.remaining()
+        max_wait = self.max_wait if left is None else max(0.0, min(self.max_wait, left))
+        granted, wait = self._update(bucket, cost, max_wait)
+        if not granted:
+            metrics.RATE_LIMIT_REJECTED_TOTAL.inc(bucket=bucket)
+            logger.warning(f"[RateLimit] {bucket}: no token within {max_wait:.2f}s (needs {wait:.2f}s)")
+            raise RateLimitExceeded(f"EVMIAS rate limit for '{bucket}' exceeded")
+        metrics.RATE_LIMIT_WAIT_SECONDS.observe(wait, bucket=bucket)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Токен так и не был использован — возвращаем его остальным
+                self._refund(bucket, cost)
+                raise
+        return wait
+
+    async def _acquire_background(self, bucket: str, cost: float) -> float:
+        reserve = max(0.0, min(self.bursts[bucket] * self.background_reserve, self.bursts[bucket] - cost))
+        waited = 0.0
+        while True:
+            granted, wait = self._update(bucket, cost, 0.0, reserve)
+            if granted:
+                return waited
+            wait = max(wait, BACKGROUND_POLL)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def state(self) -> Dict[str, dict]:
+        state = self._open()
+        now = time.monotonic()
+        result = {}
+        for bucket in BUCKETS:
+            tokens, updated = _SLOT.unpack_from(state, BUCKETS.index(bucket) * _SLOT.size)
+            if updated and updated <= now:
+                tokens = min(self.bursts[bucket], tokens + (now - updated) * self.rates[bucket])
+            else:
+                tokens = self.bursts[bucket]
+            result[bucket] = {"rate": self.rates[bucket], "burst": self.bursts[bucket], "tokens": round(tokens, 2)}
+        return result
+
+
+rate_limiter = HostRateLimiter(
+    settings.RATE_LIMIT_FILE, settings.RATE_LIMIT_RPS, settings.RATE_LIMIT_BURST, settings.RATE_LIMIT_MAX_WAIT,
+    settings.PREFETCH_RESERVE,
+)
@@ -0,0 +1,294 @@
+# app/core/recorder.py
+
+import asyncio
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+EXCHANGES_FILE = "exchanges.jsonl"
+BODIES_DIR = "bodies"
+
+# Сколько встреченных персональных значений помнить для замены в HTML протоколов
+MAX_KNOWN_VALUES = 10_000
+# Значения короче не заменяются в тексте (слишком много ложных совпадений)
+MIN_TEXT_VALUE_LENGTH = 3
+
+
+def upstream_key(method: str, url: str, params: Optional[Dict[str, Any]]) -> str:
+    """Ключ обмена без данных формы: HTTP-метод, путь и параметры запроса."""
+    path = urlsplit(url).path or "/"
+    query = "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+    return f"{method.upper()} {path}?{query}"
+
+
+class Redactor:
+    """
+    Замена персональных полей стабильными псевдонимами.
+
+    Одно и то же значение всегда дает один и тот же псевдоним (HMAC с `RECORD_SALT`),
+    поэтому записанные обмены остаются связанными между собой, а воспроизведение
+    может сопоставить запрос с записью, псевдонимизировав его тем же способом.
+    Встреченные значения запоминаются и вычищаются также из текста (HTML протоколов).
+    """
+
+    def __init__(self, fields: List[str], salt: str):
+        self.fields = {f.lower() for f in fields}
+        self.salt = salt.encode("utf-8")
+        self._known: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pseudonym(self, value: Any) -> str:
+        digest = hmac.new(self.salt, str(value).encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"anon-{digest[:12]}"
+
+    def _remember(self, value: str, alias: str) -> None:
+        if len(value) < MIN_TEXT_VALUE_LENGTH:
+            return
+        with self._lock:
+            for variant in {value, value.upper(), value.lower(), value.capitalize()}:
+                self._known[variant] = alias
+                self._known.move_to_end(variant)
+            while len(self._known) > MAX_KNOWN_VALUES:
+                self._known.popitem(last=False)
+
+    def redact_fields(self, value: Any) -> Any:
+        """Рекурсивно псевдонимизирует поля из списка в словарях и списках."""
+        if isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                if str(key).lower() in self.fields and item not in (None, ""):
+                    alias = self.pseudonym(item)
+                    self._remember(str(item), alias)
+                    result[key] = alias
+                else:
+                    result[key] = self.redact_fields(item)
+            return result
+        if isinstance(value, list):
+            return [self.redact_fields(item) for item in value]
+        return value
+
+    def learn(self, value: Any) -> None:
+        """Запоминает персональные значения полей из списка, ничего не заменяя (данные запроса до отправки)."""
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if str(key).lower() in self.fields and item not in (None, ""):
+                    self._remember(str(item), self.pseudonym(item))
+                else:
+                    self.learn(item)
+        elif isinstance(value, list):
+            for item in value:
+                self.learn(item)
+
+    def redact_text(self, text: str) -> str:
+        with self._lock:
+            known = sorted(self._known.items(), key=lambda kv: len(kv[0]), reverse=True)
+        for value, alias in known:
+            if value in text:
+                text = text.replace(value, alias)
+        return text
+
+    def redact_strings(self, value: Any) -> Any:
+        """Вычищает известные персональные значения из всех строк структуры."""
+        if isinstance(value, dict):
+            return {key: self.redact_strings(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.redact_strings(item) for item in value]
+        if isinstance(value, str):
+            return self.redact_text(value)
+        return value
+
+    def redact_form(self, data: Any) -> Any:
+        """Данные формы: словарь — по полям, строка (тело GWT с секретом) — целиком."""
+        if isinstance(data, dict):
+            return self.redact_fields(data)
+        if isinstance(data, (str, bytes)) and data:
+            return self.pseudonym(data)
+        return data
+
+    def redact_body(self, body: bytes) -> bytes:
+        """Тело ответа: JSON — по полям и строкам, иначе — замена известных значений в тексте."""
+        text = body.decode("utf-8", errors="replace")
+        try:
+            parsed = json.loads(text)
+        except ValueError:
+            return self.redact_text(text).encode("utf-8")
+        redacted = self.redact_strings(self.redact_fields(parsed))
+        return json.dumps(redacted, ensure_ascii=False).encode("utf-8")
+
+
+class Recorder:
+    """
+    Запись обменов с EVMIAS для воспроизведения (включается `RECORD_DIR`).
+
+    Формат каталога:
+    - `exchanges.jsonl` — по строке на обмен: запрос (псевдонимизированный), статус,
+      тип содержимого, куки ответа, время ответа и sha256 тела;
+    - `bodies/<sha[:2]>/<sha>.gz` — тела ответов, сжатые gzip; одинаковые тела хранятся один раз.
+    Куки запросов и заголовки авторизации не записываются.
+    Без `RECORD_SALT` запись не включается: псевдонимы HMAC с пустым ключом обращаются перебором по словарю.
+
+    ФИО в протоколах вычищаются только по значениям, уже встреченным в запросах, поэтому на время записи
+    кэши пациентов и протоколов и общий бэкенд кэша выключены (`app.core.cache`, `app.core.cache_backends`):
+    каждый протокол загружается после поиска своего пациента в этом же процессе.
+    """
+
+    def __init__(self, directory: Optional[str], redactor: Redactor):
+        if directory and not redactor.salt:
+            raise ValueError("RECORD_DIR is set but RECORD_SALT is empty: pseudonyms would be reversible")
+        self.directory = Path(directory) if directory else None
+        self.redactor = redactor
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def observe(self, params: Optional[Dict[str, Any]], data: Any) -> None:
+        """
+        Запоминает персональные поля запроса до его отправки: запись ответов идет в потоках,
+        и протокол пациента может записываться раньше, чем его поиск.
+        """
+        if self.enabled:
+            self.redactor.learn(params)
+            self.redactor.learn(data)
+
+    async def record(
+            self,
+            method: str,
+            url: str,
+            params: Optional[Dict[str, Any]],
+            data: Any,
+            response: httpx.Response,
+            elapsed: float,
+    ) -> None:
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._write, method, url, params, data, response, elapsed)
+        except Exception as e:
+            logger.error(f"[Recorder] Error recording exchange {method} {url}: {e}")
+
+    def _write(self, method, url, params, data, response: httpx.Response, elapsed: float) -> None:
+        redactor = self.redactor
+        # Сначала запрос: его персональные значения нужны для чистки тела ответа
+        entry = {
+            "ts": round(time.time(), 3),
+            "key": upstream_key(method, url, redactor.redact_fields(params or {})),
+            "method": method.upper(),
+            "path": urlsplit(url).path or "/",
+            "params": redactor.redact_fields(params or {}),
+            "data": redactor.redact_form(data),
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", ""),
+            "cookies": {name: redactor.pseudonym(value) for name, value in response.cookies.items()},
+            "elapsed": round(elapsed, 4),
+        }
+        body = redactor.redact_body(response.content)
+        entry["body"] = sha = hashlib.sha256(body).hexdigest()
+        entry["size"] = len(body)
+
+        body_path = self.directory / BODIES_DIR / sha[:2] / f"{sha}.gz"
+        with self._lock:
+            if not body_path.exists():
+                body_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = body_path.with_suffix(".tmp")
+                tmp_path.write_bytes(gzip.compress(body))
+                tmp_path.replace(body_path)
+            with (self.directory / EXCHANGES_FILE).open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def load_exchanges(directory: str) -> List[dict]:
+    path = Path(directory) / EXCHANGES_FILE
+    with path.open("r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_body(directory: str, sha: str) -> bytes:
+    return gzip.decompress((Path(directory) / BODIES_DIR / sha[:2] / f"{sha}.gz").read_bytes())
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт httpx, отвечающий записанными обменами вместо EVMIAS.
+
+    Запрос псевдонимизируется так же, как при записи, и сопоставляется с записью
+    по ключу и данным формы; если точного совпадения нет, а `strict=False`,
+    берется следующая по кругу запись того же метода EVMIAS (другие пациенты и документы).
+    Ответ задерживается на записанное время, умноженное на `timing_scale` (0 — без задержек).
+    """
+
+    def __init__(self, directory: str, timing_scale: float = 1.0, strict: bool = False,
+                 redactor: Optional[Redactor] = None):
+        self.directory = directory
+        self.timing_scale = timing_scale
+        self.strict = strict
+        self.redactor = redactor or Redactor(settings.RECORD_REDACT_FIELDS, settings.RECORD_SALT)
+        self._exact: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        self._by_key: Dict[str, List[dict]] = defaultdict(list)
+        for entry in load_exchanges(directory):
+            self._exact[(entry["key"], self._form_key(entry["data"]))].append(entry)
+            self._by_key[entry["key"]].append(entry)
+        self._cursors: Dict[Any, "itertools.cycle"] = {}
+        self._bodies: Dict[str, bytes] = {}
+        logger.info(f"[Replay] Loaded {sum(map(len, self._by_key.values()))} exchanges from {directory}")
+
+    @staticmethod
+    def _form_key(data: Any) -> str:
+        return json.dumps(data, ensure_ascii=False, sort_keys=True)
+
+    def _next(self, index: Dict[Any, List[dict]], key: Any) -> Optional[dict]:
+        entries = index.get(key)
+        if not entries:
+            return None
+        cursor = self._cursors.get((id(index), key))
+        if cursor is None:
+            cursor = self._cursors[(id(index), key)] = itertools.cycle(entries)
+        return next(cursor)
+
+    def _match(self, request: httpx.Request) -> Optional[dict]:
+        params = self.redactor.redact_fields(dict(request.url.params))
+        key = upstream_key(request.method, str(request.url), params)
+        content = request.content
+        if "application/x-www-form-urlencoded" in request.headers.get("Content-Type", ""):
+            data = self.redactor.redact_form(dict(parse_qsl(content.decode("utf-8"))))
+        else:
+            data = self.redactor.redact_form(content.decode("utf-8")) if content else None
+        entry = self._next(self._exact, (key, self._form_key(data)))
+        if entry is None and not self.strict:
+            entry = self._next(self._by_key, key)
+        return entry
+
+    def _body(self, sha: str) -> bytes:
+        body = self._bodies.get(sha)
+        if body is None:
+            body = self._bodies[sha] = load_body(self.directory, sha)
+        return body
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self._match(request)
+        if entry is None:
+            return httpx.Response(404, text="No recorded exchange", request=request)
+        if self.timing_scale > 0:
+            await asyncio.sleep(entry["elapsed"] * self.timing_scale)
+        headers = [("Content-Type", entry["content_type"])] if entry["content_type"] else []
+        headers += [("Set-Cookie", f"{name}={value}; Path=/") for name, value in entry["cookies"].items()]
+        return httpx.Response(entry["status"], headers=headers, content=self._body(entry["body"]), request=request)
+
+
+recorder = Recorder(settings.RECORD_DIR, Redactor(settings.RECORD_REDACT_FIELDS, settings.RECORD_SALT))
@@ -0,0 +1,230 @@
+# app/core/stats.py
+
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Максимум значений латентности, хранимых в одной корзине (reservoir sampling)
+MAX_SAMPLES_PER_BUCKET = 256
+
+# Доля ошибок EVMIAS за окно, после которой сервис считается деградировавшим
+DEGRADED_ERROR_RATE = 0.2
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _Bucket:
+    __slots__ = ("start", "count", "errors", "seen", "samples")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.count = 0
+        self.errors = 0
+        self.seen = 0
+        self.samples: List[float] = []
+
+    def add(self, value: Optional[float], error: bool) -> None:
+        self.count += 1
+        if error:
+            self.errors += 1
+        if value is None:
+            return
+        self.seen += 1
+        if len(self.samples) < MAX_SAMPLES_PER_BUCKET:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.seen)
+            if i < MAX_SAMPLES_PER_BUCKET:
+                self.samples[i] = value
+
+
+class RollingWindow:
+    """
+    Кольцевой буфер корзин по `bucket_seconds` секунд.
+    Хранит число событий, ошибок и выборку значений для перцентилей.
+    """
+
+    def __init__(self, bucket_seconds: int, size: int):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self._buckets: List[Optional[_Bucket]] = [None] * size
+
+    def _bucket(self, now: float) -> _Bucket:
+        start = int(now // self.bucket_seconds) * self.bucket_seconds
+        index = (start // self.bucket_seconds) % self.size
+        bucket = self._buckets[index]
+        if bucket is None or bucket.start != start:
+            bucket = self._buckets[index] = _Bucket(start)
+        return bucket
+
+    def record(self, value: Optional[float] = None, error: bool = False, now: Optional[float] = None) -> None:
+        self._bucket(now if now is not None else time.time()).add(value, error)
+
+    def _live_buckets(self, now: float) -> List[_Bucket]:
+        oldest = now - self.bucket_seconds * self.size
+        return sorted(
+            (b for b in self._buckets if b is not None and b.start > oldest),
+            key=lambda b: b.start,
+        )
+
+    def summary(self, now: Optional[float] = None) -> dict:
+        now = now if now is not None else time.time()
+        buckets = self._live_buckets(now)
+        count = sum(b.count for b in buckets)
+        errors = sum(b.errors for b in buckets)
+        samples = sorted(v for b in buckets for v in b.samples)
+        return {
+            "count": count,
+            "rate": round(count / (self.bucket_seconds * self.size), 3),
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "p50": _percentile(samples, 0.50),
+            "p95": _percentile(samples, 0.95),
+            "p99": _percentile(samples, 0.99),
+        }
+
+    def series(self, now: Optional[float] = None) -> List[dict]:
+        """Поминутная (по корзинам) история для графиков дашборда."""
+        now = now if now is not None else time.time()
+        result = []
+        for bucket in self._live_buckets(now):
+            samples = sorted(bucket.samples)
+            result.append({
+                "t": bucket.start,
+                "rate": round(bucket.count / self.bucket_seconds, 3),
+                "errors": bucket.errors,
+                "p50": _percentile(samples, 0.50),
+                "p95": _percentile(samples, 0.95),
+                "p99": _percentile(samples, 0.99),
+            })
+        return result
+
+
+class RollingStats:
+    """
+    Скользящая статистика воркера для живой панели дашборда.
+    Наполняется подписками на метрики из `app.core.metrics`, поэтому не требует
+    отдельной инструментации в маршрутах и пайплайнах.
+    """
+
+    def __init__(self, bucket_seconds: int, size: int):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self._windows: Dict[Tuple[str, str], RollingWindow] = {}
+
+    def window(self, category: str, key: str) -> RollingWindow:
+        window = self._windows.get((category, key))
+        if window is None:
+            window = self._windows[(category, key)] = RollingWindow(self.bucket_seconds, self.size)
+        return window
+
+    def record(self, category: str, key: str, value: Optional[float] = None, error: bool = False) -> None:
+        self.window(category, key).record(value, error)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        data: Dict[str, Dict[str, dict]] = {}
+        for (category, key), window in sorted(self._windows.items()):
+            entry = window.summary(now)
+            if category in ("endpoint", "modality"):
+                entry["series"] = window.series(now)
+            data.setdefault(category, {})[key] = entry
+
+        upstream = [w.summary(now) for (c, _), w in self._windows.items() if c == "upstream"]
+        upstream_count = sum(s["count"] for s in upstream)
+        upstream_errors = sum(s["errors"] for s in upstream)
+        error_rate = upstream_errors / upstream_count if upstream_count else 0.0
+
+        return {
+            "pid": os.getpid(),
+            "window_seconds": self.bucket_seconds * self.size,
+            "bucket_seconds": self.bucket_seconds,
+            "status": "DEGRADED" if error_rate > DEGRADED_ERROR_RATE else "ONLINE",
+            "upstream_error_rate": round(error_rate, 4),
+            **data,
+        }
+
+
+rolling_stats = RollingStats(settings.STATS_BUCKET_SECONDS, settings.STATS_BUCKETS)
+
+
+def _on_http_request(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("endpoint", labels["path"], value, error=labels["status"].startswith("5"))
+
+
+def _on_pipeline(value: float, labels: Dict[str, str]) -> None:
+    if labels["stage"] == "get_patient_tests":
+        rolling_stats.record("modality", labels["modality"], value)
+
+
+def _on_upstream(value: float, labels: Dict[str, str]) -> None:
+    status = labels["status"]
+    rolling_stats.record("upstream", labels["method"], value, error=not status.startswith(("2", "3")))
+
+
+def _on_cookie_refresh(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("cookies", "refreshes", error=labels["result"] != "success")
+
+
+def _on_loop_lag(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("loop", "lag", value, error=value >= settings.LOOP_BLOCK_THRESHOLD)
+
+
+def _on_rate_limit_wait(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("rate_limit", f"{labels['bucket']}.wait", value)
+
+
+def _on_rate_limit_rejected(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("rate_limit", f"{labels['bucket']}.rejected", error=True)
+
+
+def _on_hedge(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("hedging", f"{labels['method']}.{labels['result']}")
+
+
+def _on_cache(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("cache", f"{labels['cache']}.{labels['result']}")
+
+
+def _on_client_disconnect(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("cancellations", "client_disconnects")
+
+
+def _on_cancelled_tasks(value: float, labels: Dict[str, str]) -> None:
+    window = rolling_stats.window("cancellations", f"{labels['reason']}.tasks")
+    for _ in range(int(value)):
+        window.record()
+
+
+def _on_admission(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("admission", f"{labels['priority']}.{labels['result']}", error=labels["result"] != "admitted")
+
+
+def _on_admission_wait(value: float, labels: Dict[str, str]) -> None:
+    rolling_stats.record("admission", f"{labels['priority']}.wait", value)
+
+
+metrics.HTTP_REQUEST_SECONDS.subscribe(_on_http_request)
+metrics.PIPELINE_SECONDS.subscribe(_on_pipeline)
+metrics.UPSTREAM_REQUEST_SECONDS.subscribe(_on_upstream)
+metrics.COOKIE_REFRESHES_TOTAL.subscribe(_on_cookie_refresh)
+metrics.LOOP_LAG_SECONDS.subscribe(_on_loop_lag)
+metrics.CACHE_REQUESTS_TOTAL.subscribe(_on_cache)
+metrics.HEDGED_REQUESTS_TOTAL.subscribe(_on_hedge)
+metrics.RATE_LIMIT_WAIT_SECONDS.subscribe(_on_rate_limit_wait)
+metrics.RATE_LIMIT_REJECTED_TOTAL.subscribe(_on_rate_limit_rejected)
+metrics.CLIENT_DISCONNECTS_TOTAL.subscribe(_on_client_disconnect)
+metrics.CANCELLED_TASKS_TOTAL.subscribe(_on_cancelled_tasks)
+metrics.ADMISSION_REQUESTS_TOTAL.subscribe(_on_admission)
+metrics.ADMISSION_WAIT_SECONDS.subscribe(_on_admission_wait)
@@ -0,0 +1,177 @@
+# app/core/tracing.py
+
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+SERVICE_NAME = "medical-extractor"
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_trace_var: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_span_var: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    """Все спаны одного HTTP-запроса к сервису."""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+
+    def server_timing(self) -> str:
+        """
+        Сводка для заголовка `Server-Timing`: для каждого типа спана —
+        время от начала первого до конца последнего и количество спанов.
+        """
+        groups: Dict[str, List[Span]] = {}
+        for span in self.spans:
+            if span.end_ns is not None:
+                groups.setdefault(span.name, []).append(span)
+
+        entries = []
+        for name, spans in groups.items():
+            wall_ms = (max(s.end_ns for s in spans) - min(s.start_ns for s in spans)) / 1e6
+            entries.append(f'{name};dur={wall_ms:.1f};desc="n={len(spans)}"')
+        return ", ".join(entries)
+
+    def to_otlp(self) -> dict:
+        """Трейс в формате OTLP/JSON (совместим с OpenTelemetry Collector, Jaeger, Tempo)."""
+
+        def attribute(key: str, value: Any) -> dict:
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for span in self.spans:
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            })
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    attribute("service.name", SERVICE_NAME),
+                    attribute("process.pid", os.getpid()),
+                    attribute("request.id", self.request_id),
+                ]},
+                "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": spans}],
+            }]
+        }
+
+
+def make_request_id(incoming: Optional[str] = None) -> str:
+    """Использует `X-Request-ID` клиента, если он корректен, иначе генерирует новый."""
+    if incoming and _REQUEST_ID_RE.match(incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+def start_trace(request_id: str) -> Trace:
+    trace = Trace(request_id)
+    request_id_var.set(request_id)
+    _trace_var.set(trace)
+    _span_var.set(None)
+    return trace
+
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """
+    Открывает спан внутри текущего трейса. Вне запроса (нет трейса) ничего не делает.
+    Вложенность определяется через contextvars, поэтому корректно работает с `asyncio.gather`.
+    """
+    trace = _trace_var.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _span_var.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    trace.spans.append(current)
+    token = _span_var.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _span_var.reset(token)
+
+
+def _trace_path(request_id: str) -> Path:
+    return Path(settings.TRACE_DIR) / f"{request_id}.json"
+
+
+def save_trace(trace: Trace) -> Path:
+    """Сохраняет трейс в `TRACE_DIR` в формате OTLP/JSON."""
+    path = _trace_path(trace.request_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(trace.to_otlp(), ensure_ascii=False), encoding="utf-8")
+    logger.info(f"[Tracing] Trace saved to {path}")
+    return path
+
+
+def find_trace(request_id: str) -> Optional[Path]:
+    if not _REQUEST_ID_RE.match(request_id):
+        return None
+    path = _trace_path(request_id)
+    return path if path.exists() else None
+
+
+def _add_request_id(record: dict) -> None:
+    request_id = request_id_var.get()
+    if request_id:
+        record["extra"]["request_id"] = f"[{request_id}] "
+
+
+logger.configure(patcher=_add_request_id)
@@ -0,0 +1,154 @@
+# app/core/warmup.py
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core import metrics, ratelimit
+from app.core.config import get_settings
+from app.core.httpx_client import HTTPXClient
+from app.core.logger import logger
+
+settings = get_settings()
+
+# Небольшой протокол со всеми ветками санитайзера: script/style, служебные div, атрибуты, таблица
+SAMPLE_REPORT = (
+    "<html><head><meta charset='utf-8'><style>p{color:red}</style><script>var a=1;</script></head><body>"
+    "<div class='parametervalue'>x</div><div><span>Заключение:</span> <b style='x'>норма</b></div>"
+    "<table class='t' id='r'><tr><td data-mce-style='x'>Гемоглобин</td><td>140</td></tr></table>"
+    "<form><input name='q'></form></body></html>"
+)
+
+# Состояния компонентов: pending → running → ready | failed | partial | skipped
+READY_STATES = {"ready", "skipped"}
+
+
+class Warmup:
+    """
+    Прогрев воркера после старта и его готовность для балансировщика.
+
+    Компоненты:
+    - `session` — валидные куки EVMIAS (проверка или вход); без них воркер не готов, прогрев повторяется;
+    - `connections` — заранее открытые соединения пула HTTPX к EVMIAS (неудача не мешает готовности);
+    - `sanitizer` — первый прогон BeautifulSoup/lxml/htmlmin на образце протокола;
+    - `caches` — префетч по плану (`WARMUP_PRIME_CACHES`); не дольше `WARMUP_PRIME_TIMEOUT`,
+      после чего продолжается в фоне, а воркер считается готовым.
+    """
+
+    def __init__(self):
+        self.components: Dict[str, dict] = {
+            name: {"state": "pending", "seconds": None, "error": None}
+            for name in ("session", "connections", "sanitizer", "caches")
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._prime: Optional[asyncio.Future] = None
+        self._cookies: Optional[dict] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._prime):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._prime = None
+
+    async def _step(self, name: str, step: Callable[[], Awaitable[str]]) -> str:
+        component = self.components[name]
+        component["state"], component["error"] = "running", None
+        start = time.perf_counter()
+        try:
+            component["state"] = await step()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            component["state"], component["error"] = "failed", str(e)
+            logger.warning(f"[Warmup] {name} failed: {e}")
+        component["seconds"] = round(time.perf_counter() - start, 3)
+        metrics.WARMUP_SECONDS.observe(component["seconds"], component=name, state=component["state"])
+        return component["state"]
+
+    async def _run(self) -> None:
+        start = time.perf_counter()
+        await self._step("sanitizer", self._warm_sanitizer)
+        # Без сессии остальное бессмысленно: повторяем, пока EVMIAS не ответит
+        while await self._step("session", self._warm_session) != "ready":
+            await asyncio.sleep(settings.WARMUP_RETRY_INTERVAL)
+        await self._step("connections", self._warm_connections)
+        await self._step("caches", self._warm_caches)
+        logger.info(f"[Warmup] Worker {os.getpid()} ready in {time.perf_counter() - start:.2f}s")
+
+    async def _warm_sanitizer(self) -> str:
+        from app.services.medtest.pipeline import parse_html_test_result
+
+        if not await parse_html_test_result(SAMPLE_REPORT):
+            raise RuntimeError("Sanitizer returned an empty result")
+        return "ready"
+
+    async def _warm_session(self) -> str:
+        from app.services.cookies.manager import cookie_manager
+
+        self._cookies = await cookie_manager.get_valid_cookies()
+        if not self._cookies:
+            raise RuntimeError("No valid EVMIAS cookies")
+        return "ready"
+
+    async def _warm_connections(self) -> str:
+        if settings.REPLAY_DIR or settings.WARMUP_CONNECTIONS <= 0:
+            return "skipped"
+        from app.services.cookies.cookies import SESSION_CHECK_DATA, SESSION_CHECK_PARAMS
+
+        # Параллельные легкие запросы открывают соединения (TCP + TLS), которые остаются в пуле.
+        # Это вызов проверки сессии: токены берутся из корзины session, лимит входа (auth) не тратится
+        with ratelimit.background():
+            responses = await asyncio.gather(*(
+                HTTPXClient.fetch(
+                    url=settings.BASE_URL, method="POST", params=SESSION_CHECK_PARAMS,
+                    cookies=self._cookies, data=SESSION_CHECK_DATA,
+                )
+                for _ in range(settings.WARMUP_CONNECTIONS)
+            ), return_exceptions=True)
+        opened = sum(1 for r in responses if not isinstance(r, Exception))
+        if not opened:
+            raise RuntimeError(f"No connections opened: {responses[0]}")
+        return "ready" if opened == len(responses) else "partial"
+
+    async def _warm_caches(self) -> str:
+        if not settings.WARMUP_PRIME_CACHES:
+            return "skipped"
+        from app.services.prefetch.manager import prefetch_scheduler
+
+        self._prime = asyncio.ensure_future(prefetch_scheduler.run_once(force=True))
+        try:
+            await asyncio.wait_for(asyncio.shield(self._prime), settings.WARMUP_PRIME_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Не держим воркер неготовым: прогрев кэшей продолжается в фоне
+            return "partial"
+        return "ready"
+
+    def skip(self) -> None:
+        """Прогрев выключен (`WARMUP_ENABLED=false`): воркер готов сразу."""
+        for component in self.components.values():
+            component["state"] = "skipped"
+
+    def is_ready(self) -> bool:
+        states = {name: c["state"] for name, c in self.components.items()}
+        return (
+            states["session"] in READY_STATES
+            and states["sanitizer"] in READY_STATES
+            # Соединения и кэши не обязательны: важно лишь, что их прогрев завершен
+            and states["connections"] not in ("pending", "running")
+            and states["caches"] not in ("pending", "running")
+        )
+
+    def status(self) -> dict:
+        return {"ready": self.is_ready(), "pid": os.getpid(), "components": self.components}
+
+
+warmup = Warmup()
@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Выгрузке не нужны кэши воркера: каждый документ читается один раз, память остается ограниченной
+os.environ.setdefault("DOCUMENT_CACHE_SIZE", "0")
+os.environ.setdefault("PATIENT_CACHE_SIZE", "0")
+os.environ.setdefault("LOOP_MONITOR_ENABLED", "false")
+
+from app.core.logger import logger  # noqa: E402
+from app.export.runner import load_patients, run_export  # noqa: E402
+from app.export.writers import Checkpoint, CsvWriter, NdjsonWriter, ParquetWriter  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Выгрузка результатов пациентов из EVMIAS без HTTP API (продолжается после прерывания)"
+    )
+    parser.add_argument("patients", type=Path, help="список пациентов: JSON или CSV (last_name,first_name,middle_name,birthday)")
+    parser.add_argument("-o", "--output", type=Path, required=True,
+                        help="файл NDJSON / CSV или каталог частей Parquet")
+    parser.add_argument("--format", choices=("ndjson", "csv", "parquet"), default="ndjson",
+                        help="ndjson — полные записи с протоколами; csv и parquet — метаданные документов")
+    parser.add_argument("--concurrency", type=int, default=4, help="пациентов одновременно")
+    parser.add_argument("--time-budget", type=float, default=120.0, help="бюджет времени на пациента, секунды (0 — без ограничения)")
+    parser.add_argument("--priority", choices=("background", "normal"), default="background",
+                        help="приоритет в лимите запросов к EVMIAS относительно интерактивных запросов")
+    parser.add_argument("--checkpoint", type=Path, help="журнал выгруженных пациентов (по умолчанию рядом с выходом)")
+    parser.add_argument("--restart", action="store_true", help="начать заново, игнорируя журнал")
+    parser.add_argument("--batch-rows", type=int, default=5000, help="строк в части Parquet")
+    args = parser.parse_args()
+
+    patients = load_patients(args.patients)
+    checkpoint_path = args.checkpoint or args.output.with_name(args.output.name + ".checkpoint")
+    checkpoint = Checkpoint(checkpoint_path, restart=args.restart)
+    try:
+        if args.format == "parquet":
+            writer = ParquetWriter(args.output, checkpoint, args.batch_rows)
+        elif args.format == "csv":
+            writer = CsvWriter(args.output, checkpoint)
+        else:
+            writer = NdjsonWriter(args.output, checkpoint)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    try:
+        stats = asyncio.run(run_export(
+            patients, writer, checkpoint.done, args.concurrency, args.time_budget or None,
+            background=args.priority == "background",
+        ))
+    except KeyboardInterrupt:
+        logger.warning(f"[Export] Interrupted; run again to continue from {checkpoint_path}")
+        return 130
+    except Exception as e:
+        logger.error(f"[Export] Failed: {e}; run again to continue from {checkpoint_path}")
+        return 1
+    finally:
+        writer.close()
+        checkpoint.close()
+    logger.info(f"[Export] Done: {stats}")
+    if stats["incomplete"]:
+        logger.warning(f"[Export] {stats['incomplete']} patients incomplete; run again to retry them")
+        return 3
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core import deadline, ratelimit
+from app.core.cache_backends import cache_backend
+from app.core.httpx_client import HTTPXClient
+from app.core.logger import logger
+from app.models.patient import PatientSearchRequest
+from app.services.analytes.manager import analyte_index
+from app.services.cookies.manager import cookie_manager
+from app.services.functional_tests import pipeline as functional_tests_pipeline
+from app.services.medtest import pipeline as medtest_pipeline
+from app.services.ultrasound_scan import pipeline as ultrasound_scan_pipeline
+from app.services.x_ray import pipeline as x_ray_pipeline
+
+# Модальности под теми же именами, что и в ответе /api/complex/person
+PIPELINES = {
+    "medtests": medtest_pipeline,
+    "ultrasound_scan": ultrasound_scan_pipeline,
+    "functional_tests": functional_tests_pipeline,
+    "x_ray": x_ray_pipeline,
+}
+
+# Как часто писать прогресс в лог, пациентов
+PROGRESS_EVERY = 25
+
+
+def load_patients(path: Path) -> List[PatientSearchRequest]:
+    """
+    Список пациентов: JSON (список или `{"patients": [...]}`) или CSV с заголовком
+    `last_name,first_name,middle_name,birthday` (разделитель `,` или `;`).
+    """
+    text = path.read_text(encoding="utf-8-sig")
+    if path.suffix.lower() == ".csv":
+        dialect = csv.Sniffer().sniff(text.splitlines()[0], delimiters=",;")
+        rows = [{k: (v or None) for k, v in row.items()} for row in csv.DictReader(io.StringIO(text), dialect=dialect)]
+    else:
+        data = json.loads(text)
+        rows = data if isinstance(data, list) else data.get("patients", [])
+    return [PatientSearchRequest(**row) for row in rows]
+
+
+def patient_key(patient: PatientSearchRequest) -> str:
+    return "|".join((patient.last_name.lower(), patient.first_name.lower(),
+                     (patient.middle_name or "").lower(), patient.birthday))
+
+
+async def export_patient(patient: PatientSearchRequest, time_budget: Optional[float]) -> Dict[str, Any]:
+    """Результаты пациента по всем модальностям в той же форме, что и `result` ответа /api/complex/person."""
+    cookies = await cookie_manager.get_valid_cookies()
+    if not cookies:
+        raise RuntimeError("Could not authenticate with EVMIAS")
+
+    if time_budget:
+        deadline.set_deadline(time_budget)
+    try:
+        results, timed_out = await deadline.gather_within_deadline(
+            *(pipeline.get_patient_tests(
+                cookies, patient.last_name, patient.first_name, patient.middle_name, patient.birthday
+            ) for pipeline in PIPELINES.values()),
+            stage="export",
+        )
+        # Пайплайн, сам прервавшийся по дедлайну, возвращает None без отмены — проверяем бюджет до его сброса
+        timed_out = timed_out or deadline.expired()
+    finally:
+        deadline.clear_deadline()
+
+    result, incomplete, person = {}, {}, None
+    for modality, value in zip(PIPELINES, results):
+        if isinstance(value, Exception):
+            logger.error(f"[Export] {modality} failed: {value}")
+            incomplete[modality], result[modality] = True, None
+            continue
+        incomplete[modality] = value.pop("incomplete", False) if value is not None else timed_out
+        if value is not None:
+            person = person or value.get("person")
+            value.pop("person", None)
+        result[modality] = value
+    return {
+        "patient": patient.model_dump(),
+        "person": person,
+        "found": any(value is not None for value in result.values()),
+        "result": result,
+        "incomplete": incomplete,
+    }
+
+
+async def run_export(
+        patients: List[PatientSearchRequest],
+        writer,
+        done: set,
+        concurrency: int,
+        time_budget: Optional[float],
+        background: bool,
+) -> Dict[str, int]:
+    """
+    Выгружает пациентов, которых нет в `done`: не больше `concurrency` одновременно, запись — по мере
+    готовности через ограниченную очередь, поэтому в памяти не больше ~2 * `concurrency` записей.
+    Пациент, у которого хотя бы одна модальность не загрузилась полностью, не записывается и не попадает
+    в журнал — повторный запуск выгрузит его заново (`incomplete` в статистике).
+    """
+    todo = [patient for patient in patients if patient_key(patient) not in done]
+    stats = {
+        "total": len(patients), "skipped": len(patients) - len(todo), "exported": 0, "not_found": 0, "incomplete": 0,
+    }
+    if not todo:
+        return stats
+    logger.info(f"[Export] {len(todo)} patients to export ({stats['skipped']} already done)")
+
+    await HTTPXClient.initialize()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    pending = iter(todo)
+    start = time.perf_counter()
+
+    async def produce() -> None:
+        # Фоновый приоритет: выгрузка не отнимает лимит EVMIAS у запросов врачей на этом хосте
+        with ratelimit.background() if background else nullcontext():
+            for patient in pending:
+                record = await export_patient(patient, time_budget)
+                await queue.put((patient_key(patient), record))
+
+    async def consume() -> None:
+        for processed in range(1, len(todo) + 1):
+            key, record = await queue.get()
+            if any(record["incomplete"].values()):
+                # Неполная запись (бюджет времени, ошибка модальности) не должна выглядеть как «не найден»
+                stats["incomplete"] += 1
+                logger.warning(f"[Export] Incomplete results ({record['incomplete']}), left for the next run")
+            else:
+                await asyncio.to_thread(writer.write, key, record)
+                stats["exported"] += 1
+                stats["not_found"] += not record["found"]
+            if processed % PROGRESS_EVERY == 0 or processed == len(todo):
+                rate = processed / (time.perf_counter() - start)
+                logger.info(f"[Export] {processed}/{len(todo)} patients ({rate:.2f}/s), {stats['incomplete']} incomplete")
+
+    producers = [asyncio.create_task(produce()) for _ in range(max(1, concurrency))]
+    consumer = asyncio.create_task(consume())
+    try:
+        # Ошибка любого производителя (например, авторизации) останавливает выгрузку; журнал позволит продолжить
+        await asyncio.gather(*producers, consumer)
+    finally:
+        for task in (*producers, consumer):
+            task.cancel()
+        await asyncio.gather(*producers, consumer, return_exceptions=True)
+        await HTTPXClient.shutdown()
+        await cache_backend.close()
+        await analyte_index.close()
+    return stats
@@ -0,0 +1,175 @@
+import csv
+import io
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.core.cache import content_digest
+
+# Колонки метаданных документов (CSV и Parquet): по строке на протокол
+DOCUMENT_COLUMNS = (
+    "last_name", "first_name", "middle_name", "birthday", "modality", "test_date",
+    "service", "analyzer_name", "test_code", "test_name", "result_sha256", "result_chars",
+)
+
+
+def document_rows(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Строки метаданных по записи пациента; тела протоколов заменяются хэшем и длиной."""
+    patient = record["patient"]
+    rows = []
+    for modality, result in record["result"].items():
+        if not result:
+            continue
+        for test_date, tests in result["tests_with_results"].items():
+            for test in tests:
+                body = test.get("test_result") or ""
+                rows.append({
+                    "last_name": patient["last_name"],
+                    "first_name": patient["first_name"],
+                    "middle_name": patient["middle_name"],
+                    "birthday": patient["birthday"],
+                    "modality": modality,
+                    "test_date": test_date,
+                    "service": test.get("service"),
+                    "analyzer_name": test.get("analyzer_name"),
+                    "test_code": test.get("test_code"),
+                    "test_name": test.get("test_name"),
+                    "result_sha256": getattr(body, "digest", None) or content_digest(body),
+                    "result_chars": len(body),
+                })
+    return rows
+
+
+class Checkpoint:
+    """
+    Журнал выгруженных пациентов (JSONL). Строка пишется только после того, как данные пациента
+    записаны на диск, вместе с размером выходного файла или именем готовой части.
+    """
+
+    def __init__(self, path: Path, restart: bool = False):
+        self.path = path
+        self.done: Set[str] = set()
+        self.offset: Optional[int] = None
+        self.parts: Set[str] = set()
+        if restart:
+            path.unlink(missing_ok=True)
+        elif path.exists():
+            for line in path.read_text(encoding="utf-8").splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # строка, оборванная при прерывании
+                self.done.update(entry["keys"])
+                self.offset = entry.get("offset", self.offset)
+                if entry.get("part"):
+                    self.parts.add(entry["part"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("a", encoding="utf-8")
+
+    def record(self, keys: Iterable[str], **extra: Any) -> None:
+        self._file.write(json.dumps({"keys": list(keys), **extra}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _StreamWriter:
+    """Построчная запись с продолжением: при возобновлении файл обрезается до размера из журнала."""
+
+    def __init__(self, path: Path, checkpoint: Checkpoint):
+        self.path = path
+        self.checkpoint = checkpoint
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("a+b")
+        self._file.truncate(checkpoint.offset or 0)
+        self._file.seek(0, os.SEEK_END)
+
+    def _lines(self, record: Dict[str, Any]) -> bytes:
+        raise NotImplementedError
+
+    def write(self, key: str, record: Dict[str, Any]) -> None:
+        self._file.write(self._lines(record))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.checkpoint.record([key], offset=self._file.tell())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class NdjsonWriter(_StreamWriter):
+    """Полные записи пациентов, по одной JSON-строке на пациента."""
+
+    def _lines(self, record: Dict[str, Any]) -> bytes:
+        return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class CsvWriter(_StreamWriter):
+    """Метаданные документов в CSV."""
+
+    def __init__(self, path: Path, checkpoint: Checkpoint):
+        super().__init__(path, checkpoint)
+        if self._file.tell() == 0:
+            self._file.write((",".join(DOCUMENT_COLUMNS) + "\r\n").encode("utf-8"))
+
+    def _lines(self, record: Dict[str, Any]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=DOCUMENT_COLUMNS)
+        writer.writerows(document_rows(record))
+        return buffer.getvalue().encode("utf-8")
+
+
+class ParquetWriter:
+    """
+    Метаданные документов в Parquet (нужен `pyarrow`): каталог частей `documents-NNNNN.parquet`.
+    Строки копятся до `batch_rows`, часть записывается атомарно и только затем отмечается в журнале;
+    части, не попавшие в журнал (прерванный запуск), при возобновлении удаляются.
+    """
+
+    def __init__(self, path: Path, checkpoint: Checkpoint, batch_rows: int = 5000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow") from None
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self.path = path
+        self.checkpoint = checkpoint
+        self.batch_rows = batch_rows
+        path.mkdir(parents=True, exist_ok=True)
+        for part in path.glob("documents-*.parquet"):
+            if part.name not in checkpoint.parts:
+                part.unlink()
+        self._next_part = len(checkpoint.parts) + 1
+        self._rows: List[Dict[str, Any]] = []
+        self._keys: List[str] = []
+
+    def write(self, key: str, record: Dict[str, Any]) -> None:
+        self._rows.extend(document_rows(record))
+        self._keys.append(key)
+        if len(self._rows) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._keys:
+            return
+        name = f"documents-{self._next_part:05d}.parquet"
+        if self._rows:
+            table = self._pa.Table.from_pylist(self._rows, schema=self._pa.schema(
+                [(column, self._pa.int64() if column == "result_chars" else self._pa.string())
+                 for column in DOCUMENT_COLUMNS]
+            ))
+            tmp = self.path / f".{name}.tmp"
+            self._pq.write_table(table, tmp)
+            os.replace(tmp, self.path / name)
+            self._next_part += 1
+            self.checkpoint.record(self._keys, part=name)
+        else:
+            self.checkpoint.record(self._keys)
+        self._rows, self._keys = [], []
+
+    def close(self) -> None:
+        self._flush()
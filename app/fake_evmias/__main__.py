@@ -0,0 +1,17 @@
+import argparse
+
+import uvicorn
+
+from app.fake_evmias.server import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный заменитель EVMIAS (настройки — переменные FAKE_EVMIAS_*)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from functools import lru_cache
+from typing import Dict, List
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class FakeEvmiasSettings(BaseSettings):
+    """
+    Настройки локального заменителя EVMIAS (переменные окружения с префиксом `FAKE_EVMIAS_`).
+
+    Пример:
+    ```
+    FAKE_EVMIAS_LATENCY_DISTRIBUTION=lognormal
+    FAKE_EVMIAS_LATENCY_MS=150
+    FAKE_EVMIAS_LATENCY_MS_BY_METHOD={"EvnXml.doLoadData": 400}
+    FAKE_EVMIAS_ERROR_RATE=0.02
+    FAKE_EVMIAS_SESSION_TTL=600
+    FAKE_EVMIAS_THROTTLE_RPS=50
+    ```
+    """
+    # Латентность: fixed | uniform | exponential | lognormal (LATENCY_MS — медиана/среднее)
+    LATENCY_DISTRIBUTION: str = "lognormal"
+    LATENCY_MS: float = 50.0
+    LATENCY_SIGMA: float = 0.5
+    LATENCY_MAX_MS: float = 30000.0
+    LATENCY_MS_BY_METHOD: Dict[str, float] = {}
+
+    # Доля запросов, завершающихся ошибкой, и возвращаемые статусы
+    ERROR_RATE: float = 0.0
+    ERROR_STATUSES: List[int] = [500, 502, 503]
+
+    # Время жизни сессии после входа, секунды (0 — бессрочно)
+    SESSION_TTL: float = 0.0
+
+    # Ограничение частоты на сессию (0 — без ограничения); сверх лимита — 429
+    THROTTLE_RPS: float = 0.0
+    THROTTLE_BURST: int = 20
+
+    # Синтетические данные: документов на модальность у пациента
+    DOCUMENTS_MIN: int = 5
+    DOCUMENTS_MAX: int = 40
+    SEED: int = 42
+
+    model_config = SettingsConfigDict(env_prefix="FAKE_EVMIAS_")
+
+
+@lru_cache()
+def get_fake_settings() -> FakeEvmiasSettings:
+    return FakeEvmiasSettings()
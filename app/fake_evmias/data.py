@@ -0,0 +1,209 @@
+"""
+Синтетические пациенты и протоколы для заменителя EVMIAS.
+Все данные детерминированы: один и тот же пациент и `EvnXml_id` всегда дают один и тот же ответ.
+"""
+
+import hashlib
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# LpuSection_uid из пайплайнов сервиса -> код модальности в EvnXml_id
+MODALITIES: Dict[str, int] = {
+    "3010101000003275": 1,  # функциональные тесты
+    "3010101000003273": 2,  # лабораторные анализы
+    "3010101000003274": 3,  # УЗИ
+    "3010101000003272": 4,  # рентгенография
+}
+
+MED_SERVICES = {
+    1: ("Отделение функциональной диагностики", "Электрокардиограф", "A05.10.006", "Регистрация электрокардиограммы"),
+    2: ("Клинико-диагностическая лаборатория", "Анализатор Sysmex XN-1000", "B03.016.003", "Общий (клинический) анализ крови"),
+    3: ("Кабинет ультразвуковой диагностики", "Аппарат УЗИ Philips EPIQ", "A04.16.001", "УЗИ органов брюшной полости"),
+    4: ("Рентгенологическое отделение", "Рентгеновский аппарат", "A06.09.007", "Рентгенография легких"),
+}
+
+# Аналит, единица, среднее, разброс, референсный интервал
+ANALYTES: List[Tuple[str, str, float, float, str]] = [
+    ("Гемоглобин", "г/л", 140.0, 12.0, "120 - 160"),
+    ("Эритроциты", "10^12/л", 4.7, 0.4, "4.0 - 5.5"),
+    ("Лейкоциты", "10^9/л", 6.5, 1.8, "4.0 - 9.0"),
+    ("Тромбоциты", "10^9/л", 250.0, 45.0, "180 - 320"),
+    ("Гематокрит", "%", 42.0, 3.5, "36 - 48"),
+    ("СОЭ", "мм/ч", 9.0, 5.0, "2 - 15"),
+    ("Глюкоза", "ммоль/л", 5.2, 0.7, "3.9 - 6.1"),
+    ("Креатинин", "мкмоль/л", 85.0, 14.0, "62 - 115"),
+    ("Мочевина", "ммоль/л", 5.5, 1.2, "2.5 - 8.3"),
+    ("АЛТ", "Ед/л", 24.0, 9.0, "0 - 41"),
+    ("АСТ", "Ед/л", 22.0, 7.0, "0 - 40"),
+    ("Холестерин общий", "ммоль/л", 5.1, 0.9, "0 - 5.2"),
+    ("Билирубин общий", "мкмоль/л", 12.0, 4.0, "3.4 - 20.5"),
+    ("С-реактивный белок", "мг/л", 3.0, 2.5, "0 - 5"),
+]
+
+FINDINGS = [
+    "Контуры ровные, четкие.",
+    "Эхогенность паренхимы не изменена, структура однородная.",
+    "Патологических образований не выявлено.",
+    "Сосудистый рисунок сохранен.",
+    "Свободной жидкости не определяется.",
+    "Размеры в пределах возрастной нормы.",
+    "Очаговых и инфильтративных изменений не выявлено.",
+    "Синусы свободны, диафрагма расположена обычно.",
+    "Ритм синусовый, правильный. ЧСС 72 уд/мин.",
+    "Электрическая ось сердца не отклонена.",
+]
+
+ORGANS = ["Печень", "Желчный пузырь", "Поджелудочная железа", "Селезенка", "Почки", "Легкие", "Сердце"]
+
+
+def _seed(*parts: str) -> int:
+    digest = hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+    return int(digest[:12], 16)
+
+
+def patient_seed(surname: str, firname: str, secname: Optional[str], birthday: str, seed: int) -> int:
+    """Числовой идентификатор пациента (до 7 знаков), используемый в `EvnXml_id`."""
+    key = (surname or "").upper(), (firname or "").upper(), (secname or "").upper(), birthday or ""
+    return _seed(str(seed), *key) % 10_000_000
+
+
+def make_evn_xml_id(patient: int, modality: int, index: int) -> str:
+    return str((patient * 10 + modality) * 1000 + index)
+
+
+def parse_evn_xml_id(evn_xml_id: str) -> Optional[Tuple[int, int, int]]:
+    """Раскладывает `EvnXml_id` на (пациент, модальность, номер документа)."""
+    try:
+        value = int(evn_xml_id)
+    except (TypeError, ValueError):
+        return None
+    index = value % 1000
+    modality = (value // 1000) % 10
+    patient = value // 10000
+    if modality not in MED_SERVICES:
+        return None
+    return patient, modality, index
+
+
+def _age(birthday: str) -> str:
+    try:
+        day, month, year = (int(p) for p in birthday.split("."))
+        born = date(year, month, day)
+    except (ValueError, AttributeError):
+        return ""
+    today = date.today()
+    return str(today.year - born.year - ((today.month, today.day) < (born.month, born.day)))
+
+
+def document_date(patient: int, modality: int, index: int) -> date:
+    """Дата документа: документы пациента распределены по последним трем годам, свежие — с меньшим номером."""
+    rng = random.Random(_seed("date", str(patient), str(modality)))
+    offsets = sorted(rng.randint(0, 3 * 365) for _ in range(index + 1))
+    return date.today() - timedelta(days=offsets[index])
+
+
+def search_rows(
+        lpu_section_uid: str,
+        surname: str,
+        firname: str,
+        secname: Optional[str],
+        birthday: str,
+        documents_min: int,
+        documents_max: int,
+        seed: int,
+) -> List[dict]:
+    """Строки ответа `Search/searchData` для синтетического пациента."""
+    modality = MODALITIES.get(lpu_section_uid)
+    if modality is None or not surname or not birthday:
+        return []
+
+    patient = patient_seed(surname, firname, secname, birthday, seed)
+    rng = random.Random(_seed("count", str(patient), str(modality)))
+    count = rng.randint(documents_min, max(documents_min, documents_max))
+    service, resource, code, name = MED_SERVICES[modality]
+
+    rows = []
+    for index in range(count):
+        rows.append({
+            "EvnUslugaPar_id": str(patient * 1000 + index),
+            "EvnXml_id": make_evn_xml_id(patient, modality, index),
+            "Person_Surname": surname.upper(),
+            "Person_Firname": (firname or "").upper(),
+            "Person_Secname": (secname or "").upper() or None,
+            "Person_Birthday": birthday,
+            "Person_Age": _age(birthday),
+            "EvnUslugaPar_setDate": document_date(patient, modality, index).strftime("%d.%m.%Y"),
+            "MedService_Name": service,
+            "Resource_Name": resource,
+            "Usluga_Code": code,
+            "Usluga_Name": name,
+        })
+    return rows
+
+
+def _wrap_parameter(title: str, value: str) -> str:
+    """Разметка параметра шаблона EVMIAS со служебными элементами, которые вычищает санитайзер."""
+    return (
+        f'<div class="template-parameter" id="param_{_seed(title) % 100000}" style="margin:2px 0">'
+        f'<span style="font-weight:bold" class="param-caption">{title}: </span>'
+        f'<span><span>{value}</span></span>'
+        f'<div class="parametervalue" data-mce-style="display:none">{value}</div>'
+        f'<div class="combobox-parameter"><select><option>{value}</option></select></div>'
+        f'</div>'
+    )
+
+
+def _lab_table(patient: int, index: int, rng: random.Random) -> str:
+    rows = []
+    for name, unit, mean, spread, reference in ANALYTES:
+        # Значения пациента колеблются вокруг собственного среднего
+        own_mean = mean + random.Random(_seed("mean", str(patient), name)).uniform(-spread, spread)
+        value = round(max(0.0, rng.gauss(own_mean, spread / 3)), 2 if mean < 20 else 1)
+        rows.append(
+            f'<tr class="row" style="height:18px"><td class="cell" style="width:40%">{name}</td>'
+            f'<td class="cell value" style="text-align:center"><span>{value}</span></td>'
+            f'<td class="cell">{unit}</td><td class="cell">{reference}</td></tr>'
+        )
+    return (
+        '<table class="lab-results" style="border-collapse:collapse;width:100%" border="1">'
+        '<tr><th>Показатель</th><th>Результат</th><th>Ед. изм.</th><th>Референсные значения</th></tr>'
+        + "".join(rows) + "</table>"
+    )
+
+
+def document_html(evn_xml_id: str) -> Optional[str]:
+    """HTML протокола `EvnXml/doLoadData`: мелкие, крупные и табличные документы."""
+    parsed = parse_evn_xml_id(evn_xml_id)
+    if parsed is None:
+        return None
+    patient, modality, index = parsed
+    rng = random.Random(_seed("doc", evn_xml_id))
+    service, resource, code, name = MED_SERVICES[modality]
+    doc_date = document_date(patient, modality, index).strftime("%d.%m.%Y")
+
+    parts = [
+        '<meta charset="utf-8"><style>.template-block{font-family:Arial}</style>',
+        '<script type="text/javascript">var EvnXml = {readonly: true};</script>',
+        f'<div class="template-block" id="block_{evn_xml_id}" style="padding:5px">',
+        f'<div class="header" style="text-align:center"><span><b>{service}</b></span></div>',
+        _wrap_parameter("Исследование", name),
+        _wrap_parameter("Дата", doc_date),
+        _wrap_parameter("Оборудование", resource),
+    ]
+
+    if modality == 2:
+        parts.append(_lab_table(patient, index, rng))
+    else:
+        # Каждый пятый документ — большой (много разделов), остальные — короткие
+        sections = rng.randint(8, 20) if rng.random() < 0.2 else rng.randint(1, 3)
+        organs = ORGANS if modality == 3 else ORGANS[-2:]
+        for i in range(sections):
+            organ = organs[i % len(organs)]
+            text = " ".join(rng.sample(FINDINGS, k=rng.randint(2, 5)))
+            parts.append(_wrap_parameter(organ, text))
+
+    parts.append(_wrap_parameter("Заключение", rng.choice(FINDINGS)))
+    parts.append('<form class="input-area"><input type="text" name="sign"></form>')
+    parts.append('<div class="input-area" style="display:none">&nbsp;</div></div>')
+    return "".join(parts)
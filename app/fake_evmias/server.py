@@ -0,0 +1,211 @@
+"""
+Локальный заменитель EVMIAS для нагрузочного и отказного тестирования.
+
+Реализует используемые сервисом эндпоинты:
+- `GET  /?c=portal&m=promed` — выдает PHPSESSID;
+- `POST /?c=main&m=index&method=Logon` — авторизует сессию;
+- `POST /ermp/servlets/dispatch.servlet` — выдает JSESSIONID;
+- `POST /?c=Common&m=getCurrentDateTime` — проверка сессии;
+- `POST /?c=Search&m=searchData` — синтетические документы пациента;
+- `POST /?c=EvnXml&m=doLoadData` — HTML протокола.
+
+Запуск отдельно: `python -m app.fake_evmias --port 9000` и `BASE_URL=http://localhost:9000/`.
+Запуск в процессе: `HTTPXClient.initialize(transport=fake_evmias_transport())`.
+"""
+
+import asyncio
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+
+from app.fake_evmias.config import FakeEvmiasSettings, get_fake_settings
+from app.fake_evmias.data import document_html, search_rows
+
+LOGIN_PAGE = "<html><head><title>ЕВМИАС</title></head><body><form id='login'>Вход в систему</form></body></html>"
+
+# Базовый URL для режима в процессе (значение BASE_URL сервиса)
+IN_PROCESS_BASE_URL = "http://evmias.local/"
+
+
+class _Session:
+    __slots__ = ("authorized", "login", "login_at", "tokens", "refilled_at")
+
+    def __init__(self, burst: int):
+        self.authorized = False
+        self.login: Optional[str] = None
+        self.login_at = 0.0
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+
+
+class FakeEvmias:
+    """Состояние заменителя: сессии, генератор задержек и ошибок, счетчики запросов."""
+
+    def __init__(self, settings: FakeEvmiasSettings):
+        self.settings = settings
+        self.sessions: Dict[str, _Session] = {}
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.rng = random.Random(settings.SEED)
+
+    def latency(self, method: str) -> float:
+        """Задержка ответа в секундах по выбранному распределению."""
+        s = self.settings
+        base = s.LATENCY_MS_BY_METHOD.get(method, s.LATENCY_MS)
+        if s.LATENCY_DISTRIBUTION == "fixed":
+            value = base
+        elif s.LATENCY_DISTRIBUTION == "uniform":
+            value = self.rng.uniform(0, 2 * base)
+        elif s.LATENCY_DISTRIBUTION == "exponential":
+            value = self.rng.expovariate(1 / base) if base > 0 else 0.0
+        else:
+            value = self.rng.lognormvariate(math.log(base), s.LATENCY_SIGMA) if base > 0 else 0.0
+        return min(value, s.LATENCY_MAX_MS) / 1000
+
+    def session(self, request: Request) -> Optional[_Session]:
+        session_id = request.cookies.get("PHPSESSID")
+        return self.sessions.get(session_id) if session_id else None
+
+    def is_authorized(self, session: Optional[_Session]) -> bool:
+        if session is None or not session.authorized:
+            return False
+        ttl = self.settings.SESSION_TTL
+        if ttl and time.monotonic() - session.login_at > ttl:
+            session.authorized = False
+            return False
+        return True
+
+    def throttled(self, session: Optional[_Session]) -> bool:
+        rps = self.settings.THROTTLE_RPS
+        if not rps or session is None:
+            return False
+        now = time.monotonic()
+        session.tokens = min(self.settings.THROTTLE_BURST, session.tokens + (now - session.refilled_at) * rps)
+        session.refilled_at = now
+        if session.tokens < 1:
+            return True
+        session.tokens -= 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "sessions": len(self.sessions),
+            "authorized_sessions": sum(1 for s in self.sessions.values() if self.is_authorized(s)),
+        }
+
+
+def create_app(settings: Optional[FakeEvmiasSettings] = None) -> FastAPI:
+    fake = FakeEvmias(settings or get_fake_settings())
+    app = FastAPI(title="Fake EVMIAS", docs_url="/_fake/docs", openapi_url="/_fake/openapi.json")
+    app.state.fake = fake
+
+    async def simulate(method: str, session: Optional[_Session]) -> Optional[Response]:
+        """Общая часть всех методов: счетчик, задержка, троттлинг и случайные ошибки."""
+        fake.requests[method] += 1
+        await asyncio.sleep(fake.latency(method))
+        if fake.throttled(session):
+            fake.errors[f"{method}:429"] += 1
+            return PlainTextResponse("Too Many Requests", status_code=429, headers={"Retry-After": "1"})
+        if fake.settings.ERROR_RATE and fake.rng.random() < fake.settings.ERROR_RATE:
+            status_code = fake.rng.choice(fake.settings.ERROR_STATUSES)
+            fake.errors[f"{method}:{status_code}"] += 1
+            return PlainTextResponse("Upstream error", status_code=status_code)
+        return None
+
+    @app.api_route("/", methods=["GET", "POST"])
+    async def dispatch(request: Request):
+        c, m = request.query_params.get("c"), request.query_params.get("m")
+        method = f"{c}.{m}"
+        form = dict(parse_qsl((await request.body()).decode("utf-8"))) if request.method == "POST" else {}
+        session = fake.session(request)
+
+        error = await simulate(method, session)
+        if error is not None:
+            return error
+
+        if method == "portal.promed":
+            session_id = uuid.uuid4().hex
+            fake.sessions[session_id] = _Session(fake.settings.THROTTLE_BURST)
+            response = HTMLResponse(LOGIN_PAGE)
+            response.set_cookie("PHPSESSID", session_id)
+            return response
+
+        if method == "main.index" and request.query_params.get("method") == "Logon":
+            if session is None or not form.get("login") or not form.get("psw"):
+                return JSONResponse({"success": False, "Error_Msg": "Неверный логин или пароль"})
+            session.authorized = True
+            session.login = form.get("login")
+            session.login_at = time.monotonic()
+            return JSONResponse({"success": True})
+
+        if not fake.is_authorized(session):
+            # Как и настоящая система: страница входа вместо JSON
+            fake.errors[f"{method}:expired"] += 1
+            return HTMLResponse(LOGIN_PAGE)
+
+        if method == "Common.getCurrentDateTime":
+            now = datetime.now()
+            return JSONResponse({"date": now.strftime("%d.%m.%Y"), "time": now.strftime("%H:%M:%S")})
+
+        if method == "Search.searchData":
+            rows = search_rows(
+                form.get("LpuSection_uid", ""), form.get("Person_Surname", ""), form.get("Person_Firname", ""),
+                form.get("Person_Secname"), form.get("Person_Birthday", ""),
+                fake.settings.DOCUMENTS_MIN, fake.settings.DOCUMENTS_MAX, fake.settings.SEED,
+            )
+            limit = int(form.get("limit", 100))
+            start = int(form.get("start", 0))
+            return JSONResponse({"data": rows[start:start + limit], "totalCount": len(rows)})
+
+        if method == "EvnXml.doLoadData":
+            html = document_html(form.get("EvnXml_id", ""))
+            if html is None:
+                return JSONResponse({"success": False, "Error_Msg": "Документ не найден"})
+            # Настоящая система отдает JSON с типом text/html
+            return Response(JSONResponse({"html": html}).body, media_type="text/html")
+
+        return PlainTextResponse("Unknown method", status_code=404)
+
+    @app.post("/ermp/servlets/dispatch.servlet")
+    async def gwt_dispatch(request: Request):
+        session = fake.session(request)
+        error = await simulate("dispatch.servlet", session)
+        if error is not None:
+            return error
+        response = PlainTextResponse("//OK[1,[\"ok\"],0,7]")
+        response.set_cookie("JSESSIONID", uuid.uuid4().hex.upper())
+        return response
+
+    @app.get("/_fake/stats")
+    async def get_stats():
+        return fake.stats()
+
+    @app.post("/_fake/config")
+    async def update_config(changes: dict):
+        """Меняет поведение на лету (например, долю ошибок во время нагрузочного теста)."""
+        fake.settings = fake.settings.model_copy(update=changes)
+        return fake.settings.model_dump()
+
+    @app.post("/_fake/expire-sessions")
+    async def expire_sessions():
+        for session in fake.sessions.values():
+            session.authorized = False
+        return fake.stats()
+
+    return app
+
+
+def fake_evmias_transport(settings: Optional[FakeEvmiasSettings] = None) -> httpx.ASGITransport:
+    """Транспорт httpx, обслуживающий запросы заменителем прямо в процессе (без сети)."""
+    return httpx.ASGITransport(app=create_app(settings))
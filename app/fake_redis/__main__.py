@@ -0,0 +1,21 @@
+import argparse
+import asyncio
+
+from app.fake_redis.server import serve
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный заменитель Redis для CACHE_BACKEND=redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--password", default=None)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка каждой команды")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.password, args.latency_ms))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
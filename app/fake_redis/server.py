@@ -0,0 +1,118 @@
+"""
+Локальный заменитель Redis для проверки общего кэша (`CACHE_BACKEND=redis`) без настоящего сервера.
+
+Понимает протокол RESP и команды, которые использует `RedisBackend`, и несколько служебных:
+PING, AUTH, SELECT, GET, SET (EX/PX), DEL, EXISTS, DBSIZE, FLUSHDB, QUIT.
+Данные живут в памяти процесса; `latency_ms` добавляет задержку к каждой команде (проверка таймаутов).
+
+Запуск: `python -m app.fake_redis --port 6390` и `CACHE_BACKEND=redis CACHE_REDIS_URL=redis://localhost:6390/0`.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class FakeRedis:
+    def __init__(self, password: Optional[str] = None, latency_ms: float = 0.0):
+        self.password = password
+        self.latency = latency_ms / 1000
+        self.databases: Dict[int, Dict[bytes, Tuple[Optional[float], bytes]]] = {}
+
+    def _db(self, index: int) -> Dict[bytes, Tuple[Optional[float], bytes]]:
+        return self.databases.setdefault(index, {})
+
+    def _get(self, db: Dict, key: bytes) -> Optional[bytes]:
+        item = db.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del db[key]
+            return None
+        return value
+
+    @staticmethod
+    def _reply(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if isinstance(value, Exception):
+            return b"-ERR %s\r\n" % str(value).encode()
+        return b"+%s\r\n" % str(value).encode()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.strip().split()  # inline-команда (например, из telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    def execute(self, args: List[bytes], state: dict):
+        command = args[0].upper()
+        if command == b"AUTH":
+            if self.password is None or args[-1].decode() == self.password:
+                state["authorized"] = True
+                return "OK"
+            return Exception("invalid password")
+        if not state["authorized"]:
+            return Exception("NOAUTH Authentication required.")
+        db = self._db(state["db"])
+        if command == b"PING":
+            return "PONG"
+        if command == b"SELECT":
+            state["db"] = int(args[1])
+            return "OK"
+        if command == b"GET":
+            return self._get(db, args[1])
+        if command == b"SET":
+            expires_at = None
+            options = [a.upper() for a in args[3:]]
+            for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+                if unit in options:
+                    expires_at = time.monotonic() + int(args[3 + options.index(unit) + 1]) * scale
+            db[args[1]] = (expires_at, args[2])
+            return "OK"
+        if command == b"DEL":
+            return sum(1 for key in args[1:] if db.pop(key, None) is not None)
+        if command == b"EXISTS":
+            return sum(1 for key in args[1:] if self._get(db, key) is not None)
+        if command == b"DBSIZE":
+            return len(db)
+        if command == b"FLUSHDB":
+            db.clear()
+            return "OK"
+        return Exception(f"unknown command '{command.decode()}'")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        state = {"db": 0, "authorized": self.password is None}
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if not args:
+                    break
+                if args[0].upper() == b"QUIT":
+                    writer.write(self._reply("OK"))
+                    break
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(self._reply(self.execute(args, state)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, password: Optional[str] = None, latency_ms: float = 0.0) -> None:
+    server = await asyncio.start_server(FakeRedis(password, latency_ms).handle, host, port)
+    async with server:
+        await server.serve_forever()
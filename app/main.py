@@ -1,27 +1,91 @@
-from contextlib import asynccontextmanager
+import asyncio
+import time
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from app.core import metrics, tracing
+from app.core.cache_backends import cache_backend
 from app.core.httpx_client import HTTPXClient
 from app.core.logger import logger
+from app.core.loop_monitor import loop_monitor
+from app.core.recorder import ReplayTransport
+from app.core.warmup import warmup
+from app.core.profiling import install_task_factory, worker_profiler
+from app.core.metrics import REGISTRY
+from app.core.config import get_settings
 from app.route import router as api_router
 from app.route.dashboard import router as dashboard_router
+from app.route.metrics import router as metrics_router
+from app.services.analytes.manager import analyte_index
+from app.services.cookies.manager import cookie_manager
+from app.services.prefetch.manager import prefetch_scheduler
+from app.services.watchlist.manager import watchlist_manager
+
+settings = get_settings()
+
+
+async def flush_metrics_periodically():
+    """Периодически сбрасывает метрики воркера на диск для агрегации в `/metrics`."""
+    while True:
+        await asyncio.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(REGISTRY.flush)
+        except Exception as e:
+            logger.error(f"[Metrics] Error flushing metrics: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):  # noqa
     """
     Управление жизненным циклом приложения:
-    - Инициализация HTTPXClient при старте
+    - Инициализация HTTPXClient при старте (или воспроизведение записи EVMIAS)
+    - Прогрев воркера: сессия, соединения, санитайзер, кэши (`/api/health/ready`)
+    - Периодический сброс метрик воркера
+    - Запуск монитора задержек event loop
+    - Фабрика задач для профилирования отдельных запросов
+    - Префетч карточек пациентов по плану
+    - Опрос наблюдаемых пациентов (в одном воркере хоста)
+    - Фоновая проверка простаивающих сессий EVMIAS
     - Закрытие HTTPXClient при завершении
     """
-    await HTTPXClient.initialize()  # Запускаем клиент
+    # Запускаем клиент; с REPLAY_DIR ответы EVMIAS берутся из записи
+    transport = ReplayTransport(settings.REPLAY_DIR, settings.REPLAY_TIMING_SCALE) if settings.REPLAY_DIR else None
+    await HTTPXClient.initialize(transport=transport)
     logger.info("HTTPXClient инициализирован")
+    if settings.WARMUP_ENABLED:
+        warmup.start()
+    else:
+        warmup.skip()
+    REGISTRY.cleanup()
+    metrics_task = asyncio.create_task(flush_metrics_periodically())
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    if settings.ADMIN_TOKEN:
+        install_task_factory()
+    if settings.PREFETCH_ENABLED:
+        prefetch_scheduler.start()
+    if settings.WATCHLIST_ENABLED:
+        watchlist_manager.start()
+    cookie_manager.start()
     yield  # Приложение работает
+    await warmup.stop()
+    await watchlist_manager.stop()
+    await prefetch_scheduler.stop()
+    await cookie_manager.stop()
+    worker_profiler.stop()
+    await loop_monitor.stop()
+    metrics_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await metrics_task
     await HTTPXClient.shutdown()  # Закрываем клиент при завершении работы
+    await cache_backend.close()
+    await analyte_index.close()
     logger.info("HTTPXClient закрыт")
 
 
@@ -49,6 +113,69 @@ async def get_dashboard_page():
 # Подключаем маршруты API
 app.include_router(api_router)
 app.include_router(dashboard_router)
+app.include_router(metrics_router)
+
+
+
+class TraceMiddleware:
+    """
+    Открывает трейс на каждый запрос: request id в contextvars, заголовки
+    `X-Request-ID` и `Server-Timing`, сохранение трейса по запросу или для медленных запросов.
+    Также учитывает длительность запроса в метриках и статистике дашборда.
+
+    Чистый ASGI-middleware: в отличие от `@app.middleware("http")` (BaseHTTPMiddleware) не прячет
+    от маршрутов отключение клиента (`request.is_disconnected()`) и не запускает их в отдельной задаче.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        start = time.perf_counter()
+        trace = tracing.start_trace(tracing.make_request_id(request.headers.get("X-Request-ID")))
+
+        def observe(status_code: int) -> None:
+            # Шаблон маршрута вместо фактического пути, чтобы не плодить метки
+            route = scope.get("route")
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, path=getattr(route, "path", "other"), status=str(status_code)
+            )
+
+        with tracing.span("request", path=request.url.path, method=request.method) as root:
+            async def send_with_trace(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    root.attributes["http.status_code"] = message["status"]
+                    root.end_ns = time.time_ns()
+                    observe(message["status"])
+
+                    headers = MutableHeaders(scope=message)
+                    headers["X-Request-ID"] = trace.request_id
+                    headers["Server-Timing"] = trace.server_timing()
+
+                    debug = request.headers.get("X-Debug-Trace") == "1"
+                    slow = 0 < settings.TRACE_SLOW_THRESHOLD <= root.duration_ms / 1000
+                    if debug or slow:
+                        try:
+                            await asyncio.to_thread(tracing.save_trace, trace)
+                            headers["X-Trace-Url"] = f"/api/dashboard/traces/{trace.request_id}"
+                        except OSError as e:
+                            logger.error(f"[Tracing] Error saving trace {trace.request_id}: {e}")
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            except Exception:
+                if root.end_ns is None:
+                    observe(500)
+                raise
+
+
+app.add_middleware(TraceMiddleware)  # noqa
 
 app.add_middleware(
     CORSMiddleware,  # noqa
@@ -56,4 +183,5 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing", "X-Trace-Url"],
 )
@@ -0,0 +1,12 @@
+from datetime import date
+from typing import Optional
+
+from pydantic import Field
+
+from app.models.patient import PatientSearchRequest
+
+
+class TrendRequest(PatientSearchRequest):
+    analyte: str = Field(..., min_length=1, description="Название показателя, как в протоколе (регистр не важен)")
+    date_from: Optional[date] = Field(None, description="Начало периода включительно")
+    date_to: Optional[date] = Field(None, description="Конец периода включительно")
@@ -0,0 +1,14 @@
+from datetime import datetime
+from typing import List
+
+from pydantic import BaseModel, Field
+
+from app.models.patient import PatientSearchRequest
+
+
+class PrefetchPatient(PatientSearchRequest):
+    target: datetime = Field(..., description="Время приема; без часового пояса — локальное время сервера")
+
+
+class PrefetchPlan(BaseModel):
+    patients: List[PrefetchPatient] = Field(default_factory=list)
@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import Field
+
+from app.models.patient import PatientSearchRequest
+
+Modality = Literal["medtests", "ultrasound_scan", "functional_tests", "x_ray"]
+
+
+class WatchRequest(PatientSearchRequest):
+    modalities: List[Modality] = Field(
+        default_factory=lambda: ["medtests", "ultrasound_scan", "functional_tests", "x_ray"],
+        min_length=1,
+    )
+    webhook: Optional[str] = Field(None, description="URL локального обработчика (хост из WATCHLIST_WEBHOOK_HOSTS)")
+    until: Optional[datetime] = Field(None, description="До какого момента наблюдать; по умолчанию WATCHLIST_DEFAULT_HOURS")
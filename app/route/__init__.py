@@ -1,7 +1,15 @@
 from fastapi import APIRouter
 from .health import router as health_router
 from .complex import router as complex_test_router
+from .admin import router as admin_router
+from .prefetch import router as prefetch_router
+from .watchlist import router as watchlist_router
+from .analytes import router as analytes_router
 
 router = APIRouter(prefix="/api")
 router.include_router(health_router)
 router.include_router(complex_test_router)
+router.include_router(admin_router)
+router.include_router(prefetch_router)
+router.include_router(watchlist_router)
+router.include_router(analytes_router)
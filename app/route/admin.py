@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+
+from app.core.dependencies import require_admin
+from app.core.profiling import list_profiles, profile_path, worker_profiler
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile/worker/start")
+async def start_worker_profile(mode: str = "sampling", duration: float = 30.0):
+    """
+    Запускает ограниченный по времени профиль воркера, обработавшего запрос:
+    `sampling` — свернутые стеки (flamegraph), `cprofile` — файл pstats.
+    """
+    try:
+        worker_profiler.start(mode, duration)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return worker_profiler.status()
+
+
+@router.post("/profile/worker/stop")
+async def stop_worker_profile():
+    """Останавливает профиль воркера досрочно и возвращает id файла."""
+    profile_id = worker_profiler.profile_id
+    if worker_profiler.stop() is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="No worker profile is running in this worker")
+    return {"profile_id": profile_id}
+
+
+@router.get("/profile/worker")
+async def get_worker_profile_status():
+    return worker_profiler.status()
+
+
+@router.get("/profiles")
+async def get_profiles():
+    """Список готовых профилей (общий каталог `PROFILE_DIR` для всех воркеров)."""
+    return list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
@@ -0,0 +1,56 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.params import Body
+
+from app.models.analytes import TrendRequest
+from app.models.patient import PatientSearchRequest
+from app.services.analytes.manager import analyte_index, patient_key
+
+router = APIRouter(prefix="/analytes", tags=["Analytes"])
+
+NOT_INDEXED = "Patient has no indexed lab reports; request /api/complex/person first"
+
+
+def _require_index() -> None:
+    if not analyte_index.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Analyte index is disabled")
+
+
+@router.post("")
+async def list_analytes(request: PatientSearchRequest) -> Dict[str, Any]:
+    """Показатели пациента в индексе: число значений и период. Отвечает из индекса, без EVMIAS."""
+    _require_index()
+    key = patient_key(request.last_name, request.first_name, request.middle_name, request.birthday)
+    result = await analyte_index.analytes(key)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_INDEXED)
+    return result
+
+
+@router.post("/trend")
+async def get_trend(request: TrendRequest = Body(
+    ...,
+    example={
+        "last_name": "Богачев",
+        "first_name": "Константин",
+        "middle_name": "Юрьевич",
+        "birthday": "16.01.1982",
+        "analyte": "Гемоглобин",
+        "date_from": "2023-01-01",
+    },
+)) -> Dict[str, Any]:
+    """
+    Значения показателя по датам из индекса, без EVMIAS. В `coverage` — сколько протоколов пациента
+    проиндексировано и за какой период: документы, которые сервис еще не загружал, в тренд не попадают.
+    """
+    _require_index()
+    key = patient_key(request.last_name, request.first_name, request.middle_name, request.birthday)
+    result = await analyte_index.trend(
+        key, request.analyte,
+        request.date_from.isoformat() if request.date_from else None,
+        request.date_to.isoformat() if request.date_to else None,
+    )
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=NOT_INDEXED)
+    return {"analyte": request.analyte, **result}
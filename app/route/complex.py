@@ -1,11 +1,16 @@
-from typing import Dict, Any
-import asyncio
-from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Dict, Any, List, Optional
+import time
+from fastapi import APIRouter, HTTPException, Query, Request, status, Depends
 from fastapi.params import Body
 
+from app.core import deadline, metrics, tracing
+from app.core.cache import content_digest
+from app.core.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnected, cancel_on_disconnect
 from app.core.logger import logger
 from app.models.patient import PatientSearchRequest
-from app.core.dependencies import get_valid_cookies_dependency
+from app.core.dependencies import (
+    admission_dependency, get_valid_cookies_dependency, profile_request_dependency, time_budget_dependency,
+)
 
 from app.services.ultrasound_scan import pipeline as ultrasound_scan_pipeline
 from app.services.functional_tests import pipeline as functional_tests_pipeline
@@ -14,9 +19,37 @@ from app.services.x_ray import pipeline as x_ray_pipeline
 
 router = APIRouter(prefix="/complex", tags=["Complex results"])
 
+# Запас сверх дедлайна на сборку результатов пайплайнами после отмены незагруженных документов
+DEADLINE_GRACE = 1.0
 
-@router.post("/person", openapi_extra={"requestBody": {"description": "Patient tests search request body"}})
-async def get_tests(request: PatientSearchRequest = Body(
+
+def _deduplicate_bodies(results: List[Optional[Dict[str, Any]]]) -> Dict[str, str]:
+    """
+    Заменяет `test_result` в `tests_with_results` ссылкой `test_result_ref` на хэш содержимого
+    и возвращает уникальные тела по хэшу — каждое тело попадает в ответ один раз.
+    """
+    bodies: Dict[str, str] = {}
+    for result in results:
+        if not result:
+            continue
+        for tests in result["tests_with_results"].values():
+            for test in tests:
+                body = test.pop("test_result", None)
+                if body is None:
+                    test["test_result_ref"] = None
+                    continue
+                digest = getattr(body, "digest", None) or content_digest(body)
+                bodies.setdefault(digest, body)
+                test["test_result_ref"] = digest
+    return bodies
+
+
+@router.post(
+    "/person",
+    openapi_extra={"requestBody": {"description": "Patient tests search request body"}},
+    dependencies=[Depends(time_budget_dependency), Depends(admission_dependency), Depends(profile_request_dependency)],
+)
+async def get_tests(http_request: Request, request: PatientSearchRequest = Body(
     ...,
     example={
         "last_name": "Богачев",
@@ -25,12 +58,19 @@ async def get_tests(request: PatientSearchRequest = Body(
         "birthday": "16.01.1982",
     },
 ),
-    cookies: Dict = Depends(get_valid_cookies_dependency)
+    cookies: Dict = Depends(get_valid_cookies_dependency),
+    dedup: bool = Query(
+        False, description="Отдавать каждое уникальное тело протокола один раз в `bodies`, "
+                           "а в `tests_with_results` — ссылку `test_result_ref` (sha256)"
+    ),
 ) -> Dict[str, Any]:
 
+    start = time.perf_counter()
+    outcome = "error"
     try:
         logger.info(f"Fetching all tests for patient ...")
-        results = await asyncio.gather(
+        # Клиент закрыл карточку пациента — отменяем все пайплайны и загрузки документов
+        results, _ = await cancel_on_disconnect(http_request, deadline.gather_within_deadline(
             functional_tests_pipeline.get_patient_tests(
                 cookies, request.last_name, request.first_name, request.middle_name, request.birthday
             ),
@@ -43,8 +83,9 @@ async def get_tests(request: PatientSearchRequest = Body(
             x_ray_pipeline.get_patient_tests(
                 cookies, request.last_name, request.first_name, request.middle_name, request.birthday
             ),
-            return_exceptions=True
-        )
+            stage="complex",
+            grace=DEADLINE_GRACE,
+        ))
         logger.info(f"All tests for patient fetched.")
 
         (functional_tests_result, ultrasound_scan_result, medtest_result, x_ray_result) = results
@@ -57,25 +98,43 @@ async def get_tests(request: PatientSearchRequest = Body(
                 logger.error(f"A sub-request failed during complex fetch: {res}", exc_info=res)
                 all_results[i] = None  # Заменяем ошибку на None для ответа клиенту
 
+        # Модальность неполная, если ее пайплайн не успел к дедлайну или загрузил не все документы
+        timed_out = deadline.expired()
+        incomplete = [
+            (r.pop("incomplete", False) if r is not None else timed_out) for r in all_results
+        ]
+
         if not any(r for r in all_results if r is not None):
+            if any(incomplete):
+                outcome = "timeout"
+                raise HTTPException(
+                    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                    detail="Time budget exhausted before any results were fetched."
+                )
+            outcome = "not_found"
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No results could be fetched for this patient."
             )
 
-        # Извлекаем информацию о пациенте (она одинаковая во всех результатах)
-        person = None
-        for result in all_results:
-            if result and "person" in result:
-                person = result.pop("person")
-                break
+        with tracing.span("assemble"):
+            # Извлекаем информацию о пациенте (она одинаковая во всех результатах)
+            person = None
+            for result in all_results:
+                if result and "person" in result:
+                    person = result.pop("person")
+                    break
 
-        # Убираем дублирующуюся информацию о пациенте из остальных результатов
-        for result in all_results:
-            if result:
-                result.pop("person", None)
+            # Убираем дублирующуюся информацию о пациенте из остальных результатов
+            for result in all_results:
+                if result:
+                    result.pop("person", None)
 
-        return {
+        outcome = "partial" if any(incomplete) else "success"
+        metrics.COMPLEX_DOCUMENTS.observe(
+            sum(len(tests) for r in all_results if r for tests in r["tests_with_results"].values())
+        )
+        response = {
             "success": True,
             "result": {
                 "person": person,
@@ -83,11 +142,26 @@ async def get_tests(request: PatientSearchRequest = Body(
                 "ultrasound_scan": all_results[2],
                 "functional_tests": all_results[3],
                 "x_ray": all_results[0],
-            }
+            },
+            "incomplete": {
+                "medtests": incomplete[1],
+                "ultrasound_scan": incomplete[2],
+                "functional_tests": incomplete[3],
+                "x_ray": incomplete[0],
+            },
         }
+        if dedup:
+            with tracing.span("dedup"):
+                response["bodies"] = _deduplicate_bodies(all_results)
+        return response
 
     except HTTPException as http_ex:
         raise http_ex
+    except ClientDisconnected:
+        outcome = "disconnected"
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         logger.error(f"An error occurred while processing the request: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
+    finally:
+        metrics.COMPLEX_REQUEST_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
@@ -1,10 +1,22 @@
 import asyncio
 import json
 from pathlib import Path
+from typing import Optional
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.responses import FileResponse
 from sse_starlette.sse import EventSourceResponse
 
+from app.core.admission import admission
+from app.core.cache import document_bodies, document_cache, patient_cache
+from app.core.cache_backends import cache_backend
+from app.core.dependencies import is_admin, require_admin
+from app.core.loop_monitor import loop_monitor
+from app.core.ratelimit import rate_limiter
+from app.core.stats import rolling_stats
+from app.core.tracing import find_trace
+from app.services.cookies.manager import cookie_manager
+
 
 router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
@@ -29,7 +41,7 @@ def get_dashboard_data():
     return {
         "app_logs": read_last_log_lines(APP_LOG_FILE),
         "error_logs": read_last_log_lines(ERROR_LOG_FILE),
-        "fastapi_status": "ONLINE",
+        "fastapi_status": rolling_stats.snapshot()["status"],
     }
 
 
@@ -38,9 +50,64 @@ async def get_dashboard_status():
     return get_dashboard_data()
 
 
+@router.get("/stats")
+async def get_dashboard_stats():
+    """Скользящая статистика воркера: частота запросов, перцентили латентности, ошибки EVMIAS."""
+    return rolling_stats.snapshot()
+
+
+@router.get("/rate-limit", dependencies=[Depends(require_admin)])
+async def get_rate_limit_state():
+    """Текущее наполнение корзин лимита запросов к EVMIAS (общее для всех воркеров хоста)."""
+    return rate_limiter.state()
+
+
+@router.get("/admission", dependencies=[Depends(require_admin)])
+async def get_admission_state():
+    """Слоты извлечений воркера: занятые, очередь по классам приоритета и оценка ожидания."""
+    return admission.stats()
+
+
+@router.get("/cache", dependencies=[Depends(require_admin)])
+async def get_cache_state():
+    """Кэши воркера (протоколы, поиски, тела) и состояние общего бэкенда кэша."""
+    return {
+        "documents": document_cache.stats(),
+        "patients": patient_cache.stats(),
+        "bodies": document_bodies.stats(),
+        "backend": cache_backend.stats(),
+    }
+
+
+@router.get("/sessions", dependencies=[Depends(require_admin)])
+async def get_sessions_state():
+    """Сессии EVMIAS воркера по учетным записям: состояние, нагрузка, ошибки и остывание после 429."""
+    return cookie_manager.stats()
+
+
+@router.get("/loop")
+async def get_loop_report(limit: int = 20, x_admin_token: Optional[str] = Header(None)):
+    """
+    Задержки event loop и худшие блокирующие вызовы в этом воркере.
+    Стеки и имена задач — только администратору; панели дашборда без токена хватает счетчиков.
+    """
+    report = loop_monitor.report(limit)
+    if not is_admin(x_admin_token):
+        report["offenders"] = [
+            {key: value for key, value in offender.items() if key not in ("task", "stack")}
+            for offender in report["offenders"]
+        ]
+    report["lag"] = rolling_stats.window("loop", "lag").summary()
+    return report
+
+
 @router.get("/stream")
 async def stream_updates(request: Request):
-    """Отправляет обновления по SSE, когда содержимое лог-файлов меняется."""
+    """
+    Отправляет обновления по SSE:
+    - `update` — когда содержимое лог-файлов меняется;
+    - `stats` — скользящую статистику на каждом цикле.
+    """
 
     async def event_generator():
         last_data_json = ""
@@ -55,6 +122,17 @@ async def stream_updates(request: Request):
                 yield {"event": "update", "data": current_data_json}
                 last_data_json = current_data_json
 
+            yield {"event": "stats", "data": json.dumps(rolling_stats.snapshot())}
+
             await asyncio.sleep(2)
 
     return EventSourceResponse(event_generator())
+
+
+@router.get("/traces/{request_id}")
+async def get_trace(request_id: str):
+    """Отдает сохраненный трейс запроса в формате OTLP/JSON."""
+    path = find_trace(request_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trace not found")
+    return FileResponse(path, media_type="application/json", filename=f"trace-{request_id}.json")
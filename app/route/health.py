@@ -1,4 +1,7 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.core.warmup import warmup
 
 router = APIRouter(prefix="/health", tags=["Health check"])
 
@@ -6,3 +9,13 @@ router = APIRouter(prefix="/health", tags=["Health check"])
 @router.get("/ping", status_code=200)
 def pong():
     return {"status": "ok"}
+
+
+@router.get("/ready")
+def ready():
+    """
+    Готовность воркера для балансировщика: 200 после прогрева, иначе 503.
+    В ответе — состояние каждого компонента прогрева этого воркера.
+    """
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
@@ -0,0 +1,16 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import REGISTRY
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Метрики всех воркеров в текстовом формате экспозиции Prometheus."""
+    # Сброс своего снимка и чтение снимков остальных воркеров — файловый ввод-вывод, не в event loop
+    body = await asyncio.to_thread(REGISTRY.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from app.core.dependencies import require_admin
+from app.models.prefetch import PrefetchPlan
+from app.services.prefetch.manager import prefetch_scheduler, save_plan
+
+router = APIRouter(prefix="/prefetch", tags=["Prefetch"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/status")
+async def get_prefetch_status():
+    """План префетча и покрытие кэшей воркера, обработавшего запрос (кэши у каждого воркера свои)."""
+    return prefetch_scheduler.status()
+
+
+@router.put("/plan")
+async def put_prefetch_plan(plan: PrefetchPlan):
+    """Заменяет план префетча (файл `PREFETCH_PLAN_FILE`, общий для всех воркеров)."""
+    # Файловый ввод-вывод — в потоке: медленный диск не задерживает event loop
+    await asyncio.to_thread(save_plan, prefetch_scheduler.path, plan)
+    prefetch_scheduler.reload()
+    return {"patients": len(plan.patients)}
+
+
+@router.delete("/plan")
+async def delete_prefetch_plan():
+    await asyncio.to_thread(prefetch_scheduler.path.unlink, missing_ok=True)
+    prefetch_scheduler.reload()
+    return {"patients": 0}
+
+
+@router.post("/run")
+async def run_prefetch():
+    """Запускает проход по плану в этом воркере немедленно, вне окон низкой нагрузки."""
+    if not prefetch_scheduler.trigger():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Prefetch pass is already running")
+    return {"started": True}
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from sse_starlette.sse import EventSourceResponse
+
+from app.core.config import get_settings
+from app.core.dependencies import get_valid_cookies_dependency, is_admin, require_admin
+from app.models.watchlist import WatchRequest
+from app.services.watchlist.manager import PIPELINES, watchlist_manager
+
+settings = get_settings()
+
+router = APIRouter(prefix="/watchlist", tags=["Watchlist"])
+
+# Как часто подписчик SSE проверяет файл событий, секунды
+EVENTS_POLL_INTERVAL = 1.0
+
+
+async def _get_watch(watch_id: str) -> dict:
+    # Id наблюдения (uuid4) — единственный ключ доступа к нему для того, кто его создал
+    watch = await watchlist_manager.get(watch_id)
+    if watch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Watch not found")
+    return watch
+
+
+@router.post("", status_code=status.HTTP_201_CREATED)
+async def add_watch(request: WatchRequest):
+    """Ставит пациента на наблюдение: новые документы выбранных модальностей приходят событиями."""
+    try:
+        return await watchlist_manager.add(request)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("", dependencies=[Depends(require_admin)])
+async def list_watches():
+    """Все наблюдения с ФИО пациентов — только для администратора."""
+    return await watchlist_manager.watches()
+
+
+@router.get("/events")
+async def stream_watch_events(
+        request: Request,
+        watch_id: Optional[str] = None,
+        last_event_id: Optional[str] = Header(None),
+        x_admin_token: Optional[str] = Header(None),
+):
+    """
+    События `documents` о новых документах по SSE: одного наблюдения `watch_id` или (для администратора) всех.
+    Переподключение с `Last-Event-ID` продолжает поток с места обрыва.
+    """
+    if watch_id is None:
+        if not is_admin(x_admin_token):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required for all watches")
+    else:
+        await _get_watch(watch_id)
+    events = watchlist_manager.events
+    offset = int(last_event_id) if last_event_id and last_event_id.isdigit() else await asyncio.to_thread(events.size)
+
+    async def event_generator():
+        nonlocal offset
+        while not await request.is_disconnected():
+            batch, offset = await asyncio.to_thread(events.read, offset)
+            for event_id, event in batch:
+                if watch_id is None or event["watch_id"] == watch_id:
+                    yield {"id": str(event_id), "event": "documents", "data": json.dumps(event, ensure_ascii=False)}
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+    return EventSourceResponse(event_generator())
+
+
+@router.get("/{watch_id}")
+async def get_watch(watch_id: str):
+    return watchlist_manager.describe(await _get_watch(watch_id))
+
+
+@router.delete("/{watch_id}", dependencies=[Depends(require_admin)])
+async def delete_watch(watch_id: str):
+    if not await watchlist_manager.remove(watch_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Watch not found")
+    return {"deleted": watch_id}
+
+
+@router.get("/{watch_id}/documents/{evn_xml_id}")
+async def get_watch_document(
+        watch_id: str,
+        evn_xml_id: str,
+        cookies: Dict = Depends(get_valid_cookies_dependency),
+):
+    """Санитизированный протокол из события наблюдения (только документы этого наблюдения)."""
+    watch = await _get_watch(watch_id)
+    modality = next((m for m, ids in watch["known"].items() if ids and evn_xml_id in ids), None)
+    if modality is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found in this watch")
+    body = await PIPELINES[modality].get_tests_result(evn_xml_id, cookies)
+    if body is None:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Document could not be fetched")
+    return {"evn_xml_id": evn_xml_id, "modality": modality, "test_result": body}
@@ -0,0 +1,260 @@
+# app/services/analytes/manager.py
+
+import asyncio
+import hashlib
+import hmac
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+import lxml.html
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+# Первое число значения: "5,2" → 5.2, "<0.1" → 0.1; "отрицательно" остается только строкой
+NUMBER = re.compile(r"[-+]?\d+(?:[.,]\d+)?")
+
+# Значение аналита из протокола: название, значение, единица, референсный интервал
+Row = Tuple[str, str, str, str]
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join((text or "").lower().replace("ё", "е").split())
+
+
+def patient_key(last_name: str, first_name: str, middle_name: Optional[str], birthday: str) -> str:
+    """
+    Ключ пациента в индексе: HMAC-SHA256 с `ANALYTE_INDEX_SECRET` от нормализованных ФИО и даты рождения.
+    Персональные данные не хранятся; без секрета ключ восстанавливался бы перебором ФИО и дат рождения.
+    """
+    parts = (_normalize(last_name), _normalize(first_name), _normalize(middle_name), birthday.strip())
+    secret = settings.ANALYTE_INDEX_SECRET.encode("utf-8")
+    return hmac.new(secret, "|".join(parts).encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def analyte_key(name: str) -> str:
+    """Название аналита для поиска: регистр, «ё» и лишние пробелы не важны."""
+    return _normalize(name)
+
+
+def parse_number(value: str) -> Optional[float]:
+    match = NUMBER.search(value)
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def extract_rows(html: str) -> List[Row]:
+    """
+    Строки таблиц результатов из санитизированного протокола: ячейки `<td>` — название, значение и,
+    если есть, единица и референсный интервал. Заголовки (`<th>`) и строки без значения пропускаются.
+    """
+    rows = []
+    for tr in lxml.html.fromstring(html).iter("tr"):
+        cells = [" ".join(td.text_content().split()) for td in tr.findall("td")]
+        if len(cells) < 2 or not cells[0] or not cells[1]:
+            continue
+        cells += [""] * (4 - len(cells))
+        rows.append((cells[0], cells[1], cells[2], cells[3]))
+    return rows
+
+
+class AnalyteIndex:
+    """
+    Локальный индекс лабораторных значений: пациент → аналит → значения по датам (SQLite, WAL, общий
+    для воркеров хоста). Пополняется по ходу работы пайплайна `medtest` и наблюдения: протоколы, чьих
+    `EvnXml_id` еще нет в индексе, разбираются в фоне и не задерживают ответ. Запрос тренда читает
+    только индекс — без EVMIAS, поэтому в нем есть лишь документы, которые сервис уже загружал.
+
+    Значения хранятся кластеризованными по (пациент, аналит, дата) — тренд читается одним проходом по диапазону.
+    Без `ANALYTE_INDEX_SECRET` индекс не включается: см. `patient_key`.
+    """
+
+    def __init__(self, path: str, enabled: bool = True, secret: str = ""):
+        if enabled and not secret:
+            raise ValueError(
+                "ANALYTE_INDEX_ENABLED is set but ANALYTE_INDEX_SECRET is empty: patient keys would be reversible"
+            )
+        self.path = path
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    patient TEXT NOT NULL, evn_xml_id TEXT NOT NULL, date TEXT NOT NULL,
+                    analytes INTEGER NOT NULL, indexed_at REAL NOT NULL,
+                    PRIMARY KEY (patient, evn_xml_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS analyte_values (
+                    patient TEXT NOT NULL, analyte TEXT NOT NULL, date TEXT NOT NULL, evn_xml_id TEXT NOT NULL,
+                    name TEXT NOT NULL, value REAL, value_raw TEXT NOT NULL, unit TEXT, reference TEXT,
+                    PRIMARY KEY (patient, analyte, date, evn_xml_id)
+                ) WITHOUT ROWID;
+            """)
+            self._conn = conn
+        return self._conn
+
+    # --- Пополнение ---
+
+    def observe(self, key: str, documents: Iterable[Tuple[dict, Optional[str]]]) -> None:
+        """
+        Ставит в фоновое индексирование загруженные протоколы пациента: пары (строка поиска, тело протокола).
+        Незагруженные (None) пропускаются — попадут в индекс при следующей загрузке.
+        """
+        if not self.enabled:
+            return
+        pending = []
+        for test, body in documents:
+            date = _test_date(test)
+            if body is not None and test.get("EvnXml_id") and date:
+                pending.append((str(test["EvnXml_id"]), date, str(body)))
+        if not pending:
+            return
+        task = asyncio.create_task(self._index(key, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _index(self, key: str, documents: List[Tuple[str, str, str]]) -> None:
+        try:
+            await asyncio.to_thread(self._write, key, documents)
+        except Exception as e:
+            metrics.ANALYTE_INDEX_DOCUMENTS_TOTAL.inc(len(documents), result="failed")
+            logger.error(f"[Analytes] Error indexing {len(documents)} documents: {e}")
+
+    def _write(self, key: str, documents: List[Tuple[str, str, str]]) -> None:
+        with self._lock:
+            known = self._known(self._connect(), key, [evn_xml_id for evn_xml_id, _, _ in documents])
+        new = [document for document in documents if document[0] not in known]
+        if not new:
+            return
+        # Разбор — вне блокировки: запросы трендов в это время не ждут
+        parsed = [(evn_xml_id, date, extract_rows(html)) for evn_xml_id, date, html in new]
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for evn_xml_id, date, rows in parsed:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO documents (patient, evn_xml_id, date, analytes, indexed_at) "
+                        "VALUES (?, ?, ?, ?, ?)", (key, evn_xml_id, date, len(rows), now),
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO analyte_values "
+                        "(patient, analyte, date, evn_xml_id, name, value, value_raw, unit, reference) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (key, analyte_key(name), date, evn_xml_id, name, parse_number(value), value,
+                             unit or None, reference or None)
+                            for name, value, unit, reference in rows
+                        ],
+                    )
+        for _, _, rows in parsed:
+            metrics.ANALYTE_INDEX_DOCUMENTS_TOTAL.inc(result="indexed" if rows else "empty")
+
+    @staticmethod
+    def _known(conn: sqlite3.Connection, key: str, evn_xml_ids: Sequence[str]) -> Set[str]:
+        placeholders = ",".join("?" * len(evn_xml_ids))
+        return {row[0] for row in conn.execute(
+            f"SELECT evn_xml_id FROM documents WHERE patient = ? AND evn_xml_id IN ({placeholders})",
+            (key, *evn_xml_ids),
+        )}
+
+    async def flush(self) -> None:
+        """Дожидается фонового индексирования (перед остановкой воркера или выгрузки)."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- Запросы ---
+
+    def _coverage(self, conn: sqlite3.Connection, key: str) -> Optional[dict]:
+        documents, first, last, indexed_at = conn.execute(
+            "SELECT COUNT(*), MIN(date), MAX(date), MAX(indexed_at) FROM documents WHERE patient = ?", (key,)
+        ).fetchone()
+        if not documents:
+            return None
+        return {
+            "documents": documents,
+            "first_date": first,
+            "last_date": last,
+            "indexed_at": datetime.fromtimestamp(indexed_at).isoformat(timespec="seconds"),
+        }
+
+    def _analytes(self, key: str) -> Optional[dict]:
+        with self._lock:
+            conn = self._connect()
+            coverage = self._coverage(conn, key)
+            if coverage is None:
+                return None
+            # Для каждого аналита — число точек и период наблюдений
+            rows = conn.execute(
+                "SELECT name, unit, COUNT(*), MIN(date), MAX(date) FROM analyte_values "
+                "WHERE patient = ? GROUP BY analyte ORDER BY analyte", (key,),
+            ).fetchall()
+        return {
+            "coverage": coverage,
+            "analytes": [
+                {"name": name, "unit": unit, "points": points, "first_date": first, "last_date": last}
+                for name, unit, points, first, last in rows
+            ],
+        }
+
+    def _trend(self, key: str, analyte: str, date_from: Optional[str], date_to: Optional[str]) -> Optional[dict]:
+        with self._lock:
+            conn = self._connect()
+            coverage = self._coverage(conn, key)
+            if coverage is None:
+                return None
+            rows = conn.execute(
+                "SELECT date, evn_xml_id, name, value, value_raw, unit, reference FROM analyte_values "
+                "WHERE patient = ? AND analyte = ? AND date >= ? AND date <= ? ORDER BY date, evn_xml_id",
+                (key, analyte_key(analyte), date_from or "", date_to or "9999-12-31"),
+            ).fetchall()
+        return {
+            "coverage": coverage,
+            "points": [
+                {"date": date, "value": value, "value_raw": raw, "unit": unit, "reference": reference,
+                 "evn_xml_id": evn_xml_id, "name": name}
+                for date, evn_xml_id, name, value, raw, unit, reference in rows
+            ],
+        }
+
+    async def analytes(self, key: str) -> Optional[dict]:
+        """Аналиты пациента в индексе; None — по пациенту не проиндексировано ни одного документа."""
+        return await asyncio.to_thread(self._analytes, key)
+
+    async def trend(
+            self, key: str, analyte: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Значения аналита по возрастанию даты (даты ISO, включительно); None — пациент не проиндексирован."""
+        return await asyncio.to_thread(self._trend, key, analyte, date_from, date_to)
+
+
+def _test_date(test: dict) -> Optional[str]:
+    try:
+        return datetime.strptime(test.get("EvnUslugaPar_setDate"), "%d.%m.%Y").strftime("%Y-%m-%d")
+    except (ValueError, TypeError):
+        return None
+
+
+analyte_index = AnalyteIndex(settings.ANALYTE_INDEX_PATH, settings.ANALYTE_INDEX_ENABLED, settings.ANALYTE_INDEX_SECRET)
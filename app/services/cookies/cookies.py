@@ -1,17 +1,46 @@
 # app/services/cookies/cookies.py
 
 import json
+import re
 from pathlib import Path
+from typing import List, NamedTuple
+from app.core.cache_backends import cache_backend
 from app.core.config import get_settings
 from app.core.logger import logger
+from app.core.ratelimit import RateLimitExceeded
 
 settings = get_settings()
 
 COOKIES_FILE = Path(settings.COOKIES_FILE)
 BASE_URL = settings.BASE_URL
 
+# Легкий вызов проверки сессии: лимит хоста считает его в корзине session, а не auth
+SESSION_CHECK_PARAMS = {"c": "Common", "m": "getCurrentDateTime"}
+SESSION_CHECK_DATA = {"is_activerules": "true"}
 
-async def get_new():
+
+class Account(NamedTuple):
+    """Учетная запись EVMIAS и файл ее кук."""
+    login: str
+    password: str
+    cookies_file: Path
+
+
+def accounts() -> List[Account]:
+    """Основная учетная запись (`EVMIAS_LOGIN`, `COOKIES_FILE`) и дополнительные из `EVMIAS_ACCOUNTS`."""
+    result = [Account(settings.EVMIAS_LOGIN, settings.EVMIAS_PASSWORD, COOKIES_FILE)]
+    for login, password in settings.EVMIAS_ACCOUNTS.items():
+        if login == settings.EVMIAS_LOGIN:
+            continue
+        name = re.sub(r"[^\w.-]", "_", login)
+        result.append(Account(login, password, COOKIES_FILE.with_name(f"{COOKIES_FILE.stem}.{name}{COOKIES_FILE.suffix}")))
+    return result
+
+
+PRIMARY = accounts()[0]
+
+
+async def get_new(account: Account = PRIMARY):
     # Локальный импорт для разрыва циклической зависимости
     from app.core.httpx_client import HTTPXClient
     cookies = None
@@ -30,19 +59,19 @@ async def get_new():
             "X-Requested-With": "XMLHttpRequest",
         }
         params = {
-            "c": "main", "m": "index", "method": "Logon", "login": settings.EVMIAS_LOGIN
+            "c": "main", "m": "index", "method": "Logon", "login": account.login
         }
         data = {
-            "login": settings.EVMIAS_LOGIN, "psw": settings.EVMIAS_PASSWORD,
+            "login": account.login, "psw": account.password,
         }
         response = await HTTPXClient.fetch(
             url=url, method="POST", headers=headers, cookies=cookies, params=params, data=data
         )
         if not (response['status_code'] == 200 and "true" in response['text']):
-            logger.error("Authorization failed")
+            logger.error(f"Authorization failed for {account.login}")
             raise RuntimeError("Authorization failed")
-        logger.info("Authorization success")
-        cookies.update({"login": settings.EVMIAS_LOGIN})
+        logger.info(f"Authorization success for {account.login}")
+        cookies.update({"login": account.login})
 
         # get second part of cookies
         url = f"{BASE_URL}ermp/servlets/dispatch.servlet"
@@ -61,10 +90,13 @@ async def get_new():
         cookies.update({k: v for k, v in response.get('cookies', {}).items()})
         logger.info("Got final cookies")
 
-        COOKIES_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with COOKIES_FILE.open("w", encoding="utf-8") as f:
+        account.cookies_file.parent.mkdir(parents=True, exist_ok=True)
+        with account.cookies_file.open("w", encoding="utf-8") as f:
             json.dump(cookies, f, ensure_ascii=False)
-        logger.info(f"Cookies saved to {COOKIES_FILE}")
+        logger.info(f"Cookies saved to {account.cookies_file}")
+        if cache_backend.shared:
+            # Сессия доступна воркерам других хостов — им не нужно входить заново
+            await cache_backend.set("sessions", account.login, cookies, settings.CACHE_SESSION_TTL)
 
     except Exception as e:
         logger.error(f"Error getting new cookies: {e}", exc_info=True)
@@ -72,38 +104,44 @@ async def get_new():
     return cookies
 
 
-async def load_cookies() -> dict:
-    if not COOKIES_FILE.exists():
+async def load_cookies(account: Account = PRIMARY) -> dict:
+    if cache_backend.shared:
+        cookies = await cache_backend.get("sessions", account.login)
+        if isinstance(cookies, dict) and cookies:
+            return cookies
+    if not account.cookies_file.exists():
         return {}
     try:
-        with COOKIES_FILE.open("r", encoding="utf-8") as f:
+        with account.cookies_file.open("r", encoding="utf-8") as f:
             cookies = json.load(f)
         return cookies if isinstance(cookies, dict) else {}
     except (json.JSONDecodeError, FileNotFoundError):
         return {}
 
 
-async def check_existing() -> bool:
+async def check_existing(account: Account = PRIMARY) -> bool:
     """Проводит легковесную проверку валидности кук из файла."""
     # Локальный импорт
     from app.core.httpx_client import HTTPXClient
 
-    cookies = await load_cookies()
+    cookies = await load_cookies(account)
     if not cookies:
         return False
 
     logger.info("Performing proactive cookie check...")
     url = settings.BASE_URL
-    params = {"c": "Common", "m": "getCurrentDateTime"}
-    data = {"is_activerules": "true"}
-
     try:
-        response = await HTTPXClient.fetch(url=url, method="POST", params=params, cookies=cookies, data=data)
+        response = await HTTPXClient.fetch(
+            url=url, method="POST", params=SESSION_CHECK_PARAMS, cookies=cookies, data=SESSION_CHECK_DATA
+        )
         if response["status_code"] == 200 and response.get("json") is not None:
             logger.info("Proactive check successful: cookies are valid.")
             return True
         logger.warning("Proactive check failed: cookies are invalid.")
         return False
+    except RateLimitExceeded:
+        # Лимит — не признак невалидных кук: повторный вход только потратил бы лимит авторизации
+        raise
     except Exception as e:
         logger.error(f"Error during proactive cookie check: {e}")
         return False
\ No newline at end of file
@@ -1,38 +1,199 @@
 # app/services/cookies/manager.py
 
 import asyncio
-from typing import Dict, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
 
+from app.core import metrics
+from app.core.config import get_settings
 from app.core.logger import logger
-from .cookies import check_existing, get_new, load_cookies
+from .cookies import Account, accounts, check_existing, get_new, load_cookies
+
+settings = get_settings()
+
+# Состояния сессии: new → ready | failed; ready → reauth (выведена из ротации) → ready | failed
+class _Session:
+    def __init__(self, account: Account):
+        self.account = account
+        self.cookies: Optional[Dict] = None
+        self.state = "new"
+        self.in_flight = 0
+        self.checked_at = 0.0
+        self.used_at = 0.0
+        self.cooling_until = 0.0
+        self.errors = 0
+        self.lock = asyncio.Lock()
+        self.reauth: Optional[asyncio.Task] = None
+
+    def rank(self, now: float) -> tuple:
+        # Живые раньше упавших, не троттлингованные раньше остывающих, затем по нагрузке и давности использования
+        return (self.state == "failed", self.cooling_until > now, self.in_flight, self.used_at)
+
 
 class CookieManager:
     """
-    Простой, но надежный менеджер cookies.
-    Проверяет валидность перед каждым использованием.
+    Пул сессий EVMIAS: по одной на учетную запись (`EVMIAS_LOGIN` и `EVMIAS_ACCOUNTS`).
+
+    Запрос получает куки наименее загруженной живой сессии; сессия проверяется перед использованием
+    (не чаще `EVMIAS_SESSION_CHECK_INTERVAL`), а при невалидных куках переавторизуется. Ответы EVMIAS
+    по каждой сессии (`EVMIAS_SESSION_RESPONSES_TOTAL`) определяют ее здоровье: после 429 сессия уступает
+    другим, после страницы входа или серии ошибок выводится из ротации до переавторизации.
+    Простаивающие сессии проверяются фоном, чтобы не истекали на стороне EVMIAS.
     """
-    def __init__(self):
-        self._cookies: Optional[Dict] = None
-        self._lock = asyncio.Lock()
+    def __init__(self, account_list: List[Account]):
+        self._sessions = [_Session(account) for account in account_list]
+        self._by_login = {s.account.login: s for s in self._sessions}
+        self._task: Optional[asyncio.Task] = None
+        metrics.EVMIAS_SESSION_RESPONSES_TOTAL.subscribe(self._on_response)
 
-    async def get_valid_cookies(self) -> Optional[Dict]:
+    def start(self) -> None:
+        if self._task is None and settings.EVMIAS_SESSION_KEEPALIVE > 0:
+            self._task = asyncio.create_task(self._keepalive())
+
+    async def stop(self) -> None:
+        tasks = [self._task] + [s.reauth for s in self._sessions]
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+
+    async def _validate(self, session: _Session, force: bool = False) -> bool:
         """
-        Гарантирует, что возвращаемые куки валидны ПРЯМО СЕЙЧАС.
+        Гарантирует, что куки сессии валидны ПРЯМО СЕЙЧАС (или проверены не раньше интервала проверки).
         """
-        async with self._lock:
-            # Проверяем куки из файла. Это наш единственный источник правды.
-            if await check_existing():
-                logger.info("Cookie check successful. Loading from file.")
-                self._cookies = await load_cookies()
-            else:
-                # Если проверка провалилась - без разговоров идем за новыми.
-                logger.warning("Cookie check failed or file not found. Getting new ones.")
-                self._cookies = await get_new()
+        async with session.lock:
+            fresh = time.monotonic() - session.checked_at < settings.EVMIAS_SESSION_CHECK_INTERVAL
+            if session.state == "ready" and fresh and not force:
+                return True
+            account = session.account
+            with metrics.COOKIE_SECONDS.time():
+                # Проверяем куки из файла. Это наш единственный источник правды.
+                if await check_existing(account):
+                    metrics.COOKIE_CHECKS_TOTAL.inc(result="valid")
+                    logger.info(f"Cookie check successful for {account.login}. Loading from file.")
+                    session.cookies = await load_cookies(account)
+                else:
+                    # Если проверка провалилась - без разговоров идем за новыми.
+                    metrics.COOKIE_CHECKS_TOTAL.inc(result="invalid")
+                    logger.warning(f"Cookie check failed for {account.login}. Getting new ones.")
+                    session.cookies = await get_new(account)
+                    metrics.COOKIE_REFRESHES_TOTAL.inc(result="success" if session.cookies else "failure")
+
+            session.state = "ready" if session.cookies else "failed"
+            session.checked_at = time.monotonic()
+            session.errors = 0
+            if not session.cookies:
+                logger.error(f"Failed to get valid cookies for {account.login}.")
+            return bool(session.cookies)
+
+    async def acquire(self) -> Optional[_Session]:
+        """Занимает наименее загруженную живую сессию до `release`; None — ни одной валидной сессии."""
+        for _ in range(2):
+            now = time.monotonic()
+            candidates = sorted((s for s in self._sessions if s.state != "reauth"), key=lambda s: s.rank(now))
+            for session in candidates:
+                # Сессия считается занятой уже на время проверки, чтобы одновременные запросы расходились по пулу
+                session.in_flight += 1
+                try:
+                    valid = await self._validate(session)
+                except BaseException:
+                    session.in_flight -= 1
+                    raise
+                if valid:
+                    session.used_at = time.monotonic()
+                    return session
+                session.in_flight -= 1
+            # Все сессии на переавторизации или упали: ждем первую переавторизацию и пробуем еще раз
+            pending = [s.reauth for s in self._sessions if s.reauth is not None and not s.reauth.done()]
+            if not pending:
+                break
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        logger.error("CRITICAL: Failed to get any valid cookies.")
+        return None
+
+    async def get_valid_cookies(self) -> Optional[Dict]:
+        """Куки наименее загруженной живой сессии (без учета нагрузки вызывающего — для разовых вызовов)."""
+        session = await self.acquire()
+        if session is None:
+            return None
+        self.release(session)
+        return session.cookies
+
+    def release(self, session: _Session) -> None:
+        session.in_flight -= 1
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Optional[Dict]]:
+        """Куки сессии на время блока; пока блок выполняется, сессия считается нагруженной."""
+        session = await self.acquire()
+        try:
+            yield session.cookies if session else None
+        finally:
+            if session is not None:
+                self.release(session)
+
+    def _reauthenticate(self, session: _Session, reason: str) -> None:
+        if session.state == "reauth" or session.lock.locked():
+            return  # уже проверяется
+        logger.warning(f"[Sessions] {session.account.login} taken out of rotation ({reason}), re-authenticating")
+        session.state = "reauth"
+
+        async def reauth() -> None:
+            try:
+                await self._validate(session, force=True)
+            except Exception as e:
+                session.state = "failed"
+                logger.error(f"[Sessions] Re-authentication of {session.account.login} failed: {e}")
+
+        session.reauth = asyncio.create_task(reauth())
+
+    def _on_response(self, value: float, labels: Dict[str, str]) -> None:
+        session = self._by_login.get(labels["account"])
+        if session is None:
+            return
+        result = labels["result"]
+        if result == "ok":
+            session.errors = 0
+        elif result == "throttled":
+            session.cooling_until = time.monotonic() + settings.EVMIAS_SESSION_COOLDOWN
+        elif result == "expired":
+            self._reauthenticate(session, "session expired")
+        else:
+            session.errors += 1
+            if session.errors >= settings.EVMIAS_SESSION_MAX_ERRORS:
+                self._reauthenticate(session, f"{session.errors} errors in a row")
 
-            if not self._cookies:
-                logger.error("CRITICAL: Failed to get any valid cookies.")
+    async def _keepalive(self) -> None:
+        interval = settings.EVMIAS_SESSION_KEEPALIVE
+        while True:
+            await asyncio.sleep(min(interval, 30.0))
+            now = time.monotonic()
+            for session in self._sessions:
+                idle = session.in_flight == 0 and now - session.checked_at >= interval
+                if session.state in ("ready", "failed") and idle:
+                    try:
+                        await self._validate(session, force=True)
+                    except Exception as e:
+                        logger.error(f"[Sessions] Keepalive of {session.account.login} failed: {e}")
 
-            return self._cookies
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "login": s.account.login,
+                "state": s.state,
+                "in_flight": s.in_flight,
+                "errors": s.errors,
+                "cooling": round(max(0.0, s.cooling_until - now), 1),
+                "checked_ago": round(now - s.checked_at, 1) if s.checked_at else None,
+            }
+            for s in self._sessions
+        ]
 
 # Создаем единственный экземпляр
-cookie_manager = CookieManager()
\ No newline at end of file
+cookie_manager = CookieManager(accounts())
@@ -0,0 +1,295 @@
+# app/services/prefetch/manager.py
+
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime, time as dtime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core import metrics, ratelimit
+from app.core.admission import admission
+from app.core.cache import document_cache, hold_until, patient_cache
+from app.core.config import get_settings
+from app.core.logger import logger
+from app.models.prefetch import PrefetchPatient, PrefetchPlan
+from app.services.cookies.manager import cookie_manager
+from app.services.functional_tests import pipeline as functional_tests_pipeline
+from app.services.medtest import pipeline as medtest_pipeline
+from app.services.ultrasound_scan import pipeline as ultrasound_scan_pipeline
+from app.services.x_ray import pipeline as x_ray_pipeline
+
+settings = get_settings()
+
+MODALITIES = (medtest_pipeline, ultrasound_scan_pipeline, functional_tests_pipeline, x_ray_pipeline)
+
+PlanKey = Tuple[str, str, str, str]
+
+
+def parse_windows(windows: List[str]) -> List[Tuple[dtime, dtime]]:
+    """Окна вида "05:00-07:30"; окно может переходить через полночь ("22:00-06:00")."""
+    parsed = []
+    for window in windows:
+        start, end = (dtime.fromisoformat(part.strip()) for part in window.split("-", 1))
+        parsed.append((start, end))
+    return parsed
+
+
+def in_windows(moment: datetime, windows: List[Tuple[dtime, dtime]]) -> bool:
+    if not windows:
+        return True
+    now = moment.time()
+    return any(start <= now < end if start <= end else (now >= start or now < end) for start, end in windows)
+
+
+def load_plan(path: Path) -> List[PrefetchPatient]:
+    """
+    План префетча из файла: JSON (`{"patients": [...]}` или список) или CSV с заголовком
+    `last_name,first_name,middle_name,birthday,target` (разделитель `,` или `;`).
+    """
+    text = path.read_text(encoding="utf-8-sig")
+    if path.suffix.lower() == ".csv":
+        dialect = csv.Sniffer().sniff(text.splitlines()[0], delimiters=",;")
+        rows = [{k: (v or None) for k, v in row.items()} for row in csv.DictReader(io.StringIO(text), dialect=dialect)]
+        return PrefetchPlan(patients=rows).patients
+    data = json.loads(text)
+    return PrefetchPlan(patients=data if isinstance(data, list) else data.get("patients", [])).patients
+
+
+def save_plan(path: Path, plan: PrefetchPlan) -> None:
+    """Атомарно записывает план: его подхватывают планировщики всех воркеров."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(plan.model_dump_json(indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def plan_key(patient: PrefetchPatient) -> PlanKey:
+    return patient.last_name.lower(), patient.first_name.lower(), (patient.middle_name or "").lower(), patient.birthday
+
+
+class _EntryState:
+    __slots__ = ("attempts", "last_attempt", "warmed_at", "last_result")
+
+    def __init__(self):
+        self.attempts = 0
+        self.last_attempt: Optional[float] = None
+        self.warmed_at: Optional[float] = None
+        self.last_result: Optional[str] = None
+
+
+class PrefetchScheduler:
+    """
+    Прогрев кэшей к приему: поиск исследований пациентов из плана и загрузка их протоколов.
+
+    Пациент попадает в работу за `lead` секунд до времени приема, только в окнах низкой нагрузки;
+    одновременно прогреваются не больше `concurrency` пациентов, модальности — по очереди.
+    Запросы к EVMIAS идут с низким приоритетом (`ratelimit.background`), а записи кэшей продлеваются
+    до времени приема + `hold`. Покрытие считается по фактическому содержимому кэшей воркера,
+    поэтому вытесненные записи снова попадают в работу (не больше `max_attempts` попыток).
+
+    Кэши — в памяти воркера, поэтому планировщик работает в каждом воркере; план общий (файл).
+    """
+
+    def __init__(self, path: str, windows: List[str], lead: float, hold: float,
+                 concurrency: int, interval: float, max_attempts: int):
+        self.path = Path(path)
+        self.windows = parse_windows(windows)
+        self.lead = lead
+        self.hold = hold
+        self.concurrency = max(1, concurrency)
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self._plan: List[PrefetchPatient] = []
+        self._plan_mtime: Optional[float] = None
+        self._states: Dict[PlanKey, _EntryState] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._pass: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"[Prefetch] Started (plan={self.path}, windows={len(self.windows) or 'any time'})")
+
+    async def stop(self) -> None:
+        for task in (self._task, self._pass):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._pass = None
+
+    def reload(self) -> None:
+        """Перечитывает план, если файл изменился; состояние уже известных пациентов сохраняется."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            self._plan, self._plan_mtime, self._states = [], None, {}
+            return
+        if mtime == self._plan_mtime:
+            return
+        try:
+            plan = load_plan(self.path)
+        except Exception as e:
+            logger.error(f"[Prefetch] Invalid plan file {self.path}: {e}")
+            return
+        self._plan, self._plan_mtime = plan, mtime
+        self._states = {plan_key(p): self._states.get(plan_key(p)) or _EntryState() for p in plan}
+        logger.info(f"[Prefetch] Plan loaded: {len(plan)} patients")
+
+    def trigger(self) -> bool:
+        """Запускает проход немедленно, вне окон низкой нагрузки. False — проход уже идет."""
+        if self._pass is not None and not self._pass.done():
+            return False
+        self._pass = asyncio.create_task(self.run_once(force=True))
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self._pass is None or self._pass.done():
+                    self._pass = asyncio.create_task(self.run_once())
+                await asyncio.shield(self._pass)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Prefetch] Pass failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def _due(self, now: float) -> List[PrefetchPatient]:
+        due = []
+        for patient in self._plan:
+            target = patient.target.timestamp()
+            state = self._states[plan_key(patient)]
+            if not (target - self.lead <= now < target) or state.attempts >= self.max_attempts:
+                continue
+            if self.coverage(patient)["ratio"] < 1.0:
+                due.append(patient)
+        return sorted(due, key=lambda p: p.target.timestamp())
+
+    async def run_once(self, force: bool = False) -> int:
+        """Один проход по плану; возвращает число прогретых пациентов."""
+        self.reload()
+        if not force and not in_windows(datetime.now(), self.windows):
+            return 0
+        due = self._due(time.time())
+        if not due:
+            return 0
+
+        cookies = await cookie_manager.get_valid_cookies()
+        if not cookies:
+            logger.error("[Prefetch] No cookies available, pass skipped")
+            return 0
+
+        logger.info(f"[Prefetch] Warming {len(due)} patients")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(patient: PrefetchPatient) -> None:
+            async with semaphore:
+                await self._warm(patient, cookies)
+
+        await asyncio.gather(*(warm(patient) for patient in due))
+        return len(due)
+
+    async def _warm(self, patient: PrefetchPatient, cookies: dict) -> None:
+        state = self._states[plan_key(patient)]
+        state.attempts += 1
+        state.last_attempt = time.time()
+        # Префетч уступает слоты извлечения запросам врачей и не ограничен очередью
+        async with admission.slot("prefetch", bounded=False):
+            with ratelimit.background(), hold_until(patient.target.timestamp() + self.hold):
+                for pipeline in MODALITIES:
+                    await pipeline.get_patient_tests(
+                        cookies, patient.last_name, patient.first_name, patient.middle_name, patient.birthday
+                    )
+        ratio = self.coverage(patient)["ratio"]
+        state.last_result = "warm" if ratio >= 1.0 else "partial" if ratio > 0 else "failed"
+        if state.last_result == "warm":
+            state.warmed_at = time.time()
+        metrics.PREFETCH_PATIENTS_TOTAL.inc(result=state.last_result)
+
+    @staticmethod
+    def coverage(patient: PrefetchPatient) -> dict:
+        """Что из карточки пациента сейчас лежит в кэшах воркера: поиски по модальностям и протоколы."""
+        searches = documents = cached = 0
+        for pipeline in MODALITIES:
+            data = patient_cache.cache.peek(
+                pipeline.search_key(patient.last_name, patient.first_name, patient.middle_name, patient.birthday)
+            )
+            if data is None:
+                continue
+            searches += 1
+            ids = [test["EvnXml_id"] for test in data.get("data") or [] if test.get("EvnXml_id")]
+            documents += len(ids)
+            cached += sum(1 for test_id in ids if document_cache.cache.peek(test_id) is not None)
+        total = len(MODALITIES) + documents
+        return {
+            "searches": f"{searches}/{len(MODALITIES)}",
+            "documents": f"{cached}/{documents}",
+            "ratio": round((searches + cached) / total, 3),
+        }
+
+    def status(self) -> dict:
+        self.reload()
+        now = time.time()
+        patients = []
+        for patient in self._plan:
+            target = patient.target.timestamp()
+            state = self._states[plan_key(patient)]
+            if now >= target + self.hold:
+                phase = "expired"
+            elif now >= target:
+                phase = "in_clinic"
+            elif now >= target - self.lead:
+                phase = "due"
+            else:
+                phase = "scheduled"
+            patients.append({
+                "last_name": patient.last_name,
+                "first_name": patient.first_name,
+                "middle_name": patient.middle_name,
+                "birthday": patient.birthday,
+                "target": patient.target.isoformat(),
+                "phase": phase,
+                "attempts": state.attempts,
+                "last_result": state.last_result,
+                "warmed_at": datetime.fromtimestamp(state.warmed_at).isoformat() if state.warmed_at else None,
+                "coverage": self.coverage(patient),
+            })
+
+        active = [p for p in patients if p["phase"] in ("due", "in_clinic")]
+        documents = sum(int(p["coverage"]["documents"].split("/")[1]) for p in patients)
+        warnings = []
+        if documents > settings.DOCUMENT_CACHE_SIZE:
+            warnings.append(f"Plan needs {documents} documents, DOCUMENT_CACHE_SIZE is {settings.DOCUMENT_CACHE_SIZE}")
+        if len(self._plan) * len(MODALITIES) > settings.PATIENT_CACHE_SIZE:
+            warnings.append(f"Plan needs {len(self._plan) * len(MODALITIES)} searches, "
+                            f"PATIENT_CACHE_SIZE is {settings.PATIENT_CACHE_SIZE}")
+        return {
+            "pid": os.getpid(),
+            "enabled": self._task is not None,
+            "running": self._pass is not None and not self._pass.done(),
+            "in_window": in_windows(datetime.now(), self.windows),
+            "plan_file": str(self.path),
+            "summary": {
+                "patients": len(patients),
+                "active": len(active),
+                "warm": sum(1 for p in active if p["coverage"]["ratio"] >= 1.0),
+                "coverage": round(sum(p["coverage"]["ratio"] for p in active) / len(active), 3) if active else None,
+            },
+            "warnings": warnings,
+            "patients": patients,
+        }
+
+
+prefetch_scheduler = PrefetchScheduler(
+    settings.PREFETCH_PLAN_FILE, settings.PREFETCH_WINDOWS, settings.PREFETCH_LEAD_HOURS * 3600,
+    settings.PREFETCH_HOLD_HOURS * 3600, settings.PREFETCH_CONCURRENCY, settings.PREFETCH_INTERVAL,
+    settings.PREFETCH_MAX_ATTEMPTS,
+)
@@ -1,8 +1,9 @@
 import re
-import asyncio
 from bs4 import BeautifulSoup
 from datetime import datetime
 import htmlmin
+from app.core import deadline, metrics, tracing
+from app.core.cache import document_bodies, document_cache, patient_cache
 from app.core.config import get_settings
 from app.core.httpx_client import HTTPXClient
 from app.core.logger import logger
@@ -34,46 +35,68 @@ async def parse_html_test_result(html_raw: str):
 
 
 async def get_tests_result(test_id: str, cookies: dict):
+    """Санитизированный протокол из общего кэша; одновременные запросы одного документа объединяются."""
+    return await document_cache.get_or_load(test_id, lambda: fetch_tests_result(test_id, cookies))
+
+
+async def fetch_tests_result(test_id: str, cookies: dict):
     try:
         url = settings.BASE_URL
         params = {"c": "EvnXml", "m": "doLoadData"}
         data = {"EvnXml_id": test_id}
-        response = await HTTPXClient.fetch(url=url, method="POST", params=params, cookies=cookies, data=data)
-        if response["status_code"] != 200 or "json" not in response:
+        with tracing.span("document", modality=LOG_TEST_NAME, evn_xml_id=test_id):
+            # Загрузка протокола идемпотентна — медленный ответ можно продублировать. Берем только поле `html`:
+            # ответ целиком не держится в памяти во время санитизации
+            html = await HTTPXClient.fetch_json(
+                url=url, method="POST", params=params, cookies=cookies, data=data, field="html", hedge=True
+            )
+        if not html:
             return None
 
-        html_code = await parse_html_test_result(response["json"].get("html", ""))
-        return html_code if html_code else None
+        with tracing.span("sanitize", modality=LOG_TEST_NAME, evn_xml_id=test_id):
+            # Одинаковые исходники санитизируются один раз, одинаковые результаты хранятся одним объектом
+            return await document_bodies.sanitize(html, parse_html_test_result)
 
     except Exception as e:
         logger.error(f"{LOG_TEST_NAME} : Error getting test result {test_id}: {e}")
         return None
 
 
-async def get_patient_tests(cookies, last_name: str, first_name: str, middle_name: str, birthday: str):
-    try:
-        url = settings.BASE_URL
-        params = {"c": "Search", "m": "searchData"}
-        data = {
-            "PersonPeriodicType_id": "1",
-            "SearchFormType": "EvnUslugaPar",
-            "Person_Surname": last_name,
-            "Person_Firname": first_name,
-            "Person_Secname": middle_name,
-            "Person_Birthday": birthday,
-            "LpuSection_uid": "3010101000003274",
-            "SearchType_id": "1",
-            "Part_of_the_study": "false",
-            "PersonCardStateType_id": "1",
-            "limit": "100",
-            "start": "0",
-        }
+def search_key(last_name: str, first_name: str, middle_name: str, birthday: str) -> tuple:
+    """Ключ поиска пациента в `patient_cache`."""
+    return LOG_TEST_NAME, last_name.lower(), first_name.lower(), (middle_name or "").lower(), birthday
+
+
+async def search_patient_tests(cookies, last_name: str, first_name: str, middle_name: str, birthday: str):
+    url = settings.BASE_URL
+    params = {"c": "Search", "m": "searchData"}
+    data = {
+        "PersonPeriodicType_id": "1",
+        "SearchFormType": "EvnUslugaPar",
+        "Person_Surname": last_name,
+        "Person_Firname": first_name,
+        "Person_Secname": middle_name,
+        "Person_Birthday": birthday,
+        "LpuSection_uid": "3010101000003274",
+        "SearchType_id": "1",
+        "Part_of_the_study": "false",
+        "PersonCardStateType_id": "1",
+        "limit": "100",
+        "start": "0",
+    }
+
+    with tracing.span("search", modality=LOG_TEST_NAME):
+        return await HTTPXClient.fetch_json(url=url, method="POST", params=params, cookies=cookies, data=data)
 
-        response = await HTTPXClient.fetch(url=url, method="POST", params=params, cookies=cookies, data=data)
-        if response["status_code"] != 200 or "json" not in response:
-            return None
 
-        data = response["json"]
+@metrics.PIPELINE_SECONDS.time(modality=LOG_TEST_NAME, stage="get_patient_tests")
+async def get_patient_tests(cookies, last_name: str, first_name: str, middle_name: str, birthday: str):
+    try:
+        # Результат поиска кэшируется ненадолго; одновременные поиски одного пациента объединяются
+        data = await patient_cache.get_or_load(
+            search_key(last_name, first_name, middle_name, birthday),
+            lambda: search_patient_tests(cookies, last_name, first_name, middle_name, birthday),
+        )
         if not data or "data" not in data or not data["data"]:
             return None
 
@@ -84,6 +107,7 @@ async def get_patient_tests(cookies, last_name: str, first_name: str, middle_nam
         return None
 
 
+@metrics.PIPELINE_SECONDS.time(modality=LOG_TEST_NAME, stage="sanitize_data")
 async def sanitize_data(data: dict, cookies: dict) -> dict | None:
     tests = [test for test in data.get("data", []) if test.get("EvnXml_id")]
 
@@ -99,8 +123,13 @@ async def sanitize_data(data: dict, cookies: dict) -> dict | None:
     age = person_data.get("Person_Age", "")
 
     tasks = [get_tests_result(test.get("EvnXml_id"), cookies) for test in tests]
-    results = await asyncio.gather(*tasks)
-    logger.info(f"{LOG_TEST_NAME} : {len(tasks)} results received.")
+    metrics.PIPELINE_DOCUMENTS.observe(len(tasks), modality=LOG_TEST_NAME)
+    # Документы, не загруженные к дедлайну запроса, отменяются; результат помечается неполным
+    results, incomplete = await deadline.gather_within_deadline(*tasks, stage=LOG_TEST_NAME)
+    if incomplete:
+        logger.warning(f"{LOG_TEST_NAME} : Time budget exhausted, {results.count(None)} of {len(tasks)} results missing.")
+    else:
+        logger.info(f"{LOG_TEST_NAME} : {len(tasks)} results received.")
 
     sanitized_tests = {}
     tests_dates = []
@@ -147,4 +176,5 @@ async def sanitize_data(data: dict, cookies: dict) -> dict | None:
         "tests_dates": tests_dates,
         "tests_dates_latest": max(tests_dates, default=None),
         "tests_with_results": sanitized_tests,
+        "incomplete": incomplete,
     }
@@ -0,0 +1,415 @@
+# app/services/watchlist/manager.py
+
+import asyncio
+import fcntl
+import json
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlparse
+
+import httpx
+
+from app.core import metrics, ratelimit
+from app.core.cache import patient_cache
+from app.core.config import get_settings
+from app.core.logger import logger
+from app.models.watchlist import WatchRequest
+from app.services.analytes.manager import analyte_index, patient_key
+from app.services.cookies.manager import cookie_manager
+from app.services.functional_tests import pipeline as functional_tests_pipeline
+from app.services.medtest import pipeline as medtest_pipeline
+from app.services.ultrasound_scan import pipeline as ultrasound_scan_pipeline
+from app.services.x_ray import pipeline as x_ray_pipeline
+
+settings = get_settings()
+
+# Модальности под теми же именами, что и в ответе /api/complex/person
+PIPELINES = {
+    "medtests": medtest_pipeline,
+    "ultrasound_scan": ultrasound_scan_pipeline,
+    "functional_tests": functional_tests_pipeline,
+    "x_ray": x_ray_pipeline,
+}
+
+WEBHOOK_TIMEOUT = 5.0
+
+T = TypeVar("T")
+
+
+class WatchStore:
+    """
+    Список наблюдений в JSON-файле, общем для всех воркеров. Изменения — чтение, правка и
+    атомарная запись под `fcntl.flock`, поэтому API любого воркера и опрашивающий воркер не теряют правки друг друга.
+    Методы блокирующие: из event loop они вызываются через `asyncio.to_thread`.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8")).get("watches", {})
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, watches: Dict[str, dict]) -> None:
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"watches": watches}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def all(self) -> Dict[str, dict]:
+        with self._locked():
+            return self._read()
+
+    @contextmanager
+    def edit(self) -> Iterator[Dict[str, dict]]:
+        """Правка списка под блокировкой; изменения словаря записываются при выходе из блока."""
+        with self._locked():
+            watches = self._read()
+            yield watches
+            self._write(watches)
+
+    def update(self, change: Callable[[Dict[str, dict]], T]) -> T:
+        """Применяет `change` к списку под блокировкой и записывает результат; возвращает то, что вернул `change`."""
+        with self.edit() as watches:
+            return change(watches)
+
+
+class EventLog:
+    """
+    События о новых документах в JSONL-файле. Id события — смещение конца его строки в файле:
+    подписчик SSE любого воркера продолжает чтение с `Last-Event-ID` без пропусков.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+
+    def append(self, event: dict) -> int:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("ab") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            if f.tell() > self.max_bytes:
+                # Старые события больше не нужны: подписчики со смещением за концом файла начнут сначала
+                f.truncate(0)
+                f.seek(0)
+            f.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            return f.tell()
+
+    def size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def read(self, offset: int) -> Tuple[List[Tuple[int, dict]], int]:
+        """События после смещения `offset` и новое смещение."""
+        try:
+            with self.path.open("rb") as f:
+                f.seek(0, os.SEEK_END)
+                if offset > f.tell():
+                    offset = 0
+                f.seek(offset)
+                events = []
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # строка еще дописывается
+                    offset += len(line)
+                    events.append((offset, json.loads(line)))
+                return events, offset
+        except FileNotFoundError:
+            return [], 0
+
+
+def _test_date(test: dict) -> Optional[str]:
+    try:
+        return datetime.strptime(test.get("EvnUslugaPar_setDate"), "%d.%m.%Y").strftime("%Y-%m-%d")
+    except (ValueError, TypeError):
+        return None
+
+
+class WatchlistManager:
+    """
+    Наблюдение за появлением новых результатов пациентов.
+
+    Проверка дешевая: по каждой модальности только поиск (метаданные), новые документы определяются
+    по `EvnXml_id`, которых еще не было. Загружаются и санитизируются только новые документы, поэтому
+    стоимость опроса зависит от числа изменений, а не от длины истории. Интервал проверки пациента
+    сбрасывается до минимального при изменениях и растет при их отсутствии.
+
+    Опрашивает один воркер хоста — владелец `fcntl.flock` на `<WATCHLIST_FILE>.leader`; при его
+    остановке опрос подхватывает другой. Запросы опроса к EVMIAS — с низким приоритетом.
+    """
+
+    def __init__(self, store: WatchStore, events: EventLog):
+        self.store = store
+        self.events = events
+        self._leader_fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._webhook_client: Optional[httpx.AsyncClient] = None
+
+    # --- API ---
+
+    async def add(self, request: WatchRequest) -> dict:
+        webhook = request.webhook
+        if webhook and urlparse(webhook).hostname not in settings.WATCHLIST_WEBHOOK_HOSTS:
+            raise ValueError(f"Webhook host must be one of {settings.WATCHLIST_WEBHOOK_HOSTS}")
+        now = time.time()
+        until = request.until.timestamp() if request.until else now + settings.WATCHLIST_DEFAULT_HOURS * 3600
+        watch = {
+            "id": uuid.uuid4().hex,
+            "last_name": request.last_name,
+            "first_name": request.first_name,
+            "middle_name": request.middle_name,
+            "birthday": request.birthday,
+            "modalities": list(dict.fromkeys(request.modalities)),
+            "webhook": webhook,
+            "until": until,
+            "created": now,
+            "interval": settings.WATCHLIST_MIN_INTERVAL,
+            "next_check": now,
+            "last_check": None,
+            "last_change": None,
+            "failures": 0,
+            # None — модальность еще не проверялась: первая проверка запоминает документы без событий
+            "known": {modality: None for modality in request.modalities},
+        }
+        def insert(watches: Dict[str, dict]) -> None:
+            watches[watch["id"]] = watch
+
+        await asyncio.to_thread(self.store.update, insert)
+        return self.describe(watch)
+
+    async def remove(self, watch_id: str) -> bool:
+        removed = await asyncio.to_thread(self.store.update, lambda watches: watches.pop(watch_id, None))
+        return removed is not None
+
+    async def get(self, watch_id: str) -> Optional[dict]:
+        return (await asyncio.to_thread(self.store.all)).get(watch_id)
+
+    async def watches(self) -> List[dict]:
+        return [self.describe(watch) for watch in (await asyncio.to_thread(self.store.all)).values()]
+
+    @staticmethod
+    def describe(watch: dict) -> dict:
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+        return {
+            "id": watch["id"],
+            "last_name": watch["last_name"],
+            "first_name": watch["first_name"],
+            "middle_name": watch["middle_name"],
+            "birthday": watch["birthday"],
+            "modalities": watch["modalities"],
+            "webhook": watch["webhook"],
+            "until": iso(watch["until"]),
+            "interval": round(watch["interval"]),
+            "next_check": iso(watch["next_check"]),
+            "last_check": iso(watch["last_check"]),
+            "last_change": iso(watch["last_change"]),
+            "known_documents": {m: len(ids) if ids is not None else None for m, ids in watch["known"].items()},
+        }
+
+    # --- Опрос ---
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._leader_fd is not None:
+            os.close(self._leader_fd)  # снимает flock — опрос подхватит другой воркер
+            self._leader_fd = None
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+            self._webhook_client = None
+
+    def is_leader(self) -> bool:
+        if self._leader_fd is not None:
+            return True
+        path = f"{self.store.path}.leader"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._leader_fd = fd
+        logger.info(f"[Watchlist] Worker {os.getpid()} is polling the watchlist")
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.is_leader():
+                    await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Watchlist] Poll failed: {e}", exc_info=True)
+            await asyncio.sleep(settings.WATCHLIST_TICK)
+
+    async def poll_once(self) -> int:
+        """Проверяет наблюдения, срок проверки которых наступил; возвращает их число."""
+        now = time.time()
+
+        def expire(watches: Dict[str, dict]) -> List[dict]:
+            for watch_id in [w["id"] for w in watches.values() if w["until"] <= now]:
+                del watches[watch_id]
+            return sorted((w for w in watches.values() if w["next_check"] <= now), key=lambda w: w["next_check"])
+
+        due = await asyncio.to_thread(self.store.update, expire)
+        if not due:
+            return 0
+
+        cookies = await cookie_manager.get_valid_cookies()
+        if not cookies:
+            logger.error("[Watchlist] No cookies available, poll skipped")
+            return 0
+
+        semaphore = asyncio.Semaphore(max(1, settings.WATCHLIST_CONCURRENCY))
+
+        async def check(watch: dict) -> None:
+            async with semaphore:
+                await self._check(watch, cookies)
+
+        with ratelimit.background():
+            await asyncio.gather(*(check(watch) for watch in due))
+        return len(due)
+
+    async def _check(self, watch: dict, cookies: dict) -> None:
+        known: Dict[str, Optional[List[str]]] = {}
+        new_documents: Dict[str, List[dict]] = {}
+        failed = False
+        for modality in watch["modalities"]:
+            try:
+                result = await self._check_modality(watch, modality, cookies)
+            except Exception as e:
+                logger.error(f"[Watchlist] {watch['id']} {modality}: check failed: {e}")
+                result = None
+            if result is None:
+                failed = True
+                continue
+            known[modality], documents = result
+            if documents:
+                new_documents[modality] = documents
+
+        now = time.time()
+        changed = bool(new_documents)
+        metrics.WATCHLIST_CHECKS_TOTAL.inc(result="failed" if failed else "changed" if changed else "unchanged")
+
+        def reschedule(watches: Dict[str, dict]) -> bool:
+            current = watches.get(watch["id"])
+            if current is None:
+                return False  # наблюдение удалено во время проверки
+            for modality, ids in known.items():
+                current["known"][modality] = ids
+            if changed:
+                current["interval"] = settings.WATCHLIST_MIN_INTERVAL
+                current["last_change"] = now
+            else:
+                current["interval"] = min(settings.WATCHLIST_MAX_INTERVAL, current["interval"] * settings.WATCHLIST_BACKOFF)
+            current["failures"] = current["failures"] + 1 if failed else 0
+            current["last_check"] = now
+            # Разброс, чтобы наблюдения, добавленные вместе, не проверялись одной пачкой
+            current["next_check"] = now + current["interval"] * random.uniform(0.9, 1.1)
+            return True
+
+        if not await asyncio.to_thread(self.store.update, reschedule):
+            return
+
+        for modality, documents in new_documents.items():
+            await self._publish(watch, modality, documents)
+
+    async def _check_modality(self, watch: dict, modality: str, cookies: dict) -> Optional[Tuple[List[str], List[dict]]]:
+        """Известные id после проверки и новые загруженные документы; None — поиск не удался."""
+        pipeline = PIPELINES[modality]
+        patient = (watch["last_name"], watch["first_name"], watch["middle_name"], watch["birthday"])
+        data = await pipeline.search_patient_tests(cookies, *patient)
+        if data is None:
+            return None
+        # Свежий результат поиска пригодится и интерактивным запросам
+        patient_cache.put(pipeline.search_key(*patient), data)
+
+        tests = [test for test in data.get("data") or [] if test.get("EvnXml_id")]
+        previous = watch["known"].get(modality)
+        if previous is None:
+            return [str(test["EvnXml_id"]) for test in tests], []
+
+        seen = set(previous)
+        new_tests = [test for test in tests if str(test["EvnXml_id"]) not in seen]
+        if not new_tests:
+            return previous, []
+
+        bodies = await asyncio.gather(
+            *(pipeline.get_tests_result(test["EvnXml_id"], cookies) for test in new_tests)
+        )
+        documents = []
+        known = list(previous)
+        for test, body in zip(new_tests, bodies):
+            if body is None:
+                continue  # не загрузился — попробуем при следующей проверке
+            known.append(str(test["EvnXml_id"]))
+            documents.append({
+                "evn_xml_id": str(test["EvnXml_id"]),
+                "test_date": _test_date(test),
+                "service": test.get("MedService_Name", "No data"),
+                "test_code": test.get("Usluga_Code", "No data"),
+                "test_name": test.get("Usluga_Name", "No data"),
+                "test_result_ref": body.digest,
+            })
+        if modality == "medtests":
+            analyte_index.observe(patient_key(*patient), zip(new_tests, bodies))
+        metrics.WATCHLIST_DOCUMENTS_TOTAL.inc(len(documents), modality=modality)
+        return known, documents
+
+    async def _publish(self, watch: dict, modality: str, documents: List[dict]) -> None:
+        # Тела протоколов в событие не попадают: клиент забирает их через API по evn_xml_id
+        event = {"watch_id": watch["id"], "modality": modality, "documents": documents, "at": time.time()}
+        event_id = await asyncio.to_thread(self.events.append, event)
+        logger.info(f"[Watchlist] {watch['id']}: {len(documents)} new {modality} documents")
+        if watch.get("webhook"):
+            await self._deliver(watch["webhook"], {"id": event_id, **event})
+
+    async def _deliver(self, url: str, event: Dict[str, Any]) -> None:
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT)
+        try:
+            response = await self._webhook_client.post(url, json=event)
+            response.raise_for_status()
+            metrics.WATCHLIST_WEBHOOKS_TOTAL.inc(result="delivered")
+        except httpx.HTTPError as e:
+            metrics.WATCHLIST_WEBHOOKS_TOTAL.inc(result="failed")
+            logger.warning(f"[Watchlist] Webhook {url} failed: {e}")
+
+
+watchlist_manager = WatchlistManager(
+    WatchStore(settings.WATCHLIST_FILE),
+    EventLog(settings.WATCHLIST_EVENTS_FILE, settings.WATCHLIST_EVENTS_MAX_BYTES),
+)
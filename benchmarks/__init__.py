@@ -0,0 +1,6 @@
+"""
+Бенчмарки сервиса.
+
+Микробенчмарки санитайзера и нагрузочные тесты `/api/complex/person` и SSE-потока дашборда
+против локального заменителя EVMIAS. Запуск: `python -m benchmarks` (см. `python -m benchmarks --help`).
+"""
@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import sys
+
+from benchmarks.micro import run_micro
+from benchmarks.report import compare, load_baseline, print_results, save_baseline
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки санитайзера и эндпоинта /api/complex/person")
+    parser.add_argument("--macro", action="store_true", help="также запустить нагрузочный бенчмарк")
+    parser.add_argument("--rounds", type=int, default=5, help="проходов по корпусу в микробенчмарках")
+    parser.add_argument("--recording", help="каталог записи обменов EVMIAS (RECORD_DIR) вместо синтетического корпуса")
+    parser.add_argument("--documents", type=int, default=20, help="документов в бенчмарке sanitize_data")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность нагрузки, секунды")
+    parser.add_argument("--concurrency", type=int, default=4, help="параллельных клиентов /api/complex/person")
+    parser.add_argument("--sse-clients", type=int, default=5, help="подписчиков SSE дашборда")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="медианная задержка заменителя EVMIAS")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое ухудшение относительно базовой линии")
+    parser.add_argument("--update-baseline", action="store_true", help="записать результаты в baseline.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_micro(rounds=args.rounds, documents=args.documents, recording=args.recording))
+    if args.macro:
+        from benchmarks.macro import run_macro
+        results.update(run_macro(
+            duration=args.duration, concurrency=args.concurrency,
+            sse_clients=args.sse_clients, latency_ms=args.latency_ms,
+        ))
+
+    baseline = load_baseline()
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        save_baseline(results)
+        print("Baseline updated.")
+        return 0
+
+    failures = compare(results, baseline, args.threshold)
+    if failures:
+        print(f"\nRegressions over {args.threshold:.0%}:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+"""Переменные окружения, без которых не загружаются настройки приложения. Импортировать до `app.*`."""
+
+import os
+import tempfile
+
+os.environ.setdefault("BASE_URL", "http://evmias.local/")
+os.environ.setdefault("EVMIAS_LOGIN", "bench")
+os.environ.setdefault("EVMIAS_PASSWORD", "bench")
+os.environ.setdefault("EVMIAS_SECRET", "bench")
+os.environ.setdefault("EVMIAS_PERMUTATION", "bench")
+os.environ.setdefault("COOKIES_FILE", os.path.join(tempfile.gettempdir(), "medextractor-bench-cookies.json"))
+os.environ.setdefault("METRICS_DIR", "")
+os.environ.setdefault("LOOP_MONITOR_ENABLED", "false")
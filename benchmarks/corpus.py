@@ -0,0 +1,65 @@
+"""Корпус HTML протоколов для микробенчмарков: мелкие, крупные и табличные документы."""
+
+import json
+import re
+from typing import Dict, List
+
+from app.core.recorder import load_body, load_exchanges
+from app.fake_evmias.data import document_html, make_evn_xml_id
+
+# Модальности заменителя: 1 — функциональные тесты, 2 — анализы, 3 — УЗИ, 4 — рентген
+_BLOCK_RE = re.compile(r'<div class="template-parameter".*?</div></div>', re.S)
+
+
+def _documents(modality: int, count: int, patient: int = 1234567) -> List[str]:
+    return [document_html(make_evn_xml_id(patient, modality, i)) for i in range(count)]
+
+
+def build_corpus() -> Dict[str, List[str]]:
+    """
+    - `small` — короткие протоколы рентгена и ЭКГ;
+    - `large` — крупнейшие протоколы УЗИ, размноженные до ~100 КБ;
+    - `table` — лабораторные протоколы с большой таблицей аналитов.
+    """
+    small = sorted(_documents(4, 50) + _documents(1, 50), key=len)[:20]
+
+    ultrasound = sorted(_documents(3, 100), key=len, reverse=True)[:5]
+    large = []
+    for html in ultrasound:
+        blocks = "".join(_BLOCK_RE.findall(html))
+        repeat = max(1, 100_000 // max(1, len(blocks)))
+        large.append(html.replace("</div></div>", "</div></div>" + blocks * repeat, 1))
+
+    table = []
+    for html in _documents(2, 10):
+        rows = re.search(r"(<tr class=\"row\".*</tr>)</table>", html, re.S).group(1)
+        table.append(html.replace("</table>", rows * 10 + "</table>", 1))
+
+    return {"small": small, "large": large, "table": table}
+
+
+# Граница между мелкими и крупными записанными протоколами, байт
+LARGE_DOCUMENT_BYTES = 20_000
+
+
+def load_recorded_corpus(directory: str) -> Dict[str, List[str]]:
+    """Корпус из записи обменов (`RECORD_DIR`): протоколы `EvnXml.doLoadData`, разложенные по тем же классам."""
+    corpus: Dict[str, List[str]] = {"small": [], "large": [], "table": []}
+    seen = set()
+    for entry in load_exchanges(directory):
+        if "m=doLoadData" not in entry["key"] or entry["status"] != 200 or entry["body"] in seen:
+            continue
+        seen.add(entry["body"])
+        try:
+            html = json.loads(load_body(directory, entry["body"])).get("html")
+        except ValueError:
+            continue
+        if not html:
+            continue
+        if "<table" in html:
+            corpus["table"].append(html)
+        elif len(html.encode("utf-8")) >= LARGE_DOCUMENT_BYTES:
+            corpus["large"].append(html)
+        else:
+            corpus["small"].append(html)
+    return {name: documents for name, documents in corpus.items() if documents}
@@ -0,0 +1,199 @@
+"""
+Нагрузочный бенчмарк сервиса против локального заменителя EVMIAS.
+
+Поднимает два процесса uvicorn — заменитель и сервис (один воркер, как один воркер gunicorn),
+нагружает `POST /api/complex/person` с `concurrency` параллельными клиентами и одновременно
+держит `sse_clients` подписок на `GET /api/dashboard/stream`.
+
+Метрики: пропускная способность, p50/p95/p99 латентности, доля ошибок, задержка первого
+события SSE и максимальный интервал между событиями (растет, когда event loop блокируется),
+пиковый RSS процесса сервиса (`VmHWM` из `/proc`, только Linux).
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from benchmarks.report import percentile, result
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SURNAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Волков", "Соколов"]
+FIRST_NAMES = ["Алексей", "Борис", "Виктор", "Григорий", "Дмитрий"]
+
+SSE_INTERVAL = 2.0  # Период цикла `/api/dashboard/stream`
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before {url} became ready")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} is not ready after {timeout}s")
+
+
+@contextmanager
+def _uvicorn(target: str, port: int, env: Dict[str, str], cwd: Path, ready_path: str,
+             factory: bool = False) -> Iterator[subprocess.Popen]:
+    command = [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--no-access-log"]
+    if factory:
+        command.append("--factory")
+    process = subprocess.Popen(
+        command,
+        cwd=cwd, env={**os.environ, "PYTHONPATH": str(ROOT), **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(f"http://127.0.0.1:{port}{ready_path}", process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Пиковый резидентный объем памяти процесса (`VmHWM`), МБ."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _patient(i: int) -> dict:
+    return {
+        "last_name": SURNAMES[i % len(SURNAMES)],
+        "first_name": FIRST_NAMES[(i // len(SURNAMES)) % len(FIRST_NAMES)],
+        "middle_name": "Бенчмаркович",
+        "birthday": f"{1 + i % 28:02d}.{1 + i % 12:02d}.{1950 + i % 50}",
+    }
+
+
+async def _complex_worker(client: httpx.AsyncClient, offset: int, patients: int, stop_at: float,
+                          latencies: List[float], errors: List[int]) -> None:
+    i = offset
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            response = await client.post("/api/complex/person", json=_patient(i % patients))
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(1)
+        i += 1
+
+
+async def _sse_client(client: httpx.AsyncClient, stop_at: float, first_event: List[float], gaps: List[float]) -> None:
+    start = time.perf_counter()
+    last = None
+    try:
+        async with client.stream("GET", "/api/dashboard/stream", timeout=None) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("event: stats"):
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    first_event.append(now - start)
+                else:
+                    gaps.append(now - last)
+                last = now
+                if time.monotonic() >= stop_at:
+                    break
+    except httpx.HTTPError:
+        pass
+
+
+async def _load(base_url: str, duration: float, concurrency: int, sse_clients: int, patients: int) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=concurrency + sse_clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        # Прогрев: получение кук сервисом и первый импорт пайплайнов
+        await client.post("/api/complex/person", json=_patient(0))
+
+        latencies: List[float] = []
+        errors: List[int] = []
+        first_event: List[float] = []
+        gaps: List[float] = []
+        started = time.monotonic()
+        stop_at = started + duration
+        await asyncio.gather(
+            *(_complex_worker(client, n, patients, stop_at, latencies, errors) for n in range(concurrency)),
+            *(_sse_client(client, stop_at, first_event, gaps) for _ in range(sse_clients)),
+        )
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    results = {
+        "complex.throughput_rps": result(len(latencies) / elapsed, "req/s", better="higher"),
+        "complex.p50_ms": result(percentile(latencies, 0.50) * 1000, "ms"),
+        "complex.p95_ms": result(percentile(latencies, 0.95) * 1000, "ms"),
+        "complex.p99_ms": result(percentile(latencies, 0.99) * 1000, "ms"),
+        "complex.error_rate": result(len(errors) / len(latencies) if latencies else 1.0, "ratio"),
+    }
+    if sse_clients:
+        first_event.sort()
+        results["sse.first_event_p95_ms"] = result(percentile(first_event, 0.95) * 1000, "ms")
+        # Сверх штатного периода цикла: сколько событий задержал занятый event loop
+        results["sse.max_gap_excess_ms"] = result(max(0.0, max(gaps, default=SSE_INTERVAL) - SSE_INTERVAL) * 1000, "ms")
+    return results
+
+
+def run_macro(duration: float = 20.0, concurrency: int = 4, sse_clients: int = 5, patients: int = 50,
+              latency_ms: float = 50.0) -> Dict[str, dict]:
+    fake_port, app_port = _free_port(), _free_port()
+    with tempfile.TemporaryDirectory(prefix="medextractor-bench-") as workdir:
+        workdir = Path(workdir)
+        # Сервис читает `dashboard/` и пишет `logs/` относительно рабочего каталога
+        (workdir / "dashboard").symlink_to(ROOT / "dashboard")
+        fake_env = {"FAKE_EVMIAS_LATENCY_MS": str(latency_ms)}
+        app_env = {
+            "BASE_URL": f"http://127.0.0.1:{fake_port}/",
+            "EVMIAS_LOGIN": "bench", "EVMIAS_PASSWORD": "bench",
+            "EVMIAS_SECRET": "bench", "EVMIAS_PERMUTATION": "bench",
+            "COOKIES_FILE": str(workdir / "cookies.json"),
+            "METRICS_DIR": str(workdir / "metrics"),
+        }
+        with _uvicorn("app.fake_evmias.server:create_app", fake_port, fake_env, workdir, "/_fake/stats",
+                     factory=True), \
+                _uvicorn("app.main:app", app_port, app_env, workdir, "/api/health/ping") as app_process:
+            results = asyncio.run(
+                _load(f"http://127.0.0.1:{app_port}", duration, concurrency, sse_clients, patients)
+            )
+            rss = peak_rss_mb(app_process.pid)
+            if rss is not None:
+                results["app.peak_rss_mb"] = result(rss, "MB")
+    return results
+
+
+if __name__ == "__main__":
+    from benchmarks.report import print_results
+    print_results(run_macro())
@@ -0,0 +1,138 @@
+"""
+Микробенчмарки санитайзера.
+
+- `parse_html_test_result` на корпусе `small` / `large` / `table` (чистое CPU-время, без сети);
+- `sanitize_data` целиком: загрузка документов через заменитель EVMIAS в процессе
+  (без задержек) и их санитизация.
+
+С `recording` (каталог `RECORD_DIR`) корпус и ответы EVMIAS берутся из записи реального трафика,
+метрики получают префикс `recorded.`.
+"""
+
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from benchmarks import _env  # noqa: F401
+from benchmarks.corpus import build_corpus, load_recorded_corpus
+from benchmarks.report import percentile, result
+
+from app.core.cache import document_bodies, document_cache
+from app.core.httpx_client import HTTPXClient
+from app.core.logger import logger
+from app.core.recorder import ReplayTransport, load_body, load_exchanges
+from app.fake_evmias.config import FakeEvmiasSettings
+from app.fake_evmias.data import search_rows
+from app.fake_evmias.server import fake_evmias_transport
+from app.services.cookies import cookies as cookies_service
+from app.services.medtest import pipeline as medtest_pipeline
+
+# Пациент для `sanitize_data`; число документов задается настройками заменителя
+PATIENT = ("Бенчмарков", "Тест", "Тестович", "01.01.1980")
+MEDTEST_UID = "3010101000003273"
+
+
+async def bench_parse(corpus: Dict[str, List[str]], rounds: int) -> Dict[str, dict]:
+    results = {}
+    for name, documents in corpus.items():
+        # Прогрев: lxml и BeautifulSoup кэшируют часть структур при первом вызове
+        await medtest_pipeline.parse_html_test_result(documents[0])
+
+        timings = []
+        for _ in range(rounds):
+            for html in documents:
+                start = time.perf_counter()
+                await medtest_pipeline.parse_html_test_result(html)
+                timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        size = statistics.mean(len(html.encode("utf-8")) for html in documents)
+        results[f"parse.{name}.p50_ms"] = result(percentile(timings, 0.50) * 1000, "ms")
+        results[f"parse.{name}.p95_ms"] = result(percentile(timings, 0.95) * 1000, "ms")
+        results[f"parse.{name}.mb_per_s"] = result(
+            size * len(timings) / sum(timings) / 1_000_000, "MB/s", better="higher"
+        )
+    return results
+
+
+async def bench_sanitize(documents: int, rounds: int) -> Dict[str, dict]:
+    settings = FakeEvmiasSettings(
+        LATENCY_DISTRIBUTION="fixed", LATENCY_MS=0, DOCUMENTS_MIN=documents, DOCUMENTS_MAX=documents,
+    )
+    await HTTPXClient.initialize(transport=fake_evmias_transport(settings))
+    try:
+        cookies = await cookies_service.get_new()
+        data = {"data": search_rows(MEDTEST_UID, *PATIENT, documents, documents, settings.SEED)}
+
+        await medtest_pipeline.sanitize_data(data, cookies)
+        timings = []
+        for _ in range(rounds):
+            # Каждый проход — холодный: документы загружаются и санитизируются заново (без кэша и памяти санитизации)
+            document_cache.cache.clear()
+            document_bodies.clear()
+            start = time.perf_counter()
+            sanitized = await medtest_pipeline.sanitize_data(data, cookies)
+            timings.append(time.perf_counter() - start)
+            if not sanitized:
+                raise RuntimeError("sanitize_data returned no results (is the stand-in authorized?)")
+    finally:
+        await HTTPXClient.shutdown()
+
+    timings.sort()
+    return {
+        "sanitize_data.p50_ms": result(percentile(timings, 0.50) * 1000, "ms"),
+        "sanitize_data.p95_ms": result(percentile(timings, 0.95) * 1000, "ms"),
+        "sanitize_data.docs_per_s": result(documents * len(timings) / sum(timings), "docs/s", better="higher"),
+    }
+
+
+async def bench_sanitize_recorded(recording: str, rounds: int) -> Dict[str, dict]:
+    """`sanitize_data` на записанном ответе поиска; документы отдает `ReplayTransport` без задержек."""
+    search = next(
+        (e for e in load_exchanges(recording) if "m=searchData" in e["key"] and e["status"] == 200 and e["size"]),
+        None,
+    )
+    if search is None:
+        return {}
+    data = json.loads(load_body(recording, search["body"]))
+    documents = sum(1 for row in data.get("data", []) if row.get("EvnXml_id"))
+
+    await HTTPXClient.initialize(transport=ReplayTransport(recording, timing_scale=0))
+    try:
+        await medtest_pipeline.sanitize_data(data, {})
+        timings = []
+        for _ in range(rounds):
+            document_cache.cache.clear()
+            document_bodies.clear()
+            start = time.perf_counter()
+            await medtest_pipeline.sanitize_data(data, {})
+            timings.append(time.perf_counter() - start)
+    finally:
+        await HTTPXClient.shutdown()
+
+    timings.sort()
+    return {
+        "sanitize_data.p50_ms": result(percentile(timings, 0.50) * 1000, "ms"),
+        "sanitize_data.docs_per_s": result(documents * len(timings) / sum(timings), "docs/s", better="higher"),
+    }
+
+
+async def run_micro(rounds: int = 5, documents: int = 20, recording: Optional[str] = None) -> Dict[str, dict]:
+    logger.disable("app")
+    try:
+        if recording:
+            results = await bench_parse(load_recorded_corpus(recording), rounds)
+            results.update(await bench_sanitize_recorded(recording, rounds))
+            return {f"recorded.{name}": value for name, value in results.items()}
+        results = await bench_parse(build_corpus(), rounds)
+        results.update(await bench_sanitize(documents, rounds))
+    finally:
+        logger.enable("app")
+    return results
+
+
+if __name__ == "__main__":
+    from benchmarks.report import print_results
+    print_results(asyncio.run(run_micro()))
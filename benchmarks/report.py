@@ -0,0 +1,78 @@
+"""Результаты бенчмарков, базовая линия и проверка регрессий."""
+
+import json
+import platform
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASELINE_FILE = Path(__file__).with_name("baseline.json")
+
+
+def result(value: float, unit: str, better: str = "lower") -> dict:
+    """Одна метрика бенчмарка; `better` — направление улучшения (`lower` | `higher`)."""
+    return {"value": round(value, 4), "unit": unit, "better": better}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_baseline(path: Path = BASELINE_FILE) -> Dict[str, dict]:
+    if not path.exists():
+        return {}
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(results: Dict[str, dict], path: Path = BASELINE_FILE) -> None:
+    """Сохраняет базовую линию; уже известные метрики, не вошедшие в этот прогон, сохраняются."""
+    merged = {**load_baseline(path), **results}
+    payload = {
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": f"{platform.machine()} {platform.python_implementation()} {platform.python_version()}",
+        "results": dict(sorted(merged.items())),
+    }
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def regression(current: dict, baseline: dict) -> Optional[float]:
+    """Относительное ухудшение метрики (0.25 = на 25% хуже) или None, если не хуже."""
+    base, value = baseline["value"], current["value"]
+    if base == 0:
+        # Например, доля ошибок: любое ненулевое значение — регрессия
+        worse = value > 0 if current["better"] == "lower" else value < 0
+        return float("inf") if worse else None
+    change = (value - base) / base if current["better"] == "lower" else (base - value) / base
+    return change if change > 0 else None
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Список метрик, ухудшившихся больше чем на `threshold` относительно базовой линии."""
+    failures = []
+    for name, current in sorted(results.items()):
+        if name not in baseline:
+            continue
+        change = regression(current, baseline[name])
+        if change is not None and change > threshold:
+            failures.append(
+                f"{name}: {current['value']} {current['unit']} vs baseline "
+                f"{baseline[name]['value']} {current['unit']} ({change:+.0%})"
+            )
+    return failures
+
+
+def print_results(results: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> None:
+    baseline = baseline or {}
+    width = max((len(name) for name in results), default=0)
+    for name, current in sorted(results.items()):
+        line = f"{name:<{width}}  {current['value']:>12.3f} {current['unit']}"
+        if name in baseline and baseline[name]["value"]:
+            delta = (current["value"] - baseline[name]["value"]) / baseline[name]["value"]
+            line += f"  ({delta:+.1%} vs baseline)"
+        print(line)
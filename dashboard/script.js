@@ -83,11 +83,140 @@ document.addEventListener('DOMContentLoaded', () => {
         el.scrollTop = el.scrollHeight; // Прокручиваем вниз
     }
 
+    // --- Часть 3: Живая статистика и графики ---
+
+    const COMPLEX_ENDPOINT = '/api/complex/person';
+    const charts = {};
+
+    function formatSeconds(value) {
+        return value === null || value === undefined ? '—' : value.toFixed(2);
+    }
+
+    function formatTime(ts) {
+        return new Date(ts * 1000).toLocaleTimeString();
+    }
+
+    function getChart(id, type, options) {
+        if (charts[id]) return charts[id];
+        const canvas = document.getElementById(id);
+        if (!canvas || typeof Chart === 'undefined') return null;
+        charts[id] = new Chart(canvas, {
+            type: type,
+            data: {labels: [], datasets: []},
+            options: Object.assign({animation: false, responsive: true}, options || {}),
+        });
+        return charts[id];
+    }
+
+    function setText(id, text) {
+        const el = document.getElementById(id);
+        if (el) el.textContent = text;
+    }
+
+    // Доля попаданий кеша за окно: hit / (hit + miss); без обращений — прочерк
+    function formatHitRatio(cacheStats, name) {
+        const hits = (cacheStats[`${name}.hit`] || {}).count || 0;
+        const misses = (cacheStats[`${name}.miss`] || {}).count || 0;
+        return hits + misses ? (hits / (hits + misses) * 100).toFixed(1) + '%' : '—';
+    }
+
+    function updateStats(stats) {
+        if (!stats) return;
+        updateStatusIndicator(serviceStatusEl, stats.status, stats.status);
+
+        const endpoints = stats.endpoint || {};
+        const totalRate = Object.values(endpoints).reduce((sum, e) => sum + e.rate, 0);
+        const complex = endpoints[COMPLEX_ENDPOINT];
+        const refreshes = (stats.cookies || {}).refreshes;
+
+        setText('stat-rate', totalRate.toFixed(2));
+        setText('stat-complex-p95', formatSeconds(complex ? complex.p95 : null));
+        setText('stat-upstream-errors', (stats.upstream_error_rate * 100).toFixed(1) + '%');
+        setText('stat-cookie-refreshes', refreshes ? refreshes.count : 0);
+        setText('stat-cache-documents', formatHitRatio(stats.cache || {}, 'documents'));
+        setText('stat-cache-patients', formatHitRatio(stats.cache || {}, 'patients'));
+        setText('stats-window', `Worker ${stats.pid}, last ${stats.window_seconds / 60} min`);
+
+        // Частота запросов по эндпоинтам
+        const rateChart = getChart('chart-rate', 'line', {scales: {y: {beginAtZero: true}}});
+        if (rateChart) {
+            const times = new Set();
+            Object.values(endpoints).forEach(e => e.series.forEach(p => times.add(p.t)));
+            const labels = Array.from(times).sort();
+            rateChart.data.labels = labels.map(formatTime);
+            rateChart.data.datasets = Object.entries(endpoints).map(([path, e]) => {
+                const byTime = Object.fromEntries(e.series.map(p => [p.t, p.rate]));
+                return {label: path, data: labels.map(t => byTime[t] || 0), tension: 0.3};
+            });
+            rateChart.update();
+        }
+
+        // Перцентили латентности комплексного эндпоинта
+        const latencyChart = getChart('chart-latency', 'line', {scales: {y: {beginAtZero: true}}});
+        if (latencyChart) {
+            const series = complex ? complex.series : [];
+            latencyChart.data.labels = series.map(p => formatTime(p.t));
+            latencyChart.data.datasets = ['p50', 'p95', 'p99'].map(q => ({
+                label: q, data: series.map(p => p[q]), tension: 0.3,
+            }));
+            latencyChart.update();
+        }
+
+        // Перцентили по модальностям за все окно
+        const modalityChart = getChart('chart-modality', 'bar', {scales: {y: {beginAtZero: true}}});
+        if (modalityChart) {
+            const modalities = stats.modality || {};
+            modalityChart.data.labels = Object.keys(modalities);
+            modalityChart.data.datasets = ['p50', 'p95', 'p99'].map(q => ({
+                label: q, data: Object.values(modalities).map(m => m[q]),
+            }));
+            modalityChart.update();
+        }
+    }
+
+    // --- Часть 4: Монитор event loop ---
+
+    const loopSummaryEl = document.getElementById('loop-summary');
+    const loopOffendersEl = document.getElementById('loop-offenders');
+
+    function escapeHtml(text) {
+        return String(text).replace(/[&<>"]/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'}[c]));
+    }
+
+    async function loadLoopReport() {
+        const panel = document.getElementById('content-loop');
+        if (!panel || panel.style.display === 'none') return;
+        try {
+            const response = await fetch('/api/dashboard/loop');
+            const report = await response.json();
+            const lag = report.lag || {};
+            loopSummaryEl.textContent = `Lag p50 ${formatSeconds(lag.p50)}s, p99 ${formatSeconds(lag.p99)}s, ` +
+                `max ${report.max_lag_seconds}s, blocks ${report.blocks_total} (threshold ${report.threshold_seconds}s)`;
+            if (!report.offenders.length) {
+                loopOffendersEl.innerHTML = '<div class="log-message">No blocking calls detected.</div>';
+                return;
+            }
+            let html = '<table class="table is-fullwidth is-narrow"><tr><th>Count</th><th>Total, s</th><th>Max, s</th><th>Task / stack</th></tr>';
+            report.offenders.forEach(o => {
+                html += `<tr><td>${o.count}</td><td>${o.total_seconds}</td><td>${o.max_seconds}</td>
+                    <td><strong>${escapeHtml(o.task || '')}</strong><pre class="loop-stack">${o.stack ? escapeHtml(o.stack.slice(-8).join('\n')) : 'Stack requires admin token'}</pre></td></tr>`;
+            });
+            loopOffendersEl.innerHTML = html + '</table>';
+        } catch (e) {
+            console.error("Loop report load failed:", e);
+        }
+    }
+
+    menuLinks.forEach(link => link.addEventListener('click', loadLoopReport));
+    setInterval(loadLoopReport, 5000);
+
     async function initialLoad() {
         try {
             const response = await fetch('/api/dashboard/status');
             const data = await response.json();
             updateUI(data);
+            const statsResponse = await fetch('/api/dashboard/stats');
+            updateStats(await statsResponse.json());
         } catch (e) {
             console.error("Initial load failed:", e);
             if (serviceStatusEl) updateStatusIndicator(serviceStatusEl, 'OFFLINE', 'offline');
@@ -101,6 +230,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const data = JSON.parse(event.data);
             updateUI(data);
         });
+        eventSource.addEventListener("stats", (event) => {
+            updateStats(JSON.parse(event.data));
+        });
         eventSource.onerror = () => {
             if (serviceStatusEl) updateStatusIndicator(serviceStatusEl, 'OFFLINE', 'offline');
         };